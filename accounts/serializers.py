@@ -6,6 +6,9 @@ from rest_framework import serializers
 # 导入django用户模型获取函数
 from django.contrib.auth import get_user_model
 
+# 稀疏字段集（?fields=）支持
+from common.serializers import SparseFieldsMixin
+
 User = get_user_model()
 
 # 创建用户注册序列化器
@@ -63,7 +66,8 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         return user
     
 # 用户信息序列化器
-class UserSerializer(serializers.ModelSerializer):
+# SparseFieldsMixin：支持传入 fields=[...] 只输出部分字段
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id','username','email','first_name','last_name','date_joined']
@@ -1,3 +1,26 @@
 from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+User = get_user_model()
 
 # Create your tests here.
+
+
+class ProfileViewFieldsTest(TestCase):
+    """用户信息 ?fields= 测试"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_fields_trim_output(self):
+        """测试：只返回指定字段"""
+        response = self.client.get('/api/auth/profile/', {'fields': 'id,username'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user'], {'id': self.user.id, 'username': 'testuser'})
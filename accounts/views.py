@@ -6,6 +6,7 @@ from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user_model
 from django.shortcuts import render
 from .serializers import UserRegisterSerializer, UserSerializer
+from common.serializers import parse_fields
 # Create your views here.
 
 User = get_user_model()
@@ -117,9 +118,12 @@ class  ProfileView(APIView):
         # request.user 已由 JWT 认证自动设置
         user = request.user
 
+        # ?fields=id,username 只返回部分字段
+        fields = parse_fields(request, UserSerializer)
+
         response_data = {
             'message': '获取用户信息成功',
-            'user': UserSerializer(user).data
+            'user': UserSerializer(user, fields=fields).data
         }
 
         return Response(response_data,status = status.HTTP_200_OK)
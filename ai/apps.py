@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class AiConfig(AppConfig):
     name = 'ai'
+
+    def ready(self):
+        # 进程退出前写完缓冲中的调用日志和对话消息
+        from .write_behind import write_behind
+        write_behind.install_exit_hooks()
+        # 注册系统检查：配额计数需要在多个 worker 之间共享
+        from . import checks  # noqa: F401
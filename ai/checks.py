@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Tags, Warning, register
+from common.caches import is_process_local
+
+
+@register(Tags.caches)
+def check_quota_cache(app_configs, **kwargs):
+    """配额计数存放在进程内缓存时，每个 worker 各自计数，实际上限随 worker 数成倍放大"""
+    alias = getattr(settings, 'AI_QUOTA_CACHE', 'default')
+    if settings.DEBUG or not getattr(settings, 'AI_QUOTAS', {}) or not is_process_local(caches[alias]):
+        return []
+    return [Warning(
+        f'AI_QUOTA_CACHE（{alias}）是进程内缓存，多个 worker 之间不共享配额计数，实际上限会随 worker 数放大',
+        hint='设置 REDIS_URL 使用 Redis，或把 AI_QUOTA_CACHE 指向共享缓存',
+        id='ai.W001',
+    )]
@@ -0,0 +1,128 @@
+import asyncio
+import atexit
+import os
+import threading
+import weakref
+import httpx
+from openai import AsyncOpenAI, OpenAI
+from django.conf import settings
+
+# 进程级 OpenAI 客户端注册表：(base_url, api_key, 超时) → 客户端
+# 同一配置的请求共用一个连接池，复用 keep-alive 连接，省去每次调用的 TCP/TLS 握手
+_clients = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+
+# 异步客户端的连接只能在创建它的事件循环中使用，按事件循环分别登记
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _limits(max_connections=None):
+    """连接池上限，可在 settings 中配置"""
+    return httpx.Limits(
+        max_connections=max_connections or getattr(settings, 'AI_HTTP_MAX_CONNECTIONS', 100),
+        max_keepalive_connections=getattr(settings, 'AI_HTTP_MAX_KEEPALIVE', 20),
+        keepalive_expiry=getattr(settings, 'AI_HTTP_KEEPALIVE_EXPIRY', 60),
+    )
+
+
+def _check_fork():
+    """
+    预加载后 fork 出的子进程（如 gunicorn --preload）不能沿用父进程的连接，
+    丢弃继承来的注册表，由子进程重新建立
+    """
+    global _pid
+    if os.getpid() != _pid:
+        _clients.clear()
+        _pid = os.getpid()
+
+
+def get_client(timeout=30, base_url=None, api_key=None):
+    """
+    获取共享的 OpenAI 客户端
+    :param timeout: 超时时间（秒），短请求（摘要）和长请求（流式对话）分别使用各自的连接池
+    :param base_url: 默认 settings.AI_BASE_URL
+    :param api_key: 默认 settings.AI_API_KEY
+    """
+    base_url = base_url or settings.AI_BASE_URL
+    api_key = api_key or settings.AI_API_KEY
+    key = (base_url, api_key, float(timeout))
+
+    _check_fork()
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=timeout,
+                    max_retries=0,    # 关闭自动重试，由调用方控制
+                    http_client=httpx.Client(limits=_limits()),
+                )
+                _clients[key] = client
+    return client
+
+
+def get_async_client(timeout=60, base_url=None, api_key=None):
+    """
+    获取当前事件循环共享的 AsyncOpenAI 客户端（ASGI 下使用）
+    流式对话每个连接要占用到回复结束，连接上限单独配置（AI_ASYNC_HTTP_MAX_CONNECTIONS）
+    """
+    base_url = base_url or settings.AI_BASE_URL
+    api_key = api_key or settings.AI_API_KEY
+    key = (base_url, api_key, float(timeout))
+
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(key)
+    if client is None:
+        # 同一事件循环内没有并发切换点，无需加锁
+        client = clients[key] = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=_limits(getattr(settings, 'AI_ASYNC_HTTP_MAX_CONNECTIONS', 1000))
+            ),
+        )
+    return client
+
+
+def close_clients():
+    """
+    关闭全部同步客户端的连接池（进程退出时自动调用）
+    异步客户端要在所属事件循环中关闭：ASGI 进程退出时由 config.asgi 调用 aclose_clients；
+    这里只处理事件循环仍可用（未关闭、未运行）的异步客户端
+    """
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    for loop, async_clients in list(_async_clients.items()):
+        if not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(_aclose(async_clients.values()))
+    _async_clients.clear()
+
+
+async def aclose_clients():
+    """关闭当前事件循环的异步客户端连接池"""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    await _aclose(clients.values())
+
+
+async def _aclose(clients):
+    for client in list(clients):
+        try:
+            await client.close()
+        except Exception:
+            pass
+
+
+atexit.register(close_clients)
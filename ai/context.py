@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from .metrics import usage_fields
+from .models import ChatSession, ChatMessage, AIUsageLog
+from .quotas import charge as charge_quota
+from .services import AIService
+from .write_behind import write_behind
+
+logger = logging.getLogger(__name__)
+
+# 中日韩文字大约 1 字 1 token，其他文本大约 4 个字符 1 token
+CJK_RE = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD = 4
+
+# 会话摘要在后台线程中生成：回复发送完毕后不再占用请求的工作线程和数据库连接
+REFRESH_WORKERS = 2
+_refresh_pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='ai-chat-summary')
+_refreshing = set()   # 正在刷新摘要的会话 id
+_refreshing_lock = threading.Lock()
+_refresh_tasks = set()   # 异步视图创建的刷新任务，保留引用防止运行中被回收
+
+
+def estimate_tokens(text):
+    """本地估算 token 数（不调用分词器，宁多勿少）"""
+    if not text:
+        return 0
+    cjk = len(CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def message_tokens(message):
+    return estimate_tokens(message.content) + MESSAGE_OVERHEAD
+
+
+def _budget():
+    """历史消息（含滚动摘要）的 token 预算"""
+    return getattr(settings, 'AI_CHAT_CONTEXT_TOKENS', 3000)
+
+
+def _summary_length():
+    return getattr(settings, 'AI_CHAT_SUMMARY_LENGTH', 300)
+
+
+def _history(session):
+    """尚未并入摘要的消息，新的在前；设置上限防止摘要长期失败时无限增长"""
+    limit = getattr(settings, 'AI_CHAT_CONTEXT_MAX_MESSAGES', 200)
+    return ChatMessage.objects.filter(session=session, id__gt=session.summary_until_id).order_by('-id')[:limit]
+
+
+def split_history(history, budget):
+    """
+    从最新的消息开始填充预算
+    :param history: 消息列表，新的在前
+    :return: (放入上下文的消息, 放不下的更早消息)，均为新的在前；最新一条总是放入
+    """
+    window, used = [], 0
+    for i, message in enumerate(history):
+        cost = message_tokens(message)
+        if window and used + cost > budget:
+            return window, history[i:]
+        window.append(message)
+        used += cost
+    return window, []
+
+
+def _compose(session, window):
+    messages = []
+    if session.summary:
+        messages.append({"role": "system", "content": f"以下是本次会话早先内容的摘要：\n{session.summary}"})
+    messages.extend({"role": msg.role, "content": msg.content} for msg in reversed(window))
+    return messages
+
+
+def _history_with_pending(session):
+    """
+    数据库中的历史消息 + 写缓冲区中尚未落库的本会话消息，新的在前
+    在 hold() 中读取两边，避免读取之间发生刷新导致消息重复或遗漏
+    """
+    with write_behind.hold():
+        history = list(_history(session))
+        pending = write_behind.pending(ChatMessage, session_id=session.pk)
+    return list(reversed(pending)) + history
+
+
+def build_context(session):
+    """
+    构建发送给模型的消息列表：滚动摘要 + 预算内的最近消息
+    :return: (messages, needs_refresh)
+        needs_refresh 为 True 表示有消息放不进预算，回复结束后应调用 schedule_refresh（异步视图为 aschedule_refresh）
+    """
+    history = _history_with_pending(session)
+    window, overflow = split_history(history, _budget() - estimate_tokens(session.summary))
+    return _compose(session, window), bool(overflow)
+
+
+async def abuild_context(session):
+    """build_context 的异步版本（读取写缓冲区时需要加锁，放到线程中执行）"""
+    return await sync_to_async(build_context)(session)
+
+
+def _plan_fold(session, history):
+    """
+    选出要并入摘要的消息（按时间正序）
+    一次折叠到预算的一半，之后几轮对话不必再次生成摘要
+    """
+    budget = (_budget() - estimate_tokens(session.summary)) // 2
+    _, fold = split_history(history, budget)
+    return list(reversed(fold))
+
+
+def _save_summary(session, summary, fold):
+    # 以原来的 summary_until_id 为条件，并发刷新时不会用旧结果覆盖新结果
+    updated = ChatSession.objects.filter(
+        pk=session.pk, summary_until_id=session.summary_until_id
+    ).update(summary=summary, summary_until_id=fold[-1].id)
+    if updated:
+        session.summary, session.summary_until_id = summary, fold[-1].id
+    return bool(updated)
+
+
+async def _asave_summary(session, summary, fold):
+    updated = await ChatSession.objects.filter(
+        pk=session.pk, summary_until_id=session.summary_until_id
+    ).aupdate(summary=summary, summary_until_id=fold[-1].id)
+    if updated:
+        session.summary, session.summary_until_id = summary, fold[-1].id
+    return bool(updated)
+
+
+def _log_usage(user, session, ai, started, error=''):
+    """会话摘要调用同样记录调用日志、计入用户配额"""
+    if user is None:
+        return
+    usage = usage_fields(ai.last_usage, int((time.monotonic() - started) * 1000))
+    charge_quota(user, usage['total_tokens'])
+    write_behind.add(AIUsageLog(
+        user=user,
+        call_type='chat',
+        model=ai.model,
+        prompt_summary=f'[会话摘要] {session.title}'[:50],
+        success=not error,
+        error_message=error,
+        **usage,
+    ))
+
+
+def refresh_summary(session, ai, user=None):
+    """
+    把移出上下文窗口的早期消息增量并入会话摘要
+    :param ai: AIService
+    :param user: 记录调用日志和配额的用户，None 表示不记录
+    :return: 是否更新了摘要；生成失败时保持原状，下次对话再试
+    """
+    # 折叠的终点以消息 id 记录，先把本会话缓冲中的消息写入数据库
+    try:
+        write_behind.flush(ChatMessage, session_id=session.pk)
+    except Exception:
+        return False
+    fold = _plan_fold(session, list(_history(session)))
+    if not fold:
+        return False
+    started = time.monotonic()
+    try:
+        summary = ai.summarize_conversation(
+            session.summary,
+            [{"role": msg.role, "content": msg.content} for msg in fold],
+            _summary_length(),
+        )
+    except Exception as e:
+        _log_usage(user, session, ai, started, str(e))
+        return False
+    _log_usage(user, session, ai, started)
+    return _save_summary(session, summary, fold)
+
+
+def schedule_refresh(session, user):
+    """
+    在后台线程中执行 refresh_summary，同一会话同时只有一个刷新
+    :return: Future；该会话正在刷新时返回 None
+    """
+    if not _claim(session.pk):
+        return None
+    return _refresh_pool.submit(_refresh_in_background, session.pk, user)
+
+
+def _claim(session_id):
+    """标记会话正在刷新；已在刷新时返回 False"""
+    with _refreshing_lock:
+        if session_id in _refreshing:
+            return False
+        _refreshing.add(session_id)
+        return True
+
+
+def _release(session_id):
+    with _refreshing_lock:
+        _refreshing.discard(session_id)
+
+
+def _refresh_in_background(session_id, user):
+    try:
+        session = ChatSession.objects.filter(pk=session_id).first()
+        if session is None:
+            return False
+        return refresh_summary(session, AIService(timeout=60), user)
+    except Exception:
+        logger.exception('刷新会话摘要失败')
+        return False
+    finally:
+        _release(session_id)
+        connection.close()
+
+
+def aschedule_refresh(session, user):
+    """
+    schedule_refresh 的异步版本：在事件循环中创建独立的任务执行 arefresh_summary，
+    响应结束或客户端断开（请求任务被取消）都不影响摘要生成、记录日志和计入配额
+    :return: Task；该会话正在刷新时返回 None
+    """
+    if not _claim(session.pk):
+        return None
+    task = asyncio.create_task(_arefresh_in_background(session, user))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+    return task
+
+
+async def _arefresh_in_background(session, user):
+    try:
+        return await arefresh_summary(session, AIService(timeout=60), user)
+    except Exception:
+        logger.exception('刷新会话摘要失败')
+        return False
+    finally:
+        _release(session.pk)
+
+
+async def arefresh_summary(session, ai, user=None):
+    """refresh_summary 的异步版本"""
+    try:
+        await sync_to_async(write_behind.flush)(ChatMessage, session_id=session.pk)
+    except Exception:
+        return False
+    fold = _plan_fold(session, [message async for message in _history(session)])
+    if not fold:
+        return False
+    started = time.monotonic()
+    try:
+        summary = await ai.asummarize_conversation(
+            session.summary,
+            [{"role": msg.role, "content": msg.content} for msg in fold],
+            _summary_length(),
+        )
+    except Exception as e:
+        await sync_to_async(_log_usage)(user, session, ai, started, str(e))
+        return False
+    await sync_to_async(_log_usage)(user, session, ai, started)
+    return await _asave_summary(session, summary, fold)
@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from ai.summary_cache import prune
+
+
+class Command(BaseCommand):
+    """
+    淘汰文章摘要缓存：删除过期条目，条目数超过上限时删除最久未用的
+    用法：python manage.py prune_summary_cache
+    写入缓存时只按 AI_SUMMARY_CACHE_PRUNE_EVERY 抽样淘汰，建议每小时由定时任务执行一次
+    """
+    help = '淘汰过期和超出容量的文章摘要缓存'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        deleted = prune()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'已删除 {deleted} 条摘要缓存，耗时 {elapsed:.1f} 秒'))
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from ai.rollups import roll_up, rolled_up_until
+
+
+class Command(BaseCommand):
+    """
+    把水位线之后的 AI 调用日志累加到按小时 / 按天的汇总表
+    用法：python manage.py rollup_ai_usage
+    建议每隔几分钟由定时任务执行；中断或并发执行都不会重复累加
+    """
+    help = '增量汇总 AI 调用用量'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='每个事务处理的日志 id 范围（默认 10000）'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size 必须大于 0')
+
+        started = time.monotonic()
+        total = roll_up(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'已汇总 {total} 条调用日志，数据截至 {rolled_up_until()}，耗时 {elapsed:.1f} 秒'
+        ))
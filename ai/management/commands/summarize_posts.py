@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Length
+from django.utils import timezone
+from ai import map_reduce, summary_cache
+from ai.services import AIService
+from blog.models import Post
+from blog.related import update_related_many
+from blog.search import index_posts
+from blog.signals import invalidate_list_cache
+
+
+class Command(BaseCommand):
+    """
+    批量为文章生成 AI 摘要并写回 excerpt
+    用法：python manage.py summarize_posts --only-empty --concurrency 8
+
+    - 线程池并发调用模型，每批结束后用 bulk_update 写回
+    - 每批写回后记录进度，中断后重新执行同一命令会从断点继续
+    - 已生成过的正文直接使用摘要缓存，不重复消耗 Token
+    """
+    help = '批量为文章生成 AI 摘要并写回 excerpt'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', default='published', choices=['published', 'draft', 'archived', 'all'],
+                            help='文章状态（默认 published）')
+        parser.add_argument('--ids', default='', help='只处理这些文章，逗号分隔')
+        parser.add_argument('--author', default='', help='只处理该用户名的文章')
+        parser.add_argument('--tag', default='', help='只处理带该标签（slug）的文章')
+        parser.add_argument('--only-empty', action='store_true',
+                            help='只处理摘要为空或过短的文章（见 --min-excerpt）')
+        parser.add_argument('--min-excerpt', type=int, default=10,
+                            help='--only-empty 时，摘要短于该字数视为需要生成（默认 10）')
+        parser.add_argument('--max-length', type=int, default=200, help='摘要最大字数（默认 200）')
+        parser.add_argument('--concurrency', type=int, default=4, help='并发调用数（默认 4）')
+        parser.add_argument('--batch-size', type=int, default=50, help='每批写回的文章数（默认 50）')
+        parser.add_argument('--retries', type=int, default=2, help='单篇失败后的重试次数（默认 2）')
+        parser.add_argument('--checkpoint', default='.summarize_posts.json', help='进度文件路径')
+        parser.add_argument('--restart', action='store_true', help='忽略已有进度，从头开始')
+        parser.add_argument('--retry-failed', action='store_true', help='继续时重新处理上次失败的文章')
+        parser.add_argument('--dry-run', action='store_true', help='只统计待处理的文章数')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--concurrency 和 --batch-size 必须大于 0')
+
+        queryset = self.select_posts(options)
+        checkpoint = self.load_checkpoint(options)
+        if checkpoint['last_id']:
+            self.stdout.write(f'从断点继续：文章 id > {checkpoint["last_id"]}')
+        pending = Q(id__gt=checkpoint['last_id'])
+        if options['retry_failed'] and checkpoint['failed']:
+            pending |= Q(id__in=[int(pk) for pk in checkpoint['failed']])
+        queryset = queryset.filter(pending)
+
+        total = queryset.count()
+        if options['dry_run'] or not total:
+            self.stdout.write(f'待处理文章 {total} 篇')
+            return
+
+        self.local = threading.local()
+        self.options = options
+        started = time.monotonic()
+        done = failed = tokens = 0
+
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for start in range(0, len(ids), options['batch_size']):
+                chunk = ids[start:start + options['batch_size']]
+                summaries, errors, used = self.summarize_batch(pool, Post.objects.filter(id__in=chunk))
+                tokens += used
+
+                posts = []
+                for post, summary in summaries:
+                    post.excerpt = summary
+                    posts.append(post)
+                    checkpoint['failed'].pop(str(post.pk), None)
+                checkpoint['failed'].update(errors)
+                self.write_back(posts)
+
+                done += len(posts)
+                failed += len(errors)
+                checkpoint['last_id'] = max(checkpoint['last_id'], chunk[-1])
+                self.save_checkpoint(checkpoint)
+
+                minutes = max(time.monotonic() - started, 1e-6) / 60
+                self.stdout.write(
+                    f'[{start + len(chunk)}/{total}] 成功 {done}，失败 {failed}，'
+                    f'{done / minutes:.1f} 篇/分钟，{tokens / minutes:.0f} tokens/分钟'
+                )
+
+        elapsed = time.monotonic() - started
+        if not checkpoint['failed']:
+            # 全部完成，清理进度文件
+            self.remove_checkpoint()
+        self.stdout.write(self.style.SUCCESS(
+            f'完成：成功 {done} 篇，失败 {failed} 篇，消耗 {tokens} tokens，耗时 {elapsed:.1f} 秒'
+        ))
+        if checkpoint['failed']:
+            self.stdout.write(self.style.WARNING(
+                f'失败的文章 id 已记录在 {options["checkpoint"]}：'
+                + ', '.join(list(checkpoint['failed'])[:20])
+            ))
+
+    def select_posts(self, options):
+        queryset = Post.objects.all()
+        if options['status'] != 'all':
+            queryset = queryset.filter(status=options['status'])
+        if options['ids']:
+            try:
+                ids = [int(pk) for pk in options['ids'].split(',') if pk.strip()]
+            except ValueError:
+                raise CommandError('--ids 格式错误，应为逗号分隔的数字')
+            queryset = queryset.filter(id__in=ids)
+        if options['author']:
+            queryset = queryset.filter(author__username=options['author'])
+        if options['tag']:
+            queryset = queryset.filter(tags__slug=options['tag'])
+        if options['only_empty']:
+            queryset = queryset.annotate(excerpt_length=Length('excerpt')).filter(
+                excerpt_length__lt=options['min_excerpt']
+            )
+        return queryset.distinct()
+
+    def summarize_batch(self, pool, posts):
+        """
+        生成一批文章的摘要
+        全文摘要的缓存在主线程读写；长文章的分段缓存由工作线程在 map_reduce.summarize 中读写，
+        工作线程每处理完一篇关闭自己的数据库连接
+        :return: ([(文章, 摘要)], {文章 id: 失败原因}, 消耗的 token 数)
+        """
+        max_length = self.options['max_length']
+        summaries, errors, pending = [], {}, []
+        for post in posts.order_by('id'):
+            content = post.content.strip()
+            if not content:
+                errors[str(post.pk)] = '正文为空'
+                continue
+            cached = summary_cache.get_summary(content, max_length)
+            if cached is not None:
+                summaries.append((post, cached))
+            else:
+                pending.append(post)
+
+        tokens = 0
+        for post, (summary, used, error) in zip(pending, pool.map(self.generate, pending)):
+            tokens += used
+            if summary is None:
+                errors[str(post.pk)] = error
+                continue
+            summary_cache.set_summary(post.content.strip(), max_length, summary)
+            summaries.append((post, summary))
+
+        # excerpt 字段最长 500 字
+        return [(post, summary[:500]) for post, summary in summaries], errors, tokens
+
+    def generate(self, post):
+        """
+        在线程池中执行：调用模型生成单篇摘要，失败时退避重试
+        :return: (摘要或 None, 消耗的 token 数, 失败原因)
+        """
+        try:
+            return self._generate(post)
+        finally:
+            # 分段缓存的读写在本线程中打开了数据库连接，线程池不会替我们关闭
+            connection.close()
+
+    def _generate(self, post):
+        # 每个线程一个 AIService（last_usage 按实例记录），底层共用同一个连接池
+        ai = getattr(self.local, 'ai', None)
+        if ai is None:
+            ai = self.local.ai = AIService(timeout=30)
+
+        error = ''
+        for attempt in range(self.options['retries'] + 1):
+            try:
+                # 长文章分段摘要：所有线程的分段调用合计不超过 AI_SUMMARY_CONCURRENCY
+                summary = map_reduce.summarize(ai, post.content.strip(), self.options['max_length'])
+            except Exception as e:
+                error = str(e)
+                if attempt < self.options['retries']:
+                    time.sleep(min(2 ** attempt, 10))
+                continue
+            return summary, getattr(ai.last_usage, 'total_tokens', 0) or 0, ''
+        return None, 0, error
+
+    def write_back(self, posts):
+        """
+        批量写回摘要
+        bulk_update 不触发 auto_now 和信号，手动更新修改时间、检索索引、相关文章和列表缓存
+        """
+        if not posts:
+            return
+        now = timezone.now()
+        for post in posts:
+            post.updated_at = now
+        with transaction.atomic():
+            Post.objects.bulk_update(posts, ['excerpt', 'updated_at'])
+            index_posts(posts)
+            update_related_many(posts)
+            invalidate_list_cache()
+
+    def filter_signature(self, options):
+        """筛选条件的签名：条件不同的进度不能混用"""
+        keys = ['status', 'ids', 'author', 'tag', 'only_empty', 'min_excerpt', 'max_length']
+        raw = json.dumps({key: options[key] for key in keys}, sort_keys=True)
+        return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+    def load_checkpoint(self, options):
+        signature = self.filter_signature(options)
+        empty = {'signature': signature, 'last_id': 0, 'failed': {}}
+        path = options['checkpoint']
+        if options['restart'] or not os.path.exists(path):
+            return empty
+        with open(path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('signature') != signature:
+            self.stdout.write(self.style.WARNING('进度文件的筛选条件与本次不同，从头开始'))
+            return empty
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint):
+        # 先写临时文件再替换，中途被打断也不会留下损坏的进度文件
+        path = self.options['checkpoint']
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def remove_checkpoint(self):
+        if os.path.exists(self.options['checkpoint']):
+            os.remove(self.options['checkpoint'])
@@ -0,0 +1,184 @@
+import hashlib
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+from django.conf import settings
+from .services import AIService
+from . import summary_cache
+
+# 句末标点（不含英文句点，避免切开小数和缩写）
+SENTENCE_END = re.compile(r'(?<=[。！？!?；;])')
+
+
+def _chunk_size():
+    """每段的最大字数，也是不分段直接摘要的上限"""
+    return getattr(settings, 'AI_SUMMARY_CHUNK_SIZE', 3000)
+
+
+def _chunk_length():
+    """每段概括的最大字数"""
+    return getattr(settings, 'AI_SUMMARY_CHUNK_LENGTH', 300)
+
+
+def _concurrency():
+    return getattr(settings, 'AI_SUMMARY_CONCURRENCY', 4)
+
+
+# 进程内所有分段摘要共用的并发名额：多个 summarize 同时执行（如 summarize_posts --concurrency 8）时，
+# 同时进行的分段调用总数仍不超过 AI_SUMMARY_CONCURRENCY
+_slots = {}
+_slots_lock = threading.Lock()
+
+
+def _semaphore():
+    """按当前的 AI_SUMMARY_CONCURRENCY 取共用的信号量"""
+    concurrency = _concurrency()
+    with _slots_lock:
+        if concurrency not in _slots:
+            _slots[concurrency] = threading.BoundedSemaphore(concurrency)
+        return _slots[concurrency]
+
+
+def _pieces(paragraph, chunk_size):
+    """超长段落按句子切开，仍然过长的句子按长度硬切"""
+    if len(paragraph) <= chunk_size:
+        return [paragraph]
+    pieces, current = [], ''
+    for sentence in SENTENCE_END.split(paragraph):
+        if current and len(current) + len(sentence) > chunk_size:
+            pieces.append(current)
+            current = ''
+        while len(sentence) > chunk_size:
+            pieces.append(sentence[:chunk_size])
+            sentence = sentence[chunk_size:]
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _is_boundary(piece):
+    # 由段落内容决定的切分点：编辑某一段后，后面的分段在下一个切分点重新对齐，缓存仍然命中
+    return hashlib.md5(piece.encode('utf-8')).digest()[0] % 4 == 0
+
+
+def split_content(content, chunk_size=None):
+    """
+    按段落边界把正文切成不超过 chunk_size 字的分段
+    每段至少填到一半才在内容决定的切分点结束，避免分段过碎
+    :return: 分段列表（段内段落以空行连接）
+    """
+    chunk_size = chunk_size or _chunk_size()
+    chunks, current, size = [], [], 0
+    paragraphs = [p.strip() for p in content.splitlines() if p.strip()]
+    for paragraph in paragraphs:
+        for piece in _pieces(paragraph, chunk_size):
+            if current and size + len(piece) > chunk_size:
+                chunks.append('\n\n'.join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece)
+            if size >= chunk_size // 2 and _is_boundary(piece):
+                chunks.append('\n\n'.join(current))
+                current, size = [], 0
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+def _group(summaries, chunk_size):
+    """把概括按顺序分组，每组合计不超过 chunk_size 字"""
+    groups, current, size = [], [], 0
+    for summary in summaries:
+        if current and size + len(summary) > chunk_size:
+            groups.append(current)
+            current, size = [], 0
+        current.append(summary)
+        size += len(summary)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _add_usage(total, usage):
+    for name in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+        total[name] += getattr(usage, name, 0) or 0
+
+
+def _run_parallel(ai, tasks, total_usage, on_done=None):
+    """
+    并发执行模型调用，进程内所有 summarize 的分段调用合计不超过 AI_SUMMARY_CONCURRENCY
+    每个任务使用独立的 AIService（last_usage 按实例记录），底层共用同一个连接池
+    工作线程只调用模型，不访问数据库
+    :param tasks: [fn(service) -> 结果]
+    :param on_done: 每个任务成功后在当前线程中调用 on_done(序号, 结果)（如写入缓存）
+    :return: 按任务顺序的结果；有任务失败时，其余任务完成后抛出第一个异常
+    """
+    slots = _semaphore()
+
+    def run(task):
+        service = AIService(timeout=ai.timeout)
+        with slots:
+            return task(service), service.last_usage
+
+    results = [None] * len(tasks)
+    error = None
+    with ThreadPoolExecutor(max_workers=min(_concurrency(), len(tasks))) as pool:
+        futures = {pool.submit(run, task): i for i, task in enumerate(tasks)}
+        for future in as_completed(futures):
+            try:
+                result, usage = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            _add_usage(total_usage, usage)
+            results[futures[future]] = result
+            if on_done is not None:
+                on_done(futures[future], result)
+    if error is not None:
+        raise error
+    return results
+
+
+def summarize(ai, content, max_length=200):
+    """
+    生成文章摘要，长文章分段摘要（map-reduce）
+    - 不超过 AI_SUMMARY_CHUNK_SIZE 字：直接调用 ai.generate_summary
+    - 否则按段落切分，各段并发概括（map），再合并成全文摘要（reduce）；
+      各段的概括按分段内容缓存，编辑其中一段只重新概括这一段
+    - 概括合起来仍然过长时逐层合并
+    调用结束后 ai.last_usage 为所有调用的 token 用量之和
+    :raises: TimeoutError, Exception（与 generate_summary 相同）
+    """
+    chunks = split_content(content)
+    if len(chunks) <= 1:
+        return ai.generate_summary(content, max_length)
+
+    chunk_length = _chunk_length()
+    usage = Counter()
+    partials = [summary_cache.get_summary(chunk, chunk_length, stage='chunk') for chunk in chunks]
+    missing = [i for i, partial in enumerate(partials) if partial is None]
+    if missing:
+        def save(index, partial):
+            chunk = chunks[missing[index]]
+            partials[missing[index]] = partial
+            summary_cache.set_summary(chunk, chunk_length, partial, stage='chunk')
+
+        _run_parallel(ai, [
+            lambda service, chunk=chunks[i]: service.summarize_chunk(chunk, chunk_length) for i in missing
+        ], usage, on_done=save)
+
+    while len(partials) > 1 and sum(map(len, partials)) > _chunk_size():
+        groups = _group(partials, _chunk_size())
+        if len(groups) == len(partials):
+            break
+        partials = _run_parallel(ai, [
+            lambda service, group=group: service.merge_summaries(group, chunk_length) for group in groups
+        ], usage)
+
+    summary = ai.merge_summaries(partials, max_length)
+    _add_usage(usage, ai.last_usage)
+    ai.last_usage = SimpleNamespace(**usage)
+    return summary
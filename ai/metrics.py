@@ -0,0 +1,78 @@
+import math
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import Mod
+from django.utils import timezone
+from .models import AIUsageLog
+
+
+def usage_fields(usage, response_time_ms, first_token_ms=None):
+    """
+    把接口返回的 usage 和计时换算成 AIUsageLog 字段
+    :param usage: 接口返回的 usage（未返回时为 None，token 记为 0）
+    :param response_time_ms: 整个调用的耗时
+    :param first_token_ms: 流式调用收到第一个片段的耗时；非流式为 None
+    """
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    # 输出速度只算生成阶段：流式从首个片段开始计时
+    generating_ms = response_time_ms - (first_token_ms or 0)
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': getattr(usage, 'total_tokens', 0) or prompt_tokens + completion_tokens,
+        'response_time_ms': response_time_ms,
+        'first_token_ms': first_token_ms,
+        'tokens_per_second': round(completion_tokens * 1000 / generating_ms, 2) if completion_tokens and generating_ms > 0 else None,
+    }
+
+
+def percentile(values, p):
+    """最近秩百分位数，values 需已排序"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def _sample_limit():
+    """每个模型参与百分位计算的最多行数"""
+    return getattr(settings, 'AI_LATENCY_STATS_SAMPLES', 20000)
+
+
+def latency_stats(hours=24, call_type=None):
+    """
+    按模型统计最近若干小时的调用延迟（只统计实际调用了模型的成功请求）
+    调用数和 token 数在数据库中汇总；MySQL 没有百分位函数，百分位取出数值后在 Python 中计算，
+    行数超过 AI_LATENCY_STATS_SAMPLES 时按 id 等间隔抽样，读取的行数与时间窗口大小无关
+    :return: [{model, calls, tokens, response_time_ms: {p50, p95}, first_token_ms: {...}, tokens_per_second: {...}}]
+    """
+    queryset = AIUsageLog.objects.filter(
+        created_at__gte=timezone.now() - timedelta(hours=hours),
+        success=True,
+        cache_hit=False,
+    )
+    if call_type:
+        queryset = queryset.filter(call_type=call_type)
+
+    columns = ('response_time_ms', 'first_token_ms', 'tokens_per_second')
+    totals = queryset.values('model').annotate(calls=Count('id'), tokens=Sum('total_tokens')).order_by('model')
+    limit = _sample_limit()
+    stats = []
+    for total in totals:
+        rows = queryset.filter(model=total['model'])
+        step = math.ceil(total['calls'] / limit)
+        if step > 1:
+            rows = rows.annotate(bucket=Mod('id', step)).filter(bucket=0)
+        samples = {column: [] for column in columns}
+        for values in rows.values_list(*columns).iterator(chunk_size=2000):
+            for column, value in zip(columns, values):
+                if value is not None:
+                    samples[column].append(value)
+
+        item = {'model': total['model'], 'calls': total['calls'], 'tokens': total['tokens'] or 0}
+        for column in columns:
+            values = sorted(samples[column])
+            item[column] = {'p50': percentile(values, 50), 'p95': percentile(values, 95)}
+        stats.append(item)
+    return stats
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryCache',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=100)),
+                ('summary', models.TextField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True, help_text='最近使用时间（淘汰依据）')),
+            ],
+            options={
+                'db_table': 'ai_summary_cache',
+            },
+        ),
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='cache_hit',
+            field=models.BooleanField(default=False, help_text='是否命中缓存（命中时不调用模型）'),
+        ),
+    ]
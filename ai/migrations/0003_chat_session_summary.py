@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0002_summary_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='summary',
+            field=models.TextField(blank=True, help_text='滚动摘要：已移出上下文窗口的早期对话'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='summary_until_id',
+            field=models.BigIntegerField(default=0, help_text='已并入摘要的最后一条消息 id'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-17 02:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0003_chat_session_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='first_token_ms',
+            field=models.IntegerField(blank=True, help_text='首个片段到达时间(ms)，仅流式调用', null=True),
+        ),
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='model',
+            field=models.CharField(blank=True, help_text='调用的模型', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='aiusagelog',
+            name='tokens_per_second',
+            field=models.FloatField(blank=True, help_text='输出速度(token/s)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='aiusagelog',
+            index=models.Index(fields=['created_at', 'model'], name='ai_usage_created_model_idx'),
+        ),
+    ]
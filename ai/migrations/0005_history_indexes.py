@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-17 02:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0004_usage_latency'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='chatmessage',
+            options={'ordering': ['-id']},
+        ),
+        migrations.AlterModelOptions(
+            name='chatsession',
+            options={'ordering': ('-updated_at', '-id')},
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'id'], name='ai_msg_session_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='ai_session_user_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-17 02:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0005_history_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIRollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('last_at', models.DateTimeField(blank=True, help_text='最后一条已汇总日志的创建时间', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ai_rollup_watermarks',
+            },
+        ),
+        migrations.CreateModel(
+            name='AIUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', '小时'), ('day', '天')], max_length=10)),
+                ('period_start', models.DateTimeField(help_text='统计周期的开始时间')),
+                ('call_type', models.CharField(choices=[('chat', '对话'), ('summarize', '摘要生成')], max_length=20)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('calls', models.IntegerField(default=0)),
+                ('success_calls', models.IntegerField(default=0)),
+                ('cache_hits', models.IntegerField(default=0)),
+                ('prompt_tokens', models.BigIntegerField(default=0)),
+                ('completion_tokens', models.BigIntegerField(default=0)),
+                ('total_tokens', models.BigIntegerField(default=0)),
+                ('response_time_ms', models.BigIntegerField(default=0, help_text='响应时间之和(ms)，除以调用数得平均值')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ai_usage_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ai_usage_rollups',
+                'indexes': [models.Index(fields=['period', 'user', 'period_start'], name='ai_rollup_user_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start', 'user', 'call_type', 'model'), name='ai_usage_rollup_uniq')],
+            },
+        ),
+    ]
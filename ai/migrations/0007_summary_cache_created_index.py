@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0006_usage_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='summarycache',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, help_text='写入时间（过期依据）'),
+        ),
+    ]
@@ -14,12 +14,18 @@ class ChatSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE,related_name = 'chat_sessions')
     title = models.CharField(max_length=200, blank=True,help_text='会话标题')
     session_type = models.CharField(max_length=20,choices=SESSION_TYPE,default='consult')
+    summary = models.TextField(blank=True, help_text='滚动摘要：已移出上下文窗口的早期对话')
+    summary_until_id = models.BigIntegerField(default=0, help_text='已并入摘要的最后一条消息 id')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'ai_chat_sessions'
-        ordering = ('-updated_at',)
+        ordering = ('-updated_at', '-id')
+        indexes = [
+            # 用户的会话列表：按最近活跃倒序做 keyset 分页
+            models.Index(fields=['user', 'updated_at', 'id'], name='ai_session_user_updated_idx'),
+        ]
 
     def _str_(self):
         return f"{self.user.username}- {self.title or '未命名会话'}"
@@ -42,7 +48,12 @@ class ChatMessage(models.Model):
 
     class Meta:
         db_table = 'ai_chat_messages'
-        ordering = ['-created_at']
+        # id 随写入递增，与创建时间顺序一致，且能直接使用 (session, id) 索引
+        ordering = ['-id']
+        indexes = [
+            # 会话消息分页和构建上下文时读取最近消息：WHERE session_id = ? AND id < ? ORDER BY id DESC
+            models.Index(fields=['session', 'id'], name='ai_msg_session_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
@@ -57,18 +68,98 @@ class AIUsageLog(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE,related_name = 'ai_usage_logs')
     call_type = models.CharField(max_length=20, choices=CALL_TYPES)
+    model = models.CharField(max_length=100, blank=True, help_text='调用的模型')
     prompt_summary = models.CharField(max_length=200,help_text='Promt摘要')
     prompt_tokens = models.IntegerField(default=0)
     completion_tokens = models.IntegerField(default=0)
     total_tokens = models.IntegerField(default=0)
     response_time_ms = models.IntegerField(default=0, help_text='响应时间(ms)')
+    first_token_ms = models.IntegerField(null=True, blank=True, help_text='首个片段到达时间(ms)，仅流式调用')
+    tokens_per_second = models.FloatField(null=True, blank=True, help_text='输出速度(token/s)')
     success = models.BooleanField(default=True)
+    cache_hit = models.BooleanField(default=False, help_text='是否命中缓存（命中时不调用模型）')
     error_message = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'ai_usage_logs'
         ordering = ['-created_at']
+        indexes = [
+            # 按时间范围统计延迟
+            models.Index(fields=['created_at', 'model'], name='ai_usage_created_model_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} - {self.call_type} - {self.created_at}"
\ No newline at end of file
+        return f"{self.user.username} - {self.call_type} - {self.created_at}"
+
+
+class SummaryCache(models.Model):
+    """
+    文章摘要缓存（按内容寻址）
+    key = sha256(提示词版本, 模型, 摘要长度, 规范化后的正文)
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    model = models.CharField(max_length=100)
+    summary = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, help_text='写入时间（过期依据）')
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True, help_text='最近使用时间（淘汰依据）')
+
+    class Meta:
+        db_table = 'ai_summary_cache'
+
+    def __str__(self):
+        return f"{self.model} - {self.summary[:30]}"
+
+
+class AIUsageRollup(models.Model):
+    """
+    AI 调用用量汇总（按小时 / 按天），由 rollup_ai_usage 命令从调用日志增量累加
+    报表只读这张表，查询代价与原始日志的行数无关
+    """
+    PERIODS = [
+        ('hour', '小时'),
+        ('day', '天'),
+    ]
+
+    period = models.CharField(max_length=10, choices=PERIODS)
+    period_start = models.DateTimeField(help_text='统计周期的开始时间')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ai_usage_rollups')
+    call_type = models.CharField(max_length=20, choices=AIUsageLog.CALL_TYPES)
+    model = models.CharField(max_length=100, blank=True)
+    calls = models.IntegerField(default=0)
+    success_calls = models.IntegerField(default=0)
+    cache_hits = models.IntegerField(default=0)
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+    total_tokens = models.BigIntegerField(default=0)
+    response_time_ms = models.BigIntegerField(default=0, help_text='响应时间之和(ms)，除以调用数得平均值')
+
+    class Meta:
+        db_table = 'ai_usage_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'user', 'call_type', 'model'], name='ai_usage_rollup_uniq'
+            ),
+        ]
+        indexes = [
+            # 报表：某个周期粒度下一段时间的汇总，可再按用户过滤
+            models.Index(fields=['period', 'user', 'period_start'], name='ai_rollup_user_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.period_start} - {self.user_id} - {self.call_type}"
+
+
+class AIRollupWatermark(models.Model):
+    """汇总进度：已累加到汇总表的最后一条日志 id"""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    last_at = models.DateTimeField(null=True, blank=True, help_text='最后一条已汇总日志的创建时间')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ai_rollup_watermarks'
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
@@ -0,0 +1,14 @@
+from common.pagination import KeysetPagination
+
+
+class SessionCursorPagination(KeysetPagination):
+    """会话列表游标分页：按 (updated_at, id) 倒序，最近活跃的会话在前"""
+    time_field = 'updated_at'
+    page_size = 20
+
+
+class MessageCursorPagination(KeysetPagination):
+    """会话消息游标分页：按 id 倒序，从最新的消息往前翻"""
+    time_field = None
+    page_size = 50
+    max_page_size = 200
@@ -0,0 +1,138 @@
+import math
+import time
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+
+KEY_PREFIX = 'ai:quota'
+
+# 用户所属组的缓存时间（秒）：配额检查的热路径不查数据库，组变更最多延迟这么久生效
+GROUPS_TIMEOUT = 300
+
+
+def _cache():
+    """配额计数所在的缓存，多个 worker 必须共享（进程内缓存下每个 worker 各算各的，见 ai.checks）"""
+    return caches[getattr(settings, 'AI_QUOTA_CACHE', 'default')]
+
+
+def _incr(cache, key, delta, timeout):
+    """原子累加（共享缓存如 Redis 的 incr 是原子的），键不存在时先创建"""
+    cache.add(key, 0, timeout=timeout)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # 键在 add 和 incr 之间过期，重新写入
+        if cache.add(key, delta, timeout=timeout):
+            return delta
+        return cache.incr(key, delta)
+
+
+def _groups_key(user):
+    return f'{KEY_PREFIX}:groups:{user.pk}'
+
+
+def _group_names(user, cached=None):
+    """
+    用户所属的组名，与配额计数存放在同一缓存中，缓存 GROUPS_TIMEOUT 秒
+    :param cached: 调用方已从缓存取出的组名（与计数一起批量读取），None 表示未取到
+    """
+    if cached is not None:
+        return cached
+    names = _cache().get(_groups_key(user))
+    if names is None:
+        names = list(user.groups.values_list('name', flat=True))
+        _cache().set(_groups_key(user), names, timeout=GROUPS_TIMEOUT)
+    return names
+
+
+def limits_for(user, group_names=None):
+    """
+    用户的配额：AI_QUOTAS 中 default 与用户所属各组（管理员额外属于 staff）取最宽松的值
+    :return: {'requests_per_minute': 次数或 None, 'tokens_per_day': token 数或 None}，None / 0 表示不限
+    """
+    quotas = getattr(settings, 'AI_QUOTAS', {})
+    names = ['default', *_group_names(user, group_names)]
+    if user.is_staff:
+        names.append('staff')
+
+    limits = {}
+    for name in ('requests_per_minute', 'tokens_per_day'):
+        values = [quotas[group].get(name) for group in names if group in quotas]
+        if not values or any(not value for value in values):
+            limits[name] = None
+        else:
+            limits[name] = max(values)
+    return limits
+
+
+def _seconds_until_tomorrow():
+    now = timezone.localtime()
+    tomorrow = timezone.make_aware(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+    return (tomorrow - now).total_seconds()
+
+
+def check(user):
+    """
+    在调用模型前检查并占用配额，只访问缓存，不查数据库
+    - 每分钟请求数：滑动窗口计数（上一分钟的计数按剩余比例折算 + 本分钟计数），
+      只用原子 incr，效果与每分钟补满的令牌桶相近
+    - 每日 token 数：当天已用 token（由 charge 在调用后累加）达到上限后拒绝
+    :return: 需要等待的秒数（超出配额），None 表示放行
+    """
+    cache = _cache()
+    now = time.time()
+    day = timezone.localdate().isoformat()
+    minute, elapsed = divmod(now, 60)
+    current_key = f'{KEY_PREFIX}:rpm:{user.pk}:{int(minute)}'
+    previous_key = f'{KEY_PREFIX}:rpm:{user.pk}:{int(minute) - 1}'
+    day_key = f'{KEY_PREFIX}:tpd:{user.pk}:{day}'
+
+    # 组名和计数一次读取；组名缓存过期时才查一次数据库
+    values = cache.get_many([_groups_key(user), previous_key, day_key])
+    limits = limits_for(user, values.get(_groups_key(user)))
+    if limits['tokens_per_day'] and values.get(day_key, 0) >= limits['tokens_per_day']:
+        return math.ceil(_seconds_until_tomorrow())
+
+    limit = limits['requests_per_minute']
+    if not limit:
+        return None
+    count = _incr(cache, current_key, 1, timeout=120)
+    previous = values.get(previous_key, 0)
+    if previous * (1 - elapsed / 60) + count <= limit:
+        return None
+
+    # 超出配额：退回本次占用，被拒绝的请求不计数
+    try:
+        cache.decr(current_key)
+    except ValueError:
+        pass
+    if count > limit or not previous:
+        return math.ceil(60 - elapsed) or 1
+    # 上一分钟的折算计数降到剩余额度以内所需的时间
+    needed = 1 - (limit - count) / previous
+    return max(1, math.ceil((needed * 60) - elapsed))
+
+
+def charge(user, tokens):
+    """调用结束后把实际消耗的 token 计入当日用量"""
+    if tokens:
+        key = f'{KEY_PREFIX}:tpd:{user.pk}:{timezone.localdate().isoformat()}'
+        _incr(_cache(), key, tokens, timeout=2 * 24 * 3600)
+
+
+class AIQuotaThrottle(BaseThrottle):
+    """
+    AI 接口的用户配额限流：超出配额时 DRF 返回 429 并带 Retry-After
+    认证和权限检查之后、视图调用模型之前执行
+    """
+
+    def allow_request(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return True
+        self.retry_after = check(request.user)
+        return self.retry_after is None
+
+    def wait(self):
+        return self.retry_after
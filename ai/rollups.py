@@ -0,0 +1,144 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from .models import AIRollupWatermark, AIUsageLog, AIUsageRollup
+
+WATERMARK = 'usage'
+
+# 累加到汇总表的计数列
+COUNTERS = ('calls', 'success_calls', 'cache_hits', 'prompt_tokens', 'completion_tokens', 'total_tokens',
+            'response_time_ms')
+
+
+def _lag():
+    """只汇总创建超过若干秒的日志，等待写缓冲区和进行中的事务提交，避免水位线越过尚未可见的行"""
+    return getattr(settings, 'AI_USAGE_ROLLUP_LAG', 60)
+
+
+def _aggregate(first_id, last_id):
+    """
+    按小时聚合一段 id 范围内的日志
+    :return: {(period, period_start, user_id, call_type, model): Counter}，同时包含小时和天
+    """
+    rows = (
+        AIUsageLog.objects.filter(id__gte=first_id, id__lte=last_id)
+        .annotate(hour=TruncHour('created_at'))
+        .values('hour', 'user_id', 'call_type', 'model')
+        .annotate(
+            calls=Count('id'),
+            success_calls=Count('id', filter=Q(success=True)),
+            cache_hits=Count('id', filter=Q(cache_hit=True)),
+            prompt_tokens=Sum('prompt_tokens'),
+            completion_tokens=Sum('completion_tokens'),
+            total_tokens=Sum('total_tokens'),
+            response_time_ms=Sum('response_time_ms'),
+        )
+        # 去掉默认排序，否则 created_at 会进入 GROUP BY
+        .order_by()
+    )
+    deltas = defaultdict(Counter)
+    for row in rows:
+        values = {column: row[column] or 0 for column in COUNTERS}
+        day = timezone.localtime(row['hour']).replace(hour=0)
+        for period, start in (('hour', row['hour']), ('day', day)):
+            deltas[(period, start, row['user_id'], row['call_type'], row['model'])].update(values)
+    return deltas
+
+
+def _apply(deltas):
+    """把增量累加到汇总表：已有的行更新，没有的行新建"""
+    if not deltas:
+        return
+    existing = AIUsageRollup.objects.filter(
+        period_start__in={key[1] for key in deltas},
+        user_id__in={key[2] for key in deltas},
+    )
+    existing = {
+        (r.period, r.period_start, r.user_id, r.call_type, r.model): r
+        for r in existing
+    }
+
+    to_update, to_create = [], []
+    for key, values in deltas.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            period, start, user_id, call_type, model = key
+            to_create.append(AIUsageRollup(
+                period=period, period_start=start, user_id=user_id, call_type=call_type, model=model, **values
+            ))
+        else:
+            for column, value in values.items():
+                setattr(rollup, column, getattr(rollup, column) + value)
+            to_update.append(rollup)
+
+    AIUsageRollup.objects.bulk_update(to_update, COUNTERS, batch_size=1000)
+    AIUsageRollup.objects.bulk_create(to_create, batch_size=1000)
+
+
+def roll_up(batch_size=10000):
+    """
+    从水位线之后的日志增量更新汇总表，每批一个事务（汇总和水位线一起提交，中断后不会重复累加）
+    :param batch_size: 每批处理的日志 id 范围
+    :return: 本次汇总的日志条数
+    """
+    # 第一条还不稳定的日志：水位线不能越过它
+    cutoff = timezone.now() - timedelta(seconds=_lag())
+    unsettled = AIUsageLog.objects.filter(created_at__gt=cutoff).order_by('id').values_list('id', flat=True).first()
+    total = 0
+    while True:
+        with transaction.atomic():
+            # 锁住水位线，多个进程同时执行时串行累加
+            AIRollupWatermark.objects.get_or_create(name=WATERMARK)
+            mark = AIRollupWatermark.objects.select_for_update().get(name=WATERMARK)
+
+            first_id = AIUsageLog.objects.filter(id__gt=mark.last_id).order_by('id').values_list('id', flat=True).first()
+            if first_id is None or (unsettled is not None and first_id >= unsettled):
+                break
+            last_id = first_id + batch_size - 1
+            if unsettled is not None:
+                last_id = min(last_id, unsettled - 1)
+
+            deltas = _aggregate(first_id, last_id)
+            _apply(deltas)
+            total += sum(values['calls'] for key, values in deltas.items() if key[0] == 'hour')
+            mark.last_id, mark.last_at = (
+                AIUsageLog.objects.filter(id__lte=last_id).order_by('-id').values_list('id', 'created_at').first()
+            )
+            mark.save()
+    return total
+
+
+def usage_report(period, start, end, user_id=None, call_type=None):
+    """
+    从汇总表读取用量报表
+    :param period: hour / day
+    :param start, end: 时间范围 [start, end)
+    :return: (按周期和用户汇总的行列表, 合计)
+    """
+    queryset = AIUsageRollup.objects.filter(period=period, period_start__gte=start, period_start__lt=end)
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    if call_type:
+        queryset = queryset.filter(call_type=call_type)
+
+    sums = {column: Sum(column) for column in COUNTERS}
+    rows = list(
+        queryset.values('period_start', 'user_id', 'user__username')
+        .annotate(**sums)
+        .order_by('period_start', 'user_id')
+    )
+    totals = Counter()
+    for row in rows:
+        row['username'] = row.pop('user__username')
+        row['avg_response_time_ms'] = round(row['response_time_ms'] / row['calls']) if row['calls'] else None
+        totals.update({column: row[column] for column in COUNTERS})
+    return rows, dict(totals)
+
+
+def rolled_up_until():
+    """汇总表覆盖到的日志创建时间（之后的日志还未汇总）"""
+    return AIRollupWatermark.objects.filter(name=WATERMARK).values_list('last_at', flat=True).first()
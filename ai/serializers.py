@@ -0,0 +1,18 @@
+from rest_framework import serializers
+from .models import ChatSession, ChatMessage
+
+
+class ChatSessionSerializer(serializers.ModelSerializer):
+    """会话列表序列化器（不含滚动摘要）"""
+
+    class Meta:
+        model = ChatSession
+        fields = ['id', 'title', 'session_type', 'created_at', 'updated_at']
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    """会话消息序列化器"""
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'role', 'content', 'prompt_tokens', 'completion_tokens', 'created_at']
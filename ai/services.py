@@ -1,7 +1,33 @@
 import os
 import time
-from openai import OpenAI, APITimeoutError, APIError, RateLimitError
+from openai import APITimeoutError, APIError, RateLimitError
 from django.conf import settings
+from .clients import get_async_client, get_client
+
+# 摘要提示词版本：修改 generate_summary 的提示词时 +1，使旧的摘要缓存失效
+SUMMARY_PROMPT_VERSION = 2
+
+ROLE_NAMES = {'user': '用户', 'assistant': 'AI助手', 'system': '系统'}
+
+
+def conversation_summary_prompt(summary, messages, max_length):
+    """
+    会话摘要提示词：把新移出上下文的对话并入已有摘要
+    :param messages: [{"role": ..., "content": ...}]，按时间正序
+    """
+    dialogue = "\n".join(f"{ROLE_NAMES.get(m['role'], m['role'])}：{m['content']}" for m in messages)
+    return f"""请把新增对话并入已有摘要，生成新的对话摘要，要求：
+        1. 不超过{max_length}字
+        2. 保留用户的问题、关键事实、已达成的结论和约定
+        3. 只输出摘要本身
+
+        已有摘要：
+        {summary or '（无）'}
+
+        新增对话：
+        {dialogue}
+
+        新的摘要："""
 
 
 class AIService:
@@ -13,35 +39,48 @@ class AIService:
         :param timeout: 请求超时时间（秒），默认30秒
         """
         self.timeout = timeout
-        self.client = OpenAI(
-            api_key=settings.AI_API_KEY,
-            base_url=settings.AI_BASE_URL,
-            timeout=timeout,  # 设置全局超时
-            max_retries=0,    # 关闭自动重试，由调用方控制
-        )
+        # 使用进程级共享客户端，复用连接池中的 keep-alive 连接
+        self.client = get_client(timeout)
         self.model = settings.AI_MODEL
+        # 最近一次调用的 token 用量（接口未返回时为 None）
+        self.last_usage = None
+        # 最近一次流式调用收到第一个片段的耗时（毫秒）
+        self.first_token_ms = None
 
     def chat_stream(self, messages):
         """
         流式对话生成 - 带超时和异常处理
         :param messages: 消息列表 [{"role": "user", "content": "你好"}]
         :yield: 逐字返回的文本片段，或抛出异常
+        结束后 last_usage 为本次 token 用量，first_token_ms 为首个片段的耗时
         """
+        self.last_usage = self.first_token_ms = None
+        started = time.monotonic()
         try:
             # 创建流式请求
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 stream=True,  # 开启流式返回
+                stream_options={"include_usage": True},  # 最后一个片段附带 token 用量
                 timeout=self.timeout,
             )
 
-            for chunk in response:
-                # chunk.choices[0].delta.content 是增量文本
-                content = chunk.choices[0].delta.content
-                if content:
-                    # yield：Python生成器，每次产生一个文本片段
-                    yield content
+            # with：客户端断开（生成器被关闭）时立即关闭上游响应，归还连接
+            with response:
+                for chunk in response:
+                    if chunk.usage:
+                        self.last_usage = chunk.usage
+                    # 附带用量的最后一个片段 choices 为空
+                    if not chunk.choices:
+                        continue
+                    # chunk.choices[0].delta.content 是增量文本
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        if self.first_token_ms is None:
+                            self.first_token_ms = int((time.monotonic() - started) * 1000)
+                        # yield：Python生成器，每次产生一个文本片段
+                        yield content
                     
         except APITimeoutError as e:
             # 超时错误 - 向上抛出，让视图层处理
@@ -59,9 +98,51 @@ class AIService:
             # 其他未知错误
             raise Exception(f"未知错误: {str(e)}")
 
+    async def achat_stream(self, messages):
+        """
+        流式对话生成（异步版本，ASGI 下使用）
+        :param messages: 消息列表
+        :yield: 文本片段；异常转换方式、用量和计时记录与 chat_stream 相同
+        """
+        self.last_usage = self.first_token_ms = None
+        started = time.monotonic()
+        try:
+            response = await get_async_client(self.timeout).chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=self.timeout,
+            )
+
+            async with response:
+                async for chunk in response:
+                    if chunk.usage:
+                        self.last_usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        if self.first_token_ms is None:
+                            self.first_token_ms = int((time.monotonic() - started) * 1000)
+                        yield content
+
+        except APITimeoutError as e:
+            raise TimeoutError(f"AI模型响应超时（{self.timeout}秒）")
+
+        except RateLimitError as e:
+            raise Exception(f"API速率限制，请稍后再试: {str(e)}")
+
+        except APIError as e:
+            raise Exception(f"AI服务错误: {str(e)}")
+
+        except Exception as e:
+            raise Exception(f"未知错误: {str(e)}")
+
     def generate_summary(self, content, max_length=200):
         """
         生成文章摘要 - 带超时和异常处理
+        长文章应使用 map_reduce.summarize 分段摘要，这里只取前 3000 字
         :param content: 文章内容
         :param max_length: 摘要最大长度
         :return: 摘要文本
@@ -73,18 +154,56 @@ class AIService:
         3. 语言简洁通顺
         
         文章内容：
-        {content[:3000]}  # 只取前3000字，控制Token
+        {content[:3000]}
     
         摘要："""
+        return self._summarize(prompt, max_tokens=300)
+
+    def summarize_chunk(self, chunk, max_length=300):
+        """
+        长文章分段摘要的 map 阶段：概括其中一段
+        :param chunk: 按段落切分出的一段正文
+        """
+        prompt = f"""以下是一篇长文章中的一段，请概括这一段的内容，要求：
+        1. 不超过{max_length}字
+        2. 保留关键事实、数据和结论
+        3. 只输出概括本身
+
+        文章片段：
+        {chunk}
+
+        概括："""
+        return self._summarize(prompt, max_tokens=max_length * 2)
 
+    def merge_summaries(self, summaries, max_length=200):
+        """
+        长文章分段摘要的 reduce 阶段：把各段的概括合并成全文摘要
+        :param summaries: 各段的概括，按原文顺序
+        """
+        parts = "\n".join(f"{i}. {summary}" for i, summary in enumerate(summaries, 1))
+        prompt = f"""以下是一篇长文章各部分的概括（按原文顺序），请据此为全文生成摘要，要求：
+        1. 不超过{max_length}字
+        2. 包含文章核心观点，体现整体结构
+        3. 语言简洁通顺
+
+        各部分概括：
+        {parts}
+
+        摘要："""
+        return self._summarize(prompt, max_tokens=max(300, max_length * 2))
+
+    def _summarize(self, prompt, max_tokens):
+        """非流式摘要调用，记录 token 用量并统一异常类型"""
+        self.last_usage = None
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 stream=False,
-                max_tokens=300,
+                max_tokens=max_tokens,
                 timeout=self.timeout,
             )
+            self.last_usage = response.usage
             return response.choices[0].message.content.strip()
         
         except APITimeoutError as e:
@@ -99,6 +218,51 @@ class AIService:
         except Exception as e:
             raise Exception(f"生成摘要失败: {str(e)}")
 
+    def summarize_conversation(self, summary, messages, max_length=300):
+        """
+        滚动会话摘要（非流式）
+        :param summary: 已有摘要
+        :param messages: 要并入摘要的消息，按时间正序
+        :return: 新的摘要文本，token 用量记录在 last_usage
+        """
+        self.last_usage = None
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": conversation_summary_prompt(summary, messages, max_length)}],
+                stream=False,
+                max_tokens=max_length * 2,
+                timeout=self.timeout,
+            )
+            self.last_usage = response.usage
+            return response.choices[0].message.content.strip()
+
+        except APITimeoutError as e:
+            raise TimeoutError(f"生成会话摘要超时（{self.timeout}秒）")
+
+        except APIError as e:
+            raise Exception(f"AI服务错误: {str(e)}")
+
+    async def asummarize_conversation(self, summary, messages, max_length=300):
+        """滚动会话摘要（异步版本）"""
+        self.last_usage = None
+        try:
+            response = await get_async_client(self.timeout).chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": conversation_summary_prompt(summary, messages, max_length)}],
+                stream=False,
+                max_tokens=max_length * 2,
+                timeout=self.timeout,
+            )
+            self.last_usage = response.usage
+            return response.choices[0].message.content.strip()
+
+        except APITimeoutError as e:
+            raise TimeoutError(f"生成会话摘要超时（{self.timeout}秒）")
+
+        except APIError as e:
+            raise Exception(f"AI服务错误: {str(e)}")
+
     def chat_with_retry(self, messages, max_retries=3, retry_delay=1):
         """
         带重试机制的聊天（非流式）
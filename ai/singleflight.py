@@ -0,0 +1,94 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+
+class _Call:
+    """进行中的一次调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    相同请求的并发合并（single-flight）
+
+    同一个键同时只执行一次调用，其余请求等待并共享结果：
+    - 进程内：后到的线程等待先到线程的结果（包括异常）
+    - 跨进程：用缓存的 add 作为分布式锁（需要 Redis 等共享缓存），
+      没拿到锁的进程轮询 lookup（如摘要缓存）等待结果；
+      锁过期（持有者崩溃）仍没有结果时自己执行
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        """锁的过期时间，也是等待的上限（秒），应大于一次调用（含重试）的最长耗时"""
+        return getattr(settings, 'AI_SINGLEFLIGHT_TIMEOUT', 120)
+
+    def do(self, key, fn, lookup=None):
+        """
+        :param key: 请求的键（如正文哈希 + 参数）
+        :param fn: 实际执行的调用，返回结果或抛出异常
+        :param lookup: 跨进程等待时查询结果，返回 None 表示还没有结果
+        :return: (结果, 是否共享了其他请求的结果)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                raise TimeoutError('等待相同请求的结果超时')
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._do_across_processes(key, fn, lookup)
+            return call.result, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_across_processes(self, key, fn, lookup):
+        lock_key = f'{self.prefix}:{key}'
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while not cache.add(lock_key, 1, timeout=self.timeout):
+            # 其他进程正在执行，等它写出结果
+            if lookup is None or time.monotonic() > deadline:
+                return fn(), False
+            result = lookup()
+            if result is not None:
+                return result, True
+            waited = True
+            time.sleep(getattr(settings, 'AI_SINGLEFLIGHT_POLL_INTERVAL', 0.2))
+
+        try:
+            if waited and lookup is not None:
+                # 上一个持有者刚刚完成
+                result = lookup()
+                if result is not None:
+                    return result, True
+            return fn(), False
+        finally:
+            cache.delete(lock_key)
+
+
+# 摘要生成：键为摘要缓存键（提示词版本、模型、长度、规范化正文）
+summary_flight = SingleFlight('ai:summary-flight')
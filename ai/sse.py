@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+from django.conf import settings
+
+# SSE 注释行：客户端忽略，只用于让代理看到连接仍有数据
+HEARTBEAT = ': ping\n\n'
+
+
+def _options(window_ms, max_bytes, heartbeat):
+    window_ms = getattr(settings, 'AI_SSE_COALESCE_MS', 30) if window_ms is None else window_ms
+    max_bytes = getattr(settings, 'AI_SSE_COALESCE_BYTES', 1024) if max_bytes is None else max_bytes
+    heartbeat = getattr(settings, 'AI_SSE_HEARTBEAT', 15) if heartbeat is None else heartbeat
+    return window_ms / 1000, max_bytes, heartbeat
+
+
+class _Buffer:
+    """
+    读取方（上游）写入、发送方取出的片段缓冲
+    读取方只在缓冲由空变为非空、超过字节上限或结束时唤醒发送方，
+    窗口内的其他片段只追加，不产生线程切换
+    """
+
+    def __init__(self, window, max_bytes, heartbeat):
+        self.window, self.max_bytes, self.heartbeat = window, max_bytes, heartbeat
+        self.parts, self.size, self.first_at = [], 0, None
+        self.done, self.error = False, None
+        self.sent, self.last_sent = False, time.monotonic()
+
+    def put(self, text):
+        """:return: 是否需要唤醒发送方"""
+        if not self.parts:
+            self.first_at = time.monotonic()
+        self.parts.append(text)
+        self.size += len(text.encode('utf-8'))
+        return len(self.parts) == 1 or self.size >= self.max_bytes
+
+    def next_action(self):
+        """
+        :return: ('send', 文本) / ('heartbeat', None) / ('end', None) / ('wait', 秒数或 None)
+        """
+        now = time.monotonic()
+        if self.parts and (self.done or not self.sent or self.size >= self.max_bytes
+                           or now >= self.first_at + self.window):
+            # 第一个片段立即发送，不增加首字耗时
+            text = ''.join(self.parts)
+            self.parts, self.size, self.first_at = [], 0, None
+            self.sent, self.last_sent = True, now
+            return 'send', text
+        if self.done:
+            return 'end', None
+        if self.heartbeat and now - self.last_sent >= self.heartbeat:
+            self.last_sent = now
+            return 'heartbeat', None
+
+        waits = []
+        if self.parts:
+            waits.append(self.first_at + self.window - now)
+        if self.heartbeat:
+            waits.append(self.last_sent + self.heartbeat - now)
+        return 'wait', max(0, min(waits)) if waits else None
+
+
+def coalesce(chunks, window_ms=None, max_bytes=None, heartbeat=None):
+    """
+    合并流式文本片段，减少 SSE 帧数
+    模型常常一次只输出一两个字，逐片段发送会产生大量小帧和系统调用；
+    这里在 window_ms 毫秒内或累计 max_bytes 字节后合并成一帧发送，
+    上游长时间没有输出时每 heartbeat 秒产出一次 HEARTBEAT，防止空闲代理断开连接。
+    心跳需要在上游读取阻塞时发出，因此每个流启动一个读取线程；heartbeat 为 0 时在当前线程中合并
+
+    :param chunks: 文本片段迭代器（如 AIService.chat_stream）
+    :yield: 合并后的文本，或 HEARTBEAT；上游的异常在已收到的文本发出后原样抛出
+    """
+    window, max_bytes, heartbeat = _options(window_ms, max_bytes, heartbeat)
+    if not window and not heartbeat:
+        yield from chunks
+        return
+    if not heartbeat:
+        yield from _coalesce_inline(chunks, window, max_bytes)
+        return
+
+    # 读取上游会阻塞，放到单独线程中，本线程才能按时间发送合并帧和心跳
+    buffer = _Buffer(window, max_bytes, heartbeat)
+    condition = threading.Condition()
+    stopped = threading.Event()
+
+    def read():
+        try:
+            for chunk in chunks:
+                if stopped.is_set():
+                    # 客户端已断开，关闭上游连接
+                    if hasattr(chunks, 'close'):
+                        chunks.close()
+                    return
+                if chunk:
+                    with condition:
+                        if buffer.put(chunk):
+                            condition.notify()
+        except BaseException as e:
+            buffer.error = e
+        finally:
+            with condition:
+                buffer.done = True
+                condition.notify()
+
+    threading.Thread(target=read, name='sse-reader', daemon=True).start()
+
+    try:
+        while True:
+            with condition:
+                action, value = buffer.next_action()
+                while action == 'wait':
+                    condition.wait(value)
+                    action, value = buffer.next_action()
+            if action == 'send':
+                yield value
+            elif action == 'heartbeat':
+                yield HEARTBEAT
+            else:
+                break
+        if buffer.error is not None:
+            raise buffer.error
+    finally:
+        stopped.set()
+
+
+def _coalesce_inline(chunks, window, max_bytes):
+    """
+    不发心跳时在当前线程中合并，不为每个流启动读取线程
+    只在收到新片段时检查窗口：上游停顿时，已缓冲的文本要等到下一个片段或结束才发出
+    """
+    parts, size, first_at, sent = [], 0, None, False
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            now = time.monotonic()
+            if not parts:
+                first_at = now
+            parts.append(chunk)
+            size += len(chunk.encode('utf-8'))
+            if not sent or size >= max_bytes or now >= first_at + window:
+                text, parts, size, sent = ''.join(parts), [], 0, True
+                yield text
+    except Exception:
+        # 与 coalesce 一致：已收到的文本先发出，再抛出上游异常
+        if parts:
+            yield ''.join(parts)
+        raise
+    finally:
+        # 客户端断开时关闭上游连接
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    if parts:
+        yield ''.join(parts)
+
+
+async def acoalesce(chunks, window_ms=None, max_bytes=None, heartbeat=None):
+    """coalesce 的异步版本：chunks 为异步迭代器（如 AIService.achat_stream）"""
+    window, max_bytes, heartbeat = _options(window_ms, max_bytes, heartbeat)
+    if not window and not heartbeat:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    buffer = _Buffer(window, max_bytes, heartbeat)
+    wakeup = asyncio.Event()
+
+    async def read():
+        try:
+            async for chunk in chunks:
+                if chunk and buffer.put(chunk):
+                    wakeup.set()
+        except Exception as e:
+            buffer.error = e
+        finally:
+            buffer.done = True
+            wakeup.set()
+
+    reader = asyncio.ensure_future(read())
+    try:
+        while True:
+            action, value = buffer.next_action()
+            if action == 'wait':
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), value)
+                except asyncio.TimeoutError:
+                    pass
+            elif action == 'send':
+                yield value
+            elif action == 'heartbeat':
+                yield HEARTBEAT
+            else:
+                break
+        if buffer.error is not None:
+            raise buffer.error
+    finally:
+        # 客户端断开（任务被取消）时一并取消上游读取，并关闭上游生成器（释放 HTTP 连接），
+        # 不等到垃圾回收
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        if hasattr(chunks, 'aclose'):
+            await chunks.aclose()
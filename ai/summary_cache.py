@@ -0,0 +1,91 @@
+import hashlib
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from .models import SummaryCache
+from .services import SUMMARY_PROMPT_VERSION
+
+
+def normalize_content(content):
+    """规范化正文：合并连续空白，只改动空白的重复请求也能命中"""
+    return ' '.join(content.split())
+
+
+def summary_key(content, max_length, model=None, stage=None):
+    """
+    缓存键：提示词版本、模型、摘要长度和正文任一变化都会得到新键
+    :param stage: 长文章分段摘要的中间结果（如 'chunk'）与全文摘要分开缓存
+    """
+    model = model or settings.AI_MODEL
+    raw = f'{SUMMARY_PROMPT_VERSION}\n{model}\n{max_length}\n{normalize_content(content)}'
+    if stage:
+        raw = f'{stage}\n{raw}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'AI_SUMMARY_CACHE_TTL', 7 * 24 * 3600))
+
+
+def get_summary(content, max_length, stage=None):
+    """
+    查询缓存的摘要，未命中或已过期返回 None
+    命中时刷新最近使用时间，供淘汰时参考
+    """
+    key = summary_key(content, max_length, stage=stage)
+    entry = (
+        SummaryCache.objects
+        .filter(key=key, created_at__gt=timezone.now() - _ttl())
+        .values_list('summary', flat=True)
+        .first()
+    )
+    if entry is not None:
+        SummaryCache.objects.filter(key=key).update(last_used_at=timezone.now(), hits=F('hits') + 1)
+    return entry
+
+
+def set_summary(content, max_length, summary, stage=None):
+    """
+    写入缓存（同一内容覆盖旧值）
+    平均每 AI_SUMMARY_CACHE_PRUNE_EVERY 次写入执行一次淘汰，不在每次写入时统计整张表；
+    也可以由定时任务执行 prune_summary_cache 命令
+    """
+    key = summary_key(content, max_length, stage=stage)
+    now = timezone.now()
+    try:
+        SummaryCache.objects.update_or_create(
+            key=key,
+            defaults={
+                'model': settings.AI_MODEL,
+                'summary': summary,
+                'created_at': now,
+                'last_used_at': now,
+            },
+        )
+    except IntegrityError:
+        # 并发请求同时写入同一内容，保留先写入的即可
+        pass
+    every = getattr(settings, 'AI_SUMMARY_CACHE_PRUNE_EVERY', 100)
+    if every <= 1 or random.random() < 1 / every:
+        prune()
+
+
+def prune():
+    """
+    淘汰缓存：删除过期条目；条目数超过上限时，按最近使用时间删除最久未用的
+    :return: 删除的条目数
+    """
+    deleted, _ = SummaryCache.objects.filter(created_at__lte=timezone.now() - _ttl()).delete()
+
+    max_entries = getattr(settings, 'AI_SUMMARY_CACHE_MAX_ENTRIES', 10000)
+    overflow = SummaryCache.objects.count() - max_entries
+    if overflow > 0:
+        stale = list(
+            SummaryCache.objects.order_by('last_used_at')
+            .values_list('key', flat=True)[:overflow]
+        )
+        deleted += SummaryCache.objects.filter(key__in=stale).delete()[0]
+    return deleted
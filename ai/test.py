@@ -1,14 +1,47 @@
+import asyncio
 import json
+import os
+import signal
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
 from unittest.mock import patch
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from asgiref.sync import sync_to_async
+from django.db import OperationalError, connection
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import ChatSession, ChatMessage, AIUsageLog
+from blog.models import Post
+from blog.related import update_related_many
+from .checks import check_quota_cache
+from .clients import aclose_clients, close_clients, get_async_client, get_client
+from .metrics import latency_stats, percentile
+from .context import build_context, estimate_tokens, refresh_summary, schedule_refresh
+from .models import ChatSession, ChatMessage, AIUsageLog, AIUsageRollup, SummaryCache
+from .map_reduce import split_content
+from .rollups import roll_up
+from . import context, map_reduce, quotas
+from .services import AIService
+from .singleflight import SingleFlight
+from .sse import HEARTBEAT, acoalesce, coalesce
+from .views import chat_stream_async
+from .write_behind import write_behind
+from . import summary_cache
 
 User = get_user_model()
 
 
+@override_settings(AI_WRITE_BEHIND_INTERVAL=0)
 class AIAPITests(TestCase):
     """AI模块接口测试"""
     
@@ -25,6 +58,10 @@ class AIAPITests(TestCase):
         self.client.credentials(
             HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}'
         )
+
+    def tearDown(self):
+        # 写缓冲区是进程级的，不把本用例的记录留给下一个用例
+        write_behind.flush()
     
     # ========== 测试会话创建 ==========
     
@@ -61,6 +98,7 @@ class AIAPITests(TestCase):
         # 会话数不变
         self.assertEqual(ChatSession.objects.count(), 1)
         # 用户消息已保存
+        write_behind.flush()
         self.assertEqual(ChatMessage.objects.filter(role='user').count(), 1)
     
     def test_cannot_access_others_session(self):
@@ -115,10 +153,76 @@ class AIAPITests(TestCase):
         self.assertEqual(response.data['summary'], '这是摘要')
         
         # 验证日志记录
+        write_behind.flush()
         log = AIUsageLog.objects.first()
         self.assertEqual(log.call_type, 'summarize')
         self.assertTrue(log.success)
     
+    @patch('ai.views.AIService.generate_summary')
+    def test_repeat_summary_served_from_cache(self, mock_generate_summary):
+        """测试：相同正文重复生成摘要时命中缓存，不再调用模型"""
+        mock_generate_summary.return_value = '这是摘要'
+        data = {'content': '这是一篇很长的文章...', 'max_length': 50}
+
+        self.client.post('/api/ai/summarize/', data, format='json')
+        # 只有空白不同的正文同样命中
+        response = self.client.post(
+            '/api/ai/summarize/',
+            {'content': '  这是一篇很长的文章...\n', 'max_length': '50'},
+            format='json'
+        )
+
+        self.assertEqual(response.data, {'summary': '这是摘要', 'cached': True})
+        self.assertEqual(mock_generate_summary.call_count, 1)
+        write_behind.flush()
+        hit = AIUsageLog.objects.get(cache_hit=True)
+        self.assertEqual(hit.total_tokens, 0)
+
+        # 摘要长度不同，重新生成
+        self.client.post('/api/ai/summarize/', dict(data, max_length=100), format='json')
+        self.assertEqual(mock_generate_summary.call_count, 2)
+
+    @patch('ai.views.summary_flight.do', return_value=('并发请求生成的摘要', True))
+    def test_summary_shared_with_concurrent_request(self, mock_do):
+        """测试：共享并发请求的结果时不调用模型，按命中缓存记录"""
+        response = self.client.post('/api/ai/summarize/', {'content': '同一篇文章'}, format='json')
+
+        self.assertEqual(response.data, {'summary': '并发请求生成的摘要', 'cached': True})
+        write_behind.flush()
+        log = AIUsageLog.objects.get()
+        self.assertTrue(log.cache_hit)
+        self.assertEqual(log.total_tokens, 0)
+
+    @override_settings(AI_SUMMARY_CACHE_MAX_ENTRIES=2, AI_SUMMARY_CACHE_PRUNE_EVERY=1)
+    def test_summary_cache_eviction(self):
+        """测试：超出容量时淘汰最久未用的条目，过期条目不再命中"""
+        summary_cache.set_summary('文章一', 200, '摘要一')
+        summary_cache.set_summary('文章二', 200, '摘要二')
+        summary_cache.get_summary('文章一', 200)
+        summary_cache.set_summary('文章三', 200, '摘要三')
+
+        self.assertEqual(SummaryCache.objects.count(), 2)
+        self.assertIsNone(summary_cache.get_summary('文章二', 200))
+        self.assertEqual(summary_cache.get_summary('文章一', 200), '摘要一')
+
+        with override_settings(AI_SUMMARY_CACHE_TTL=0):
+            self.assertIsNone(summary_cache.get_summary('文章一', 200))
+
+    @override_settings(AI_SUMMARY_CACHE_MAX_ENTRIES=1, AI_SUMMARY_CACHE_PRUNE_EVERY=1000)
+    def test_summary_cache_prune_sampled(self):
+        """测试：写入时只抽样淘汰，其余由 prune_summary_cache 命令完成"""
+        with patch('ai.summary_cache.random.random', return_value=0.5), \
+                CaptureQueriesContext(connection) as queries:
+            summary_cache.set_summary('文章一', 200, '摘要一')
+            summary_cache.set_summary('文章二', 200, '摘要二')
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        self.assertEqual(SummaryCache.objects.count(), 2)
+
+        out = StringIO()
+        call_command('prune_summary_cache', stdout=out)
+        self.assertIn('已删除 1 条', out.getvalue())
+        self.assertEqual(SummaryCache.objects.count(), 1)
+
     def test_summary_empty_content_error(self):
         """测试：空文章内容返回400"""
         response = self.client.post(
@@ -145,6 +249,11 @@ class AIAPITests(TestCase):
         
         self.assertEqual(response.status_code, 401)
     
+    def test_rejects_non_object_body(self):
+        """测试：请求体不是 JSON 对象时返回 400"""
+        for url in ('/api/ai/summarize/', '/api/ai/chat/'):
+            self.assertEqual(self.client.post(url, ['你好'], format='json').status_code, 400)
+
     def test_summary_requires_auth(self):
         """测试：未登录不能访问摘要接口"""
         self.client.credentials()
@@ -156,3 +265,1029 @@ class AIAPITests(TestCase):
         )
         
         self.assertEqual(response.status_code, 401)
+
+
+class ChatHistoryAPITests(TestCase):
+    """会话列表和会话消息接口测试"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_sessions_by_activity(self):
+        """测试：会话按最近活跃倒序，游标翻页不重复不遗漏，看不到他人的会话"""
+        sessions = [ChatSession.objects.create(user=self.user, title=f'会话{i}') for i in range(5)]
+        ChatSession.objects.create(user=self.other, title='他人的会话')
+        # 旧会话有了新消息，排到最前
+        ChatSession.objects.filter(pk=sessions[0].pk).update(updated_at=timezone.now())
+
+        response = self.client.get('/api/ai/sessions/', {'page_size': 3, 'with_count': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 5)
+        ids = [s['id'] for s in response.data['sessions']]
+        self.assertNotIn('summary', response.data['sessions'][0])
+
+        response = self.client.get(response.data['next'])
+        ids += [s['id'] for s in response.data['sessions']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(ids, [sessions[0].id] + [s.id for s in reversed(sessions[1:])])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([s['id'] for s in response.data['sessions']], ids[:3])
+
+    def test_messages_newest_first(self):
+        """测试：消息从最新往前翻页"""
+        session = ChatSession.objects.create(user=self.user)
+        messages = [ChatMessage.objects.create(session=session, role='user', content=f'消息{i}') for i in range(7)]
+
+        response = self.client.get(f'/api/ai/sessions/{session.id}/messages/', {'page_size': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['content'] for m in response.data['messages']], ['消息6', '消息5', '消息4', '消息3'])
+        self.assertIsNone(response.data['count'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([m['id'] for m in response.data['messages']], [m.id for m in reversed(messages[:3])])
+        self.assertIsNone(response.data['next'])
+
+    def test_messages_of_others(self):
+        """测试：不能查看他人的会话消息，无效游标返回 404"""
+        session = ChatSession.objects.create(user=self.other)
+        self.assertEqual(self.client.get(f'/api/ai/sessions/{session.id}/messages/').status_code, 404)
+
+        own = ChatSession.objects.create(user=self.user)
+        response = self.client.get(f'/api/ai/sessions/{own.id}/messages/', {'cursor': 'bad'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_requires_auth(self):
+        """测试：未登录不能查看会话"""
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get('/api/ai/sessions/').status_code, 401)
+
+
+class UsageRollupTests(TestCase):
+    """AI 用量汇总与报表测试"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.admin = User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.client = APIClient()
+        self.now = timezone.now()
+
+    def log(self, user, hours_ago, tokens=10, call_type='chat', success=True):
+        log = AIUsageLog.objects.create(
+            user=user, call_type=call_type, model='test-model', prompt_summary='测试',
+            prompt_tokens=tokens, completion_tokens=tokens, total_tokens=tokens * 2,
+            response_time_ms=100, success=success,
+        )
+        # created_at 为 auto_now_add，创建后再改
+        AIUsageLog.objects.filter(pk=log.pk).update(created_at=self.now - timedelta(hours=hours_ago))
+        return log
+
+    def rollup(self, period, user):
+        return AIUsageRollup.objects.filter(period=period, user=user).order_by('period_start')
+
+    def test_incremental(self):
+        """测试：按小时和天累加，再次执行只累加新日志"""
+        self.log(self.user, 1)
+        self.log(self.user, 1, success=False)
+        self.log(self.user, 30, tokens=5)
+        self.assertEqual(roll_up(), 3)
+
+        hours = self.rollup('hour', self.user)
+        self.assertEqual([r.calls for r in hours], [1, 2])
+        self.assertEqual(hours[1].success_calls, 1)
+        self.assertEqual(sum(r.total_tokens for r in self.rollup('day', self.user)), 50)
+
+        self.assertEqual(roll_up(), 0)
+        self.log(self.user, 1)
+        self.assertEqual(roll_up(batch_size=1), 1)
+        self.assertEqual(self.rollup('hour', self.user).last().calls, 3)
+        self.assertEqual(sum(r.calls for r in self.rollup('day', self.user)), 4)
+
+    def test_lag(self):
+        """测试：刚写入的日志等到超过延迟后再汇总，之后的日志也不越过它"""
+        self.log(self.user, 2)
+        recent = self.log(self.user, 0)
+        AIUsageLog.objects.filter(pk=recent.pk).update(created_at=timezone.now())
+        self.log(self.user, 3)
+        self.assertEqual(roll_up(), 1)
+        with override_settings(AI_USAGE_ROLLUP_LAG=0):
+            self.assertEqual(roll_up(), 2)
+        self.assertEqual(sum(r.calls for r in self.rollup('day', self.user)), 3)
+
+    def test_report(self):
+        """测试：报表只读汇总表，普通用户只看到自己的用量"""
+        self.log(self.user, 1)
+        self.log(self.other, 1)
+        roll_up()
+        self.log(self.user, 1)   # 未汇总，不出现在报表中
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/ai/usage/', {'user_id': self.other.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['username'] for row in response.data['rows']], ['testuser'])
+        self.assertEqual(response.data['totals']['calls'], 1)
+        self.assertIsNotNone(response.data['data_until'])
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/api/ai/usage/', {'period': 'hour'})
+        self.assertEqual(response.data['totals']['calls'], 2)
+        response = self.client.get('/api/ai/usage/', {'user_id': self.other.id, 'call_type': 'chat'})
+        self.assertEqual([row['user_id'] for row in response.data['rows']], [self.other.id])
+
+    def test_report_params(self):
+        """测试：参数校验"""
+        self.client.force_authenticate(user=self.user)
+        for params in ({'period': 'week'}, {'start': '2024-13-01'}, {'start': '2024-01-02', 'end': '2024-01-01'},
+                       {'period': 'hour', 'start': '2024-01-01', 'end': '2024-03-01'}):
+            self.assertEqual(self.client.get('/api/ai/usage/', params).status_code, 400, params)
+
+    def test_command(self):
+        """测试：汇总命令"""
+        self.log(self.user, 1)
+        out = StringIO()
+        call_command('rollup_ai_usage', stdout=out)
+        self.assertIn('已汇总 1 条', out.getvalue())
+
+
+@override_settings(AI_QUOTAS={
+    'default': {'requests_per_minute': 2, 'tokens_per_day': 100},
+    'vip': {'requests_per_minute': 5, 'tokens_per_day': 0},
+}, AI_WRITE_BEHIND_INTERVAL=0)
+class QuotaTests(TestCase):
+    """用户配额测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        write_behind.flush()
+
+    def test_requests_per_minute(self):
+        """测试：超出每分钟请求数后拒绝，被拒绝的请求不计数，缓存组信息后不查数据库"""
+        self.assertIsNone(quotas.check(self.user))
+        self.assertIsNone(quotas.check(self.user))
+        with self.assertNumQueries(0):
+            retry_after = quotas.check(self.user)
+        self.assertTrue(1 <= retry_after <= 60)
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.assertIsNone(quotas.check(other))
+
+    def test_group_limits(self):
+        """测试：取所属组中最宽松的配额，0 表示不限"""
+        self.user.groups.add(Group.objects.create(name='vip'))
+        self.assertEqual(quotas.limits_for(self.user), {'requests_per_minute': 5, 'tokens_per_day': None})
+        staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.assertEqual(quotas.limits_for(staff), {'requests_per_minute': 2, 'tokens_per_day': 100})
+
+    def test_tokens_per_day(self):
+        """测试：当日 token 用完后拒绝到第二天"""
+        quotas.charge(self.user, 60)
+        self.assertIsNone(quotas.check(self.user))
+        quotas.charge(self.user, 60)
+        self.assertGreater(quotas.check(self.user), 0)
+
+    @patch('ai.views.AIService.generate_summary', return_value='摘要')
+    def test_view_returns_429(self, generate):
+        """测试：接口超出配额返回 429 和 Retry-After，不调用模型"""
+        for i in range(2):
+            self.assertEqual(self.client.post('/api/ai/summarize/', {'content': f'正文{i}'}).status_code, 200)
+        response = self.client.post('/api/ai/summarize/', {'content': '正文3'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(generate.call_count, 2)
+
+    def test_warns_without_shared_cache(self):
+        """测试：非调试模式下配额计数存放在进程内缓存时，系统检查给出警告"""
+        with override_settings(DEBUG=False):
+            self.assertEqual([w.id for w in check_quota_cache(None)], ['ai.W001'])
+            with override_settings(AI_QUOTA_CACHE='shared', CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                           'LOCATION': tempfile.gettempdir()},
+            }):
+                self.assertEqual(check_quota_cache(None), [])
+
+
+def fake_summarize_chunk(self, chunk, max_length=300):
+    self.last_usage = SimpleNamespace(prompt_tokens=len(chunk), completion_tokens=1, total_tokens=len(chunk) + 1)
+    return f'概括{chunk[:3]}'
+
+
+def fake_merge_summaries(self, summaries, max_length=200):
+    self.last_usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+    return '合并：' + '|'.join(summaries)
+
+
+@override_settings(AI_SUMMARY_CHUNK_SIZE=300, AI_SUMMARY_CONCURRENCY=3)
+@patch('ai.services.AIService.merge_summaries', fake_merge_summaries)
+@patch('ai.services.AIService.summarize_chunk', fake_summarize_chunk)
+class MapReduceSummaryTests(TestCase):
+    """长文章分段摘要测试"""
+
+    def article(self, edited=None):
+        paragraphs = [f'第{i:02d}段' + '内容' * (5 + i * 7 % 15) + '。' for i in range(40)]
+        if edited is not None:
+            paragraphs[edited] = paragraphs[edited].replace('内容', '修改', 1)
+        return '\n\n'.join(paragraphs)
+
+    def test_split_on_paragraphs(self):
+        """测试：按段落切分，每段不超过上限，超长段落按句子切开"""
+        content = self.article()
+        chunks = split_content(content)
+        self.assertGreater(len(chunks), 1)
+        # 段内段落之间的空行不计入字数
+        self.assertTrue(all(len(chunk.replace('\n', '')) <= 300 for chunk in chunks))
+        self.assertEqual(''.join(chunks).replace('\n', ''), content.replace('\n', ''))
+
+        long_paragraph = '很长的句子。' * 150
+        pieces = split_content(long_paragraph)
+        self.assertTrue(all(len(piece) <= 300 and piece.endswith('。') for piece in pieces))
+
+    def test_map_reduce(self):
+        """测试：各段概括后合并，token 用量为所有调用之和"""
+        ai = AIService()
+        chunks = split_content(self.article())
+        summary = map_reduce.summarize(ai, self.article(), 200)
+        self.assertEqual(summary.count('|'), len(chunks) - 1)
+        self.assertTrue(summary.startswith('合并：概括第00'))
+        self.assertEqual(ai.last_usage.total_tokens, sum(len(c) + 1 for c in chunks) + 15)
+
+    def test_edit_one_section(self):
+        """测试：修改一段后只重新概括包含它的分段"""
+        map_reduce.summarize(AIService(), self.article(), 200)
+        calls = []
+        with patch('ai.services.AIService.summarize_chunk', lambda s, c, l=300: calls.append(c) or fake_summarize_chunk(s, c)):
+            map_reduce.summarize(AIService(), self.article(edited=20), 200)
+        self.assertEqual(len(calls), 1)
+        self.assertIn('第20段修改', calls[0])
+
+    @patch('ai.services.AIService.generate_summary', return_value='短摘要')
+    def test_short_content(self, generate):
+        """测试：短文章直接摘要"""
+        self.assertEqual(map_reduce.summarize(AIService(), '一段短文。', 200), '短摘要')
+
+    def test_failed_chunk(self):
+        """测试：某段失败时抛出异常，已完成的分段仍然缓存"""
+        def flaky(service, chunk, max_length=300):
+            if '第05段' in chunk:
+                raise TimeoutError('超时')
+            return fake_summarize_chunk(service, chunk)
+
+        content = self.article()
+        with patch('ai.services.AIService.summarize_chunk', flaky), self.assertRaises(TimeoutError):
+            map_reduce.summarize(AIService(), content, 200)
+        chunks = split_content(content)
+        cached = [summary_cache.get_summary(chunk, 300, stage='chunk') for chunk in chunks]
+        self.assertEqual(sum(c is None for c in cached), 1)
+
+
+    def test_concurrency_shared_across_calls(self):
+        """测试：多篇文章同时分段摘要时，分段调用合计不超过 AI_SUMMARY_CONCURRENCY"""
+        lock = threading.Lock()
+        active, peak = [0], [0]
+
+        def task(service):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+        threads = [
+            threading.Thread(target=map_reduce._run_parallel, args=(AIService(), [task] * 3, Counter()))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 3)
+
+
+class AIClientRegistryTests(SimpleTestCase):
+    """进程级 OpenAI 客户端注册表测试"""
+
+    def tearDown(self):
+        close_clients()
+
+    def test_client_shared_per_config(self):
+        """测试：相同配置共用客户端，超时或地址不同时分开"""
+        self.assertIs(AIService(timeout=30).client, AIService(timeout=30).client)
+        self.assertIsNot(get_client(30), get_client(60))
+        default = get_client(30)
+        with override_settings(AI_BASE_URL='http://127.0.0.1:9/v1'):
+            self.assertIsNot(AIService(timeout=30).client, default)
+
+    def test_close_clients(self):
+        """测试：关闭后重新获取会创建新客户端"""
+        client = get_client(30)
+        close_clients()
+        self.assertTrue(client.is_closed())
+        self.assertIsNot(get_client(30), client)
+
+
+    def test_close_async_clients(self):
+        """测试：异步客户端在所属事件循环中关闭，之后重新创建"""
+        async def run():
+            client = get_async_client(60)
+            await aclose_clients()
+            self.assertTrue(client.is_closed())
+            self.assertIsNot(get_async_client(60), client)
+
+        asyncio.run(run())
+
+        # 事件循环仍可用时，进程退出的 close_clients 也会关闭异步客户端
+        loop = asyncio.new_event_loop()
+        try:
+            client = loop.run_until_complete(current_async_client(60))
+            close_clients()
+            self.assertTrue(client.is_closed())
+        finally:
+            loop.close()
+
+async def current_async_client(timeout):
+    return get_async_client(timeout)
+
+
+async def fake_achat_stream(self, messages):
+    self.first_token_ms = 5
+    for text in ['你', '好']:
+        yield text
+    self.last_usage = SimpleNamespace(prompt_tokens=10, completion_tokens=2, total_tokens=12)
+
+
+@override_settings(AI_WRITE_BEHIND_INTERVAL=0)
+class AsyncChatStreamTests(TestCase):
+    """异步流式对话接口测试"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.factory = AsyncRequestFactory()
+
+    def tearDown(self):
+        write_behind.flush()
+
+    def post(self, data, token=None):
+        headers = {'Authorization': f'Bearer {token or self.token}'} if token != '' else {}
+        request = self.factory.post('/api/ai/chat/', data, content_type='application/json', headers=headers)
+        return chat_stream_async(request)
+
+    async def read_events(self, response):
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return [json.loads(line[6:]) for line in body.split('\n\n') if line]
+
+    @patch('ai.views.AIService.achat_stream', fake_achat_stream)
+    async def test_stream_and_save(self):
+        """测试：流式返回回复，结束后保存消息和日志"""
+        response = await self.post({'message': '你好'})
+        events = await self.read_events(response)
+
+        # 相邻片段可能合并成一帧
+        self.assertEqual([events[0]['type'], events[-1]['type']], ['session', 'done'])
+        self.assertEqual(''.join(e['text'] for e in events if e['type'] == 'content'), '你好')
+        session = await ChatSession.objects.aget(pk=events[0]['session_id'])
+        self.assertEqual(session.title, '你好')
+        await sync_to_async(write_behind.flush)()
+        reply = await ChatMessage.objects.aget(session=session, role='assistant')
+        self.assertEqual(reply.content, '你好')
+        self.assertEqual(reply.completion_tokens, 2)
+        log = await AIUsageLog.objects.afirst()
+        self.assertTrue(log.success)
+        self.assertEqual((log.prompt_tokens, log.total_tokens, log.first_token_ms), (10, 12, 5))
+
+    @override_settings(AI_QUOTAS={'default': {'requests_per_minute': 1, 'tokens_per_day': 0}})
+    @patch('ai.views.AIService.achat_stream', fake_achat_stream)
+    async def test_quota(self):
+        """测试：超出配额返回 429，不调用模型"""
+        await sync_to_async(cache.clear)()
+        response = await self.post({'message': '你好'})
+        await self.read_events(response)
+        response = await self.post({'message': '再来一次'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    async def test_requires_auth(self):
+        """测试：未登录或 token 无效返回 401"""
+        self.assertEqual((await self.post({'message': '你好'}, token='')).status_code, 401)
+        self.assertEqual((await self.post({'message': '你好'}, token='bad')).status_code, 401)
+
+    async def test_rejects_non_object_body(self):
+        """测试：请求体是 JSON 数组或字符串时返回 400"""
+        for body in (['你好'], '"你好"', '1'):
+            self.assertEqual((await self.post(body)).status_code, 400)
+
+    async def test_cannot_access_others_session(self):
+        """测试：不能使用其他用户的会话"""
+        other = await User.objects.acreate_user(username='other', password='pass123')
+        session = await ChatSession.objects.acreate(user=other, title='别人的会话')
+        response = await self.post({'session_id': session.id, 'message': '你好'})
+        events = await self.read_events(response)
+        self.assertEqual(events[0]['message'], '会话不存在或无权限')
+
+
+class FakeSummarizer:
+    """模拟会话摘要：记录调用次数，返回固定长度的摘要"""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def summarize_conversation(self, summary, messages, max_length=300):
+        if self.fail:
+            raise TimeoutError('生成会话摘要超时')
+        self.calls.append(messages)
+        return '摘要' * 20
+
+
+@override_settings(AI_CHAT_CONTEXT_TOKENS=300, AI_WRITE_BEHIND_INTERVAL=0)
+class ChatContextTests(TestCase):
+    """对话上下文构建测试"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.session = ChatSession.objects.create(user=self.user, title='长对话')
+
+    def add_turn(self, i):
+        ChatMessage.objects.create(session=self.session, role='user', content=f'第{i}个问题' + '问' * 40)
+        ChatMessage.objects.create(session=self.session, role='assistant', content=f'第{i}个回答' + '答' * 60)
+
+    def prompt_tokens(self, messages):
+        return sum(estimate_tokens(m['content']) for m in messages)
+
+    def test_estimate_tokens(self):
+        """测试：中文按字、其他文本按 4 字符估算"""
+        self.assertEqual(estimate_tokens('你好'), 2)
+        self.assertEqual(estimate_tokens('hello world!'), 3)
+        self.assertEqual(estimate_tokens(''), 0)
+
+    def test_prompt_size_plateaus(self):
+        """测试：长会话的提示词长度稳定在预算内，早期对话进入滚动摘要"""
+        ai = FakeSummarizer()
+        sizes = []
+        for i in range(30):
+            self.add_turn(i)
+            messages, needs_refresh = build_context(self.session)
+            sizes.append(self.prompt_tokens(messages))
+            if needs_refresh:
+                self.assertTrue(refresh_summary(self.session, ai))
+
+        self.assertLessEqual(max(sizes), 300)
+        # 每次折叠到预算的一半，不必每轮都生成摘要
+        self.assertLess(len(ai.calls), 30)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary, '摘要' * 20)
+
+        messages, _ = build_context(self.session)
+        self.assertEqual(messages[0]['role'], 'system')
+        self.assertIn('摘要', messages[0]['content'])
+        self.assertTrue(messages[-1]['content'].startswith('第29个回答'))
+        # 已并入摘要的消息不再重复发送
+        folded = {m['content'] for batch in ai.calls for m in batch}
+        self.assertFalse(folded & {m['content'] for m in messages})
+
+    def test_refresh_failure_keeps_state(self):
+        """测试：生成摘要失败时保持原状"""
+        for i in range(5):
+            self.add_turn(i)
+        self.assertFalse(refresh_summary(self.session, FakeSummarizer(fail=True)))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary_until_id, 0)
+
+    def test_context_includes_buffered_messages(self):
+        """测试：写缓冲区中尚未落库的消息同样进入上下文，且不会重复"""
+        self.add_turn(0)
+        write_behind.add(ChatMessage(session=self.session, role='user', content='还没落库的问题'))
+        messages, _ = build_context(self.session)
+        self.assertEqual(messages[-1]['content'], '还没落库的问题')
+
+        write_behind.flush()
+        messages, _ = build_context(self.session)
+        self.assertEqual([m['content'] for m in messages].count('还没落库的问题'), 1)
+
+
+def fake_summarize_conversation(self, summary, messages, max_length=300):
+    self.last_usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20, total_tokens=120)
+    return '后台摘要'
+
+
+@override_settings(AI_CHAT_CONTEXT_TOKENS=300, AI_WRITE_BEHIND_INTERVAL=0)
+class ChatSummaryRefreshTests(TransactionTestCase):
+    """会话摘要后台刷新测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.session = ChatSession.objects.create(user=self.user, title='长对话')
+
+    def tearDown(self):
+        write_behind.flush()
+
+    @patch('ai.services.AIService.summarize_conversation', fake_summarize_conversation)
+    def test_background_refresh_logs_usage(self):
+        """测试：摘要在后台线程中生成，调用记入日志和当日 token 配额"""
+        for i in range(10):
+            ChatMessage.objects.create(session=self.session, role='user', content=f'第{i}个问题' + '问' * 60)
+        future = schedule_refresh(self.session, self.user)
+        self.assertIsNone(schedule_refresh(self.session, self.user))
+        self.assertTrue(future.result(timeout=10))
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary, '后台摘要')
+        write_behind.flush()
+        log = AIUsageLog.objects.get()
+        self.assertTrue(log.prompt_summary.startswith('[会话摘要]'))
+        self.assertEqual(log.total_tokens, 120)
+        self.assertEqual(quotas._cache().get(f'ai:quota:tpd:{self.user.pk}:{timezone.localdate().isoformat()}'), 120)
+
+    @patch('ai.views.AIService.achat_stream', fake_achat_stream)
+    async def test_async_stream_ends_before_refresh(self):
+        """测试：异步视图发送 done 后立即结束响应，摘要在独立任务中生成并记录用量"""
+        for i in range(10):
+            await ChatMessage.objects.acreate(session=self.session, role='user', content=f'第{i}个问题' + '问' * 60)
+        release = asyncio.Event()
+
+        async def summarize(ai, summary, messages, max_length=300):
+            await release.wait()
+            return fake_summarize_conversation(ai, summary, messages, max_length)
+
+        token = str(RefreshToken.for_user(self.user).access_token)
+        request = AsyncRequestFactory().post(
+            '/api/ai/chat/', {'session_id': self.session.pk, 'message': '继续'},
+            content_type='application/json', headers={'Authorization': f'Bearer {token}'},
+        )
+        with patch('ai.services.AIService.asummarize_conversation', summarize):
+            response = await chat_stream_async(request)
+            body = await asyncio.wait_for(self.read_body(response), timeout=5)
+            self.assertTrue(body.endswith(f"data: {json.dumps({'type': 'done', 'has_error': False})}\n\n"))
+            await self.session.arefresh_from_db()
+            self.assertEqual(self.session.summary, '')
+
+            release.set()
+            self.assertEqual(await asyncio.gather(*context._refresh_tasks), [True])
+
+        await self.session.arefresh_from_db()
+        self.assertEqual(self.session.summary, '后台摘要')
+        await sync_to_async(write_behind.flush)()
+        log = await AIUsageLog.objects.filter(prompt_summary__startswith='[会话摘要]').aget()
+        self.assertEqual(log.total_tokens, 120)
+
+    async def read_body(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    def test_flush_only_session_messages(self):
+        """测试：刷新摘要前只写入本会话缓冲中的消息"""
+        other = ChatSession.objects.create(user=self.user, title='另一个会话')
+        write_behind.add(ChatMessage(session=self.session, role='user', content='本会话'))
+        write_behind.add(ChatMessage(session=other, role='user', content='其他会话'))
+        self.assertEqual(write_behind.flush(ChatMessage, session_id=self.session.pk), 1)
+        self.assertEqual(write_behind.size(), 1)
+        self.assertEqual(list(ChatMessage.objects.values_list('content', flat=True)), ['本会话'])
+
+
+class SummarizePostsCommandTests(TestCase):
+    """summarize_posts 命令测试"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.posts = [
+            Post.objects.create(
+                title=f'文章{i}', content=f'第{i}篇文章的正文', excerpt='' if i % 2 else '手写的摘要内容足够长',
+                author=self.user, status='published'
+            )
+            for i in range(6)
+        ]
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'progress.json')
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('summarize_posts', '--checkpoint', self.checkpoint, '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    @patch('ai.management.commands.summarize_posts.AIService.generate_summary')
+    def test_only_empty(self, mock_generate_summary):
+        """测试：只为空摘要的文章生成摘要，完成后删除进度文件"""
+        mock_generate_summary.side_effect = lambda content, max_length: f'AI摘要：{content}'
+        output = self.run_command('--only-empty', '--concurrency', '3')
+
+        self.assertIn('成功 3 篇', output)
+        self.assertIn('篇/分钟', output)
+        for post in self.posts:
+            post.refresh_from_db()
+            expected = f'AI摘要：{post.content}' if int(post.title[-1]) % 2 else '手写的摘要内容足够长'
+            self.assertEqual(post.excerpt, expected)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    @patch('ai.management.commands.summarize_posts.AIService.generate_summary')
+    def test_updates_related_posts(self, mock_generate_summary):
+        """测试：写回摘要后与保存信号一样更新相关文章"""
+        mock_generate_summary.side_effect = lambda content, max_length: f'AI摘要：{content}'
+        with patch('ai.management.commands.summarize_posts.update_related_many',
+                   wraps=update_related_many) as update:
+            self.run_command('--only-empty')
+        updated = [post.pk for call in update.call_args_list for post in call.args[0]]
+        self.assertEqual(sorted(updated), [post.pk for post in self.posts if int(post.title[-1]) % 2])
+
+    @patch('ai.management.commands.summarize_posts.AIService.generate_summary')
+    def test_resume_and_retry_failed(self, mock_generate_summary):
+        """测试：失败的文章记入进度文件，重新执行时从断点继续并可重试失败项"""
+        failing = self.posts[1].content
+
+        def generate(content, max_length):
+            if content == failing:
+                raise TimeoutError('生成摘要超时')
+            return f'AI摘要：{content}'
+
+        mock_generate_summary.side_effect = generate
+        output = self.run_command('--retries', '0')
+        self.assertIn('失败 1 篇', output)
+        with open(self.checkpoint, encoding='utf-8') as f:
+            progress = json.load(f)
+        self.assertEqual(progress['last_id'], self.posts[-1].id)
+        self.assertEqual(list(progress['failed']), [str(self.posts[1].id)])
+
+        # 断点之后没有新文章，不传 --retry-failed 时什么也不做
+        self.assertIn('待处理文章 0 篇', self.run_command())
+
+        mock_generate_summary.side_effect = lambda content, max_length: '重试成功的摘要'
+        self.run_command('--retry-failed')
+        self.posts[1].refresh_from_db()
+        self.assertEqual(self.posts[1].excerpt, '重试成功的摘要')
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+
+class WriteBehindTests(TransactionTestCase):
+    """写缓冲区测试：记录在并发写入、刷新失败和进程退出时都不丢失"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def tearDown(self):
+        write_behind.stop()
+
+    def log(self, i):
+        return AIUsageLog(user=self.user, call_type='chat', prompt_summary=f'第{i}次调用', success=True)
+
+    @override_settings(AI_WRITE_BEHIND_INTERVAL=1, AI_WRITE_BEHIND_MAX_SIZE=50)
+    def test_concurrent_writes_not_lost(self):
+        """测试：多线程并发排队，后台线程按数量和时间刷新，退出时写完剩余记录"""
+        def worker(n):
+            for i in range(250):
+                write_behind.add(self.log(n * 1000 + i))
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 模拟进程退出
+        write_behind.stop()
+
+        self.assertEqual(write_behind.size(), 0)
+        self.assertEqual(AIUsageLog.objects.count(), 2000)
+        self.assertEqual(AIUsageLog.objects.values('prompt_summary').distinct().count(), 2000)
+
+    @override_settings(AI_WRITE_BEHIND_INTERVAL=0)
+    def test_failed_flush_requeues(self):
+        """测试：数据库不可用时记录放回队列，恢复后写入"""
+        for i in range(5):
+            write_behind.add(self.log(i))
+
+        with patch('django.db.models.query.QuerySet.bulk_create', side_effect=OperationalError), \
+                patch('django.db.models.Model.save_base', side_effect=OperationalError):
+            with self.assertRaises(RuntimeError), self.assertLogs('ai.write_behind', 'ERROR'):
+                write_behind.flush()
+        self.assertEqual(write_behind.size(), 5)
+        self.assertEqual(AIUsageLog.objects.count(), 0)
+
+        write_behind._flush_at_exit()
+        self.assertEqual(AIUsageLog.objects.count(), 5)
+
+    @override_settings(AI_WRITE_BEHIND_INTERVAL=0, AI_WRITE_BEHIND_MAX_SIZE=100, AI_WRITE_BEHIND_MAX_QUEUE=5)
+    def test_queue_capped(self):
+        """测试：数据库不可用时队列不超过上限，超出的记录丢弃并计数"""
+        dropped = write_behind.dropped
+        with self.assertLogs('ai.write_behind', 'ERROR'):
+            for i in range(8):
+                write_behind.add(self.log(i))
+        self.assertEqual(write_behind.size(), 5)
+        self.assertEqual(write_behind.dropped - dropped, 3)
+
+        # 刷新失败放回队首时，期间新加入的记录使队列超限，从最新的开始丢弃
+        def bulk_create(rows, **kwargs):
+            write_behind.add(self.log(100))
+            raise OperationalError
+
+        with patch('django.db.models.query.QuerySet.bulk_create', side_effect=bulk_create), \
+                patch('django.db.models.Model.save_base', side_effect=OperationalError):
+            with self.assertRaises(RuntimeError), self.assertLogs('ai.write_behind', 'ERROR'):
+                write_behind.flush()
+        self.assertEqual(write_behind.size(), 5)
+        self.assertEqual(write_behind.dropped - dropped, 4)
+
+        write_behind.flush()
+        self.assertEqual(sorted(AIUsageLog.objects.values_list('prompt_summary', flat=True)),
+                         [f'第{i}次调用' for i in range(5)])
+
+    @override_settings(AI_WRITE_BEHIND_INTERVAL=0)
+    def test_sigterm_during_flush(self):
+        """测试：SIGTERM 在主线程持有锁时到达不会死锁，退出时仍写完队列"""
+        write_behind.add(self.log(0))
+        with self.assertRaises(SystemExit) as cm:
+            with write_behind._lock, write_behind.hold():
+                write_behind._on_sigterm(signal.SIGTERM, None)
+        self.assertEqual(cm.exception.code, 128 + signal.SIGTERM)
+        self.assertEqual(write_behind.size(), 1)
+
+        write_behind._flush_at_exit()
+        self.assertEqual(AIUsageLog.objects.count(), 1)
+
+    @override_settings(AI_WRITE_BEHIND_MODE='sync')
+    def test_sync_mode(self):
+        """测试：sync 模式直接写库"""
+        write_behind.add(self.log(0))
+        self.assertEqual(write_behind.size(), 0)
+        self.assertEqual(AIUsageLog.objects.count(), 1)
+
+
+def stream_chunk(text=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=text))] if text is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FakeStream:
+    """模拟 openai 的 Stream：可迭代，with 结束时关闭"""
+
+    def __init__(self, chunks):
+        self.chunks, self.closed = chunks, False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+class UsageMetricsTests(TestCase):
+    """token 用量与延迟统计测试"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def test_stream_records_usage(self):
+        """测试：流式调用请求附带用量，记录最后一个片段的 token 用量和首个片段耗时"""
+        usage = SimpleNamespace(prompt_tokens=20, completion_tokens=3, total_tokens=23)
+        chunks = [stream_chunk('你'), stream_chunk('好'), stream_chunk(usage=usage)]
+        ai = AIService()
+        with patch.object(ai.client.chat.completions, 'create', return_value=FakeStream(chunks)) as create:
+            self.assertEqual(''.join(ai.chat_stream([{'role': 'user', 'content': '你好'}])), '你好')
+
+        self.assertEqual(create.call_args.kwargs['stream_options'], {'include_usage': True})
+        self.assertIs(ai.last_usage, usage)
+        self.assertIsNotNone(ai.first_token_ms)
+
+    def test_stream_closed_on_disconnect(self):
+        """测试：客户端断开（生成器被关闭）时立即关闭上游响应"""
+        stream = FakeStream([stream_chunk('你'), stream_chunk('好')])
+        ai = AIService()
+        with patch.object(ai.client.chat.completions, 'create', return_value=stream):
+            chunks = ai.chat_stream([{'role': 'user', 'content': '你好'}])
+            self.assertEqual(next(chunks), '你')
+            chunks.close()
+        self.assertTrue(stream.closed)
+
+    def test_percentiles_per_model(self):
+        """测试：按模型统计 p50/p95，失败和命中缓存的调用不计入"""
+        for ms in range(1, 101):
+            AIUsageLog.objects.create(user=self.user, call_type='chat', model='qwen-turbo', prompt_summary='',
+                                      response_time_ms=ms, first_token_ms=ms // 2, total_tokens=10)
+        AIUsageLog.objects.create(user=self.user, call_type='summarize', model='qwen-plus', prompt_summary='',
+                                  response_time_ms=800, completion_tokens=40, tokens_per_second=50)
+        AIUsageLog.objects.create(user=self.user, call_type='chat', model='qwen-turbo', prompt_summary='',
+                                  response_time_ms=60000, success=False)
+
+        stats = {item['model']: item for item in latency_stats()}
+        turbo = stats['qwen-turbo']
+        self.assertEqual((turbo['calls'], turbo['tokens']), (100, 1000))
+        self.assertEqual(turbo['response_time_ms'], {'p50': 50, 'p95': 95})
+        self.assertEqual(turbo['first_token_ms'], {'p50': 25, 'p95': 47})
+        self.assertEqual(turbo['tokens_per_second'], {'p50': None, 'p95': None})
+        self.assertEqual(stats['qwen-plus']['response_time_ms'], {'p50': 800, 'p95': 800})
+        self.assertEqual([item['model'] for item in latency_stats(call_type='chat')], ['qwen-turbo'])
+        self.assertEqual(percentile([], 50), None)
+
+    @override_settings(AI_LATENCY_STATS_SAMPLES=10)
+    def test_percentiles_sampled(self):
+        """测试：行数超过上限时按 id 抽样计算百分位，调用数和 token 数仍是精确值"""
+        AIUsageLog.objects.bulk_create([
+            AIUsageLog(user=self.user, call_type='chat', model='qwen-turbo', prompt_summary='',
+                       response_time_ms=ms, total_tokens=10)
+            for ms in range(1, 101)
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            [turbo] = latency_stats()
+        self.assertEqual(len(queries), 2)
+        self.assertEqual((turbo['calls'], turbo['tokens']), (100, 1000))
+        self.assertTrue(40 <= turbo['response_time_ms']['p50'] <= 60)
+        self.assertTrue(turbo['response_time_ms']['p95'] >= 90)
+
+    def test_stats_admin_only(self):
+        """测试：统计接口仅管理员可访问"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/ai/stats/').status_code, 403)
+
+        admin = User.objects.create_user(username='admin', password='pass123', is_staff=True)
+        client.force_authenticate(admin)
+        response = client.get('/api/ai/stats/', {'hours': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'hours': 1, 'models': []})
+
+
+def slow_chunks(texts, interval=0.0, first_delay=0.0, error=None):
+    time.sleep(first_delay)
+    for text in texts:
+        yield text
+        time.sleep(interval)
+    if error:
+        raise error
+
+
+class SSECoalesceTests(SimpleTestCase):
+    """SSE 帧合并与心跳测试"""
+
+    def test_coalesce_by_window(self):
+        """测试：第一个片段立即发送，之后窗口内的片段合并成一帧"""
+        texts = list('流式输出的每个片段只有一个字')
+        frames = list(coalesce(slow_chunks(texts, interval=0.002), window_ms=50, max_bytes=4096, heartbeat=0))
+        self.assertEqual(frames[0], '流')
+        self.assertEqual(''.join(frames), ''.join(texts))
+        self.assertLess(len(frames), len(texts) // 2)
+
+    def test_coalesce_by_size(self):
+        """测试：累计字节数达到上限时立即发送"""
+        frames = list(coalesce(slow_chunks(['ab'] * 6, interval=0.01), window_ms=10000, max_bytes=4, heartbeat=0))
+        self.assertEqual(frames, ['ab', 'abab', 'abab', 'ab'])
+
+    def test_heartbeat_while_idle(self):
+        """测试：上游迟迟没有输出时发送心跳"""
+        frames = list(coalesce(slow_chunks(['你好'], first_delay=0.35), window_ms=30, max_bytes=1024, heartbeat=0.1))
+        self.assertGreaterEqual(frames.count(HEARTBEAT), 2)
+        self.assertEqual(frames[-1], '你好')
+
+    def test_error_after_pending_text(self):
+        """测试：上游异常前已收到的文本先发出，异常原样抛出"""
+        frames = coalesce(slow_chunks(['你', '好'], error=TimeoutError('超时')), window_ms=10000, heartbeat=0)
+        self.assertEqual(next(frames), '你')
+        self.assertEqual(next(frames), '好')
+        with self.assertRaises(TimeoutError):
+            next(frames)
+
+    def test_no_reader_thread_without_heartbeat(self):
+        """测试：不发心跳时在当前线程中合并，不启动读取线程"""
+        with patch('ai.sse.threading.Thread') as thread:
+            frames = list(coalesce(slow_chunks(list('当前线程合并'), interval=0.002), window_ms=50, heartbeat=0))
+        thread.assert_not_called()
+        self.assertEqual(frames, ['当', '前线程合并'])
+
+    def test_disabled_passthrough(self):
+        """测试：窗口和心跳都为 0 时逐片段透传"""
+        self.assertEqual(list(coalesce(iter(['a', 'b']), window_ms=0, heartbeat=0)), ['a', 'b'])
+
+    def test_async_coalesce(self):
+        """测试：异步版本同样合并片段并发送心跳"""
+        async def chunks():
+            await asyncio.sleep(0.25)
+            for text in '异步流式输出':
+                yield text
+                await asyncio.sleep(0.002)
+
+        async def collect():
+            return [frame async for frame in acoalesce(chunks(), window_ms=50, max_bytes=1024, heartbeat=0.1)]
+
+        frames = asyncio.run(collect())
+        self.assertIn(HEARTBEAT, frames)
+        text = [frame for frame in frames if frame is not HEARTBEAT]
+        self.assertEqual(text, ['异', '步流式输出'])
+
+
+    def test_async_cancel_closes_upstream(self):
+        """测试：客户端断开（任务被取消）时立即关闭上游响应，不等垃圾回收"""
+        class Upstream:
+            closed = False
+
+            async def __aiter__(self):
+                yield stream_chunk('你')
+                await asyncio.sleep(10)
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                self.closed = True
+
+        upstream = Upstream()
+
+        async def create(**kwargs):
+            return upstream
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+        async def consume(first):
+            async for frame in acoalesce(AIService().achat_stream([]), window_ms=30, heartbeat=0.1):
+                if frame is not HEARTBEAT:
+                    first.set_result(frame)
+
+        async def run():
+            first = asyncio.get_running_loop().create_future()
+            task = asyncio.ensure_future(consume(first))
+            self.assertEqual(await first, '你')
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return upstream.closed
+
+        with patch('ai.services.get_async_client', return_value=client):
+            self.assertTrue(asyncio.run(run()))
+
+@override_settings(AI_SINGLEFLIGHT_POLL_INTERVAL=0.01)
+class SingleFlightTests(SimpleTestCase):
+    """相同请求并发合并测试"""
+
+    def setUp(self):
+        self.flight = SingleFlight('test-flight')
+        cache.clear()
+
+    def test_concurrent_calls_share_one_result(self):
+        """测试：同一进程内并发的相同请求只执行一次"""
+        calls, results = [], []
+        started = threading.Barrier(8)
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.2)
+            return '摘要'
+
+        def worker():
+            started.wait()
+            results.append(self.flight.do('key', fn))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('摘要', False)] + [('摘要', True)] * 7)
+        # 完成后不再合并
+        self.assertEqual(self.flight.do('key', lambda: '新摘要'), ('新摘要', False))
+
+    def test_error_shared_with_waiters(self):
+        """测试：执行失败时等待者得到同样的异常"""
+        entered, errors = threading.Event(), []
+
+        def fn():
+            entered.set()
+            time.sleep(0.1)
+            raise Exception('AI服务错误')
+
+        def waiter():
+            entered.wait()
+            try:
+                self.flight.do('key', lambda: '不应执行')
+            except Exception as e:
+                errors.append(str(e))
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        with self.assertRaises(Exception):
+            self.flight.do('key', fn)
+        thread.join()
+        self.assertEqual(errors, ['AI服务错误'])
+
+    def test_wait_for_other_process(self):
+        """测试：其他进程持有锁时轮询结果，不重复执行"""
+        cache.add('test-flight:key', 1)
+        results = iter([None, None, '其他进程的摘要'])
+        self.assertEqual(
+            self.flight.do('key', lambda: '不应执行', lookup=lambda: next(results)),
+            ('其他进程的摘要', True),
+        )
+
+    @override_settings(AI_SINGLEFLIGHT_TIMEOUT=0)
+    def test_stale_lock(self):
+        """测试：锁的持有者迟迟没有结果时自己执行"""
+        cache.add('test-flight:key', 1)
+        self.assertEqual(self.flight.do('key', lambda: '摘要', lookup=lambda: None), ('摘要', False))
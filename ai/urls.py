@@ -1,7 +1,13 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('chat/', views.chat_stream, name='chat'),
+    # ASGI 部署（config/asgi.py）使用异步流式对话，WSGI 下仍使用同步视图
+    path('chat/', views.chat_stream_async if settings.AI_ASYNC_CHAT else views.chat_stream, name='chat'),
     path('summarize/', views.generate_summary, name='summarize'), 
+    path('stats/', views.usage_stats, name='usage-stats'),
+    path('usage/', views.usage_report, name='usage-report'),
+    path('sessions/', views.session_list, name='session-list'),
+    path('sessions/<int:session_id>/messages/', views.session_messages, name='session-messages'),
 ]
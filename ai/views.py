@@ -1,17 +1,75 @@
+import asyncio
 import json
 import time
-from django.http import StreamingHttpResponse
+from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.views.decorators.csrf import csrf_exempt
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from django.views.decorators.http import require_POST
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, Throttled
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .metrics import latency_stats, usage_fields
+from .quotas import AIQuotaThrottle, charge as charge_quota, check as check_quota
+from .rollups import rolled_up_until, usage_report as rollup_report
+from .context import abuild_context, aschedule_refresh, build_context, schedule_refresh
 from .services import AIService
+from .singleflight import summary_flight
+from .sse import HEARTBEAT, acoalesce, coalesce
+from . import map_reduce, summary_cache
+from .write_behind import write_behind
 from .models import ChatSession, ChatMessage, AIUsageLog
+from .pagination import MessageCursorPagination, SessionCursorPagination
+from .serializers import ChatMessageSerializer, ChatSessionSerializer
 from rest_framework.response import Response
 from rest_framework import status
 
 
+def _elapsed_ms(started):
+    return int((time.monotonic() - started) * 1000)
+
+
+def _generate_with_retry(ai, content, max_length):
+    """
+    带重试的摘要生成
+    :return: (摘要, 最后一次错误)，失败时摘要为 None
+    """
+    summary = None
+    last_error = None
+    max_retries = 3
+    
+    for attempt in range(max_retries):
+        try:
+            # 尝试生成摘要（长文章分段摘要，已完成的分段会缓存，重试时不再重复调用）
+            summary = map_reduce.summarize(ai, content, max_length)
+            break  # 成功，跳出循环
+            
+        except TimeoutError as e:
+            # 超时错误，记录并准备重试
+            last_error = str(e)
+            if attempt < max_retries - 1:
+                time.sleep(1)  # 等待1秒后重试
+                continue
+            break  # 最后一次也超时，跳出
+            
+        except Exception as e:
+            # 其他错误（API错误、网络错误等）
+            last_error = str(e)
+            if attempt < max_retries - 1:
+                time.sleep(1)
+                continue
+            break
+
+    return summary, last_error
+
+
 @api_view(['post'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([AIQuotaThrottle])
 def generate_summary(request):
     """
     文章摘要接口 POST /api/ai/summarize/
@@ -21,6 +79,8 @@ def generate_summary(request):
     2. 异常分类处理
     3. 自动重试机制（最多3次）
     4. 友好的错误提示
+    5. 摘要缓存：相同正文、长度和模型直接返回缓存结果
+    6. 单飞合并：相同内容的并发请求只调用一次模型，其余等待并共享结果
     
     请求体：
     {
@@ -30,10 +90,13 @@ def generate_summary(request):
     
     响应：
     {
-        "summary": "生成的摘要..."
+        "summary": "生成的摘要...",
+        "cached": false            // 是否来自缓存或共享了并发请求的结果
     }
     """
     # 1. 获取并校验参数
+    if not isinstance(request.data, dict):
+        return Response({'error': '请求体必须是 JSON 对象'}, status=status.HTTP_400_BAD_REQUEST)
     content = request.data.get('content', '').strip()
     max_length = request.data.get('max_length', 200)
 
@@ -43,46 +106,55 @@ def generate_summary(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # 2. 初始化AI服务（设置30秒超时）
+    # 2. 先查摘要缓存：正文未变时直接返回，不调用模型、不消耗 Token
+    started = time.monotonic()
+    summary = summary_cache.get_summary(content, max_length)
+    if summary is not None:
+        write_behind.add(AIUsageLog(
+            user=request.user,
+            call_type='summarize',
+            model=settings.AI_MODEL,
+            prompt_summary=content[:50] + "...",
+            success=True,
+            cache_hit=True,
+            response_time_ms=_elapsed_ms(started),
+        ))
+        return Response({"summary": summary, "cached": True})
+
+    # 3. 初始化AI服务（设置30秒超时）
     ai = AIService(timeout=30)
     
-    # 3. 带重试的摘要生成
-    summary = None
+    # 4. 带重试的摘要生成：同一内容的并发请求（重复点击、前端重试）只调用一次模型，其余等待并共享结果
+    def generate():
+        summary, last_error = _generate_with_retry(ai, content, max_length)
+        if summary is None:
+            raise Exception(last_error)
+        # 先写入缓存再释放锁，其他进程的等待者从缓存读到结果
+        summary_cache.set_summary(content, max_length, summary)
+        return summary
+
     last_error = None
-    max_retries = 3
-    
-    for attempt in range(max_retries):
-        try:
-            # 尝试生成摘要
-            summary = ai.generate_summary(content, max_length)
-            break  # 成功，跳出循环
-            
-        except TimeoutError as e:
-            # 超时错误，记录并准备重试
-            last_error = str(e)
-            if attempt < max_retries - 1:
-                time.sleep(1)  # 等待1秒后重试
-                continue
-            break  # 最后一次也超时，跳出
-            
-        except Exception as e:
-            # 其他错误（API错误、网络错误等）
-            last_error = str(e)
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            break
+    try:
+        summary, shared = summary_flight.do(
+            summary_cache.summary_key(content, max_length),
+            generate,
+            lookup=lambda: summary_cache.get_summary(content, max_length),
+        )
+    except Exception as e:
+        summary, shared, last_error = None, False, str(e)
     
-    # 4. 处理失败情况
+    # 5. 处理失败情况
     if summary is None:
         # 记录失败日志
-        AIUsageLog.objects.create(
+        write_behind.add(AIUsageLog(
             user=request.user,
             call_type='summarize',
+            model=ai.model,
             prompt_summary=content[:50] + "...",
             success=False,
             error_message=last_error,
-        )
+            response_time_ms=_elapsed_ms(started),
+        ))
         return Response(
             {
                 'error': '生成摘要失败',
@@ -92,20 +164,26 @@ def generate_summary(request):
             status=status.HTTP_503_SERVICE_UNAVAILABLE  # 503: 服务暂时不可用
         )
     
-    # 5. 记录成功日志
-    AIUsageLog.objects.create(
+    # 6. 记录成功日志：自己调用了模型的记录 token 用量，共享结果的与命中缓存相同
+    usage = usage_fields(None if shared else ai.last_usage, _elapsed_ms(started))
+    write_behind.add(AIUsageLog(
         user=request.user,
         call_type='summarize',
+        model=ai.model,
         prompt_summary=content[:50] + "...",
         success=True,
-    )
+        cache_hit=shared,
+        **usage,
+    ))
+    charge_quota(request.user, usage['total_tokens'])
 
-    # 6. 返回成功响应
-    return Response({"summary": summary})
+    # 7. 返回成功响应
+    return Response({"summary": summary, "cached": shared})
 
 
 @api_view(['post'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([AIQuotaThrottle])
 def chat_stream(request):
     """
     AI流式对话接口 POST /api/ai/chat/
@@ -115,6 +193,7 @@ def chat_stream(request):
     2. 流式异常处理（通过SSE发送错误）
     3. 错误时不保存不完整回复
     4. 前端可识别错误类型
+    5. 相邻片段合并成一帧发送（AI_SSE_COALESCE_MS），上游空闲时发送心跳注释（AI_SSE_HEARTBEAT）
     
     请求体：
     {
@@ -126,6 +205,8 @@ def chat_stream(request):
     错误格式: data: {"type": "error", "message": "..."}
     """
     user = request.user
+    if not isinstance(request.data, dict):
+        return Response({'error': '请求体必须是 JSON 对象'}, status=status.HTTP_400_BAD_REQUEST)
     session_id = request.data.get('session_id')
     message = request.data.get('message', '').strip()
     
@@ -144,22 +225,23 @@ def chat_stream(request):
                 "data: " + json.dumps({"type": "error", "message": "会话不存在或无权限"}) + "\n\n",
                 content_type="text/event-stream",
             )
+        # 会话列表按最近活跃排序
+        ChatSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
     else:
         session = ChatSession.objects.create(
             user=user,
             title=message[:20]
         )
 
-    # 3. 保存用户消息
-    ChatMessage.objects.create(
+    # 3. 保存用户消息（进入写缓冲区，构建上下文时会连同缓冲中的消息一起读取）
+    write_behind.add(ChatMessage(
         content=message,
         role='user',
         session=session,
-    )
+    ))
 
-    # 4. 构建历史消息（取最近20条）
-    history = ChatMessage.objects.filter(session=session).order_by('-id')[:20]
-    messages = [{"role": msg.role, "content": msg.content} for msg in reversed(history)]
+    # 4. 构建上下文：滚动摘要 + token 预算内的最近消息，提示词长度不随会话增长
+    messages, needs_refresh = build_context(session)
 
     # 5. 初始化AI服务（流式请求需要更长超时）
     ai = AIService(timeout=60)
@@ -172,13 +254,18 @@ def chat_stream(request):
         full_response = []
         error_occurred = False
         error_message = ""
+        started = time.monotonic()
         
         # 5.1 发送会话ID（前端需要保存）
         yield f"data: {json.dumps({'type': 'session', 'session_id': session.id})}\n\n"
         
         try:
             # 5.2 流式获取AI回复
-            for chunk in ai.chat_stream(messages):
+            # 相邻片段合并成一帧发送，上游空闲时发送心跳
+            for chunk in coalesce(ai.chat_stream(messages)):
+                if chunk is HEARTBEAT:
+                    yield chunk
+                    continue
                 full_response.append(chunk)
                 # 实时发送给前端
                 yield f"data: {json.dumps({'type': 'content', 'text': chunk})}\n\n"
@@ -196,31 +283,44 @@ def chat_stream(request):
             yield f"data: {json.dumps({'type': 'error', 'error_type': 'api_error', 'message': error_message})}\n\n"
         
         # 5.3 保存完整回复（只有成功时才保存）
+        usage = usage_fields(ai.last_usage, _elapsed_ms(started), ai.first_token_ms)
+        charge_quota(user, usage['total_tokens'])
         if not error_occurred and full_response:
             complete_text = ''.join(full_response)
-            ChatMessage.objects.create(
+            write_behind.add(ChatMessage(
                 session=session,
                 role='assistant',
-                content=complete_text
-            )
+                content=complete_text,
+                prompt_tokens=usage['prompt_tokens'],
+                completion_tokens=usage['completion_tokens'],
+            ))
             # 记录成功日志
-            AIUsageLog.objects.create(
+            write_behind.add(AIUsageLog(
                 user=user,
                 call_type='chat',
+                model=ai.model,
                 prompt_summary=message[:50] + "...",
                 success=True,
-            )
+                **usage,
+            ))
         else:
             # 记录失败日志
-            AIUsageLog.objects.create(
+            write_behind.add(AIUsageLog(
                 user=user,
                 call_type='chat',
+                model=ai.model,
                 prompt_summary=message[:50] + "...",
                 success=False,
                 error_message=error_message,
-            )
+                **usage,
+            ))
         
-        # 5.4 发送结束标记
+        # 5.4 把移出窗口的早期消息并入会话摘要：在后台线程中生成，不占用本次请求；
+        # 在发送结束标记之前提交，客户端收到 done 后断开也不影响
+        if needs_refresh and not error_occurred:
+            schedule_refresh(session, user)
+
+        # 5.5 发送结束标记
         yield f"data: {json.dumps({'type': 'done', 'has_error': error_occurred})}\n\n"
     
     # 6. 返回SSE响应
@@ -231,3 +331,286 @@ def chat_stream(request):
     response['Cache-Control'] = 'no-cache'
     response['X-Accel-Buffering'] = 'no'  # 禁用Nginx缓冲
     return response
+
+
+async def _authenticate(request):
+    """
+    异步视图不经过 DRF，这里手动完成 JWT 认证
+    :return: 用户，未认证或 token 无效时返回 None
+    """
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def _sse(data):
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def _sse_error(message):
+    """只含一条错误事件的 SSE 响应（异步迭代器，ASGI 下无需回退到同步迭代）"""
+    async def stream():
+        yield _sse({"type": "error", "message": message})
+    return StreamingHttpResponse(stream(), content_type="text/event-stream")
+
+
+@csrf_exempt
+@require_POST
+async def chat_stream_async(request):
+    """
+    AI流式对话接口（异步版本）POST /api/ai/chat/
+
+    在 ASGI 下代替 chat_stream：等待模型输出时不占用工作线程，
+    单个进程可以同时维持大量对话流。请求体、SSE 事件格式与 chat_stream 相同
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': str(NotAuthenticated.default_detail)}, status=status.HTTP_401_UNAUTHORIZED)
+
+    # 与同步视图的 AIQuotaThrottle 相同：超出配额直接返回 429，不调用模型
+    retry_after = await sync_to_async(check_quota)(user)
+    if retry_after is not None:
+        response = JsonResponse({'detail': str(Throttled(retry_after).detail)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(retry_after)
+        return response
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        data = request.POST
+    # 合法的 JSON 也可能是数组、字符串等，与同步视图一样返回 400
+    if not isinstance(data, dict):
+        return JsonResponse({'error': '请求体必须是 JSON 对象'}, status=status.HTTP_400_BAD_REQUEST)
+    session_id = data.get('session_id')
+    message = str(data.get('message', '')).strip()
+
+    # 1. 参数校验
+    if not message:
+        return _sse_error("消息不能为空")
+
+    # 2. 获取或创建会话
+    if session_id:
+        session = await ChatSession.objects.filter(id=session_id, user=user).afirst()
+        if not session:
+            return _sse_error("会话不存在或无权限")
+        await ChatSession.objects.filter(pk=session.pk).aupdate(updated_at=timezone.now())
+    else:
+        session = await ChatSession.objects.acreate(user=user, title=message[:20])
+
+    # 3. 保存用户消息（进入写缓冲区）
+    await write_behind.aadd(ChatMessage(content=message, role='user', session=session))
+
+    # 4. 构建上下文：滚动摘要 + token 预算内的最近消息
+    messages, needs_refresh = await abuild_context(session)
+
+    # 5. 初始化AI服务（流式请求需要更长超时）
+    ai = AIService(timeout=60)
+
+    async def event_stream():
+        """SSE事件异步生成器"""
+        full_response = []
+        error_occurred = False
+        error_message = ""
+        started = time.monotonic()
+
+        yield _sse({'type': 'session', 'session_id': session.id})
+
+        try:
+            async for chunk in acoalesce(ai.achat_stream(messages)):
+                if chunk is HEARTBEAT:
+                    yield chunk
+                    continue
+                full_response.append(chunk)
+                yield _sse({'type': 'content', 'text': chunk})
+
+        except TimeoutError as e:
+            error_occurred = True
+            error_message = str(e)
+            yield _sse({'type': 'error', 'error_type': 'timeout', 'message': error_message})
+
+        except asyncio.CancelledError:
+            # 客户端断开连接：不保存不完整回复，记录失败日志后结束
+            usage = usage_fields(ai.last_usage, _elapsed_ms(started), ai.first_token_ms)
+            await write_behind.aadd(AIUsageLog(
+                user=user,
+                call_type='chat',
+                model=ai.model,
+                prompt_summary=message[:50] + "...",
+                success=False,
+                error_message='客户端断开连接',
+                **usage,
+            ))
+            await sync_to_async(charge_quota)(user, usage['total_tokens'])
+            raise
+
+        except Exception as e:
+            error_occurred = True
+            error_message = str(e)
+            yield _sse({'type': 'error', 'error_type': 'api_error', 'message': error_message})
+
+        # 只有成功时才保存完整回复
+        usage = usage_fields(ai.last_usage, _elapsed_ms(started), ai.first_token_ms)
+        await sync_to_async(charge_quota)(user, usage['total_tokens'])
+        if not error_occurred and full_response:
+            await write_behind.aadd(ChatMessage(
+                session=session,
+                role='assistant',
+                content=''.join(full_response),
+                prompt_tokens=usage['prompt_tokens'],
+                completion_tokens=usage['completion_tokens'],
+            ))
+            await write_behind.aadd(AIUsageLog(
+                user=user,
+                call_type='chat',
+                model=ai.model,
+                prompt_summary=message[:50] + "...",
+                success=True,
+                **usage,
+            ))
+        else:
+            await write_behind.aadd(AIUsageLog(
+                user=user,
+                call_type='chat',
+                model=ai.model,
+                prompt_summary=message[:50] + "...",
+                success=False,
+                error_message=error_message,
+                **usage,
+            ))
+
+        # 先创建摘要任务再发送结束标记：客户端收到 done 后断开，请求任务被取消也不影响摘要
+        if needs_refresh and not error_occurred:
+            aschedule_refresh(session, user)
+
+        yield _sse({'type': 'done', 'has_error': error_occurred})
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 禁用Nginx缓冲
+    return response
+
+
+@api_view(['get'])
+@permission_classes([IsAdminUser])
+def usage_stats(request):
+    """
+    AI 调用延迟统计接口 GET /api/ai/stats/（仅管理员）
+
+    按模型汇总最近若干小时成功调用的 p50/p95，用于发现上游延迟回退：
+    - response_time_ms：整个调用的耗时
+    - first_token_ms：流式对话首个片段的耗时
+    - tokens_per_second：输出速度
+
+    查询参数：
+    hours      统计最近多少小时，默认 24，最多 720
+    call_type  chat / summarize，默认全部
+    """
+    try:
+        hours = min(max(int(request.query_params.get('hours', 24)), 1), 720)
+    except ValueError:
+        return Response({'error': 'hours 必须是整数'}, status=status.HTTP_400_BAD_REQUEST)
+    call_type = request.query_params.get('call_type') or None
+
+    return Response({'hours': hours, 'models': latency_stats(hours, call_type)})
+
+
+# 报表的最大时间跨度（天），限制返回的行数
+USAGE_REPORT_MAX_DAYS = {'hour': 31, 'day': 366}
+
+
+@api_view(['get'])
+@permission_classes([IsAuthenticated])
+def usage_report(request):
+    """
+    AI 用量报表 GET /api/ai/usage/
+
+    只读取汇总表（rollup_ai_usage 命令维护），查询代价与调用日志的行数无关；
+    data_until 之后的调用还未汇总。普通用户只能查看自己的用量，管理员可查看全部或指定用户
+
+    查询参数：
+    period     hour / day，默认 day
+    start      开始日期 YYYY-MM-DD，默认 end 之前 30 天（按小时为 1 天）
+    end        结束日期 YYYY-MM-DD（包含），默认今天
+    user_id    用户 id（仅管理员）
+    call_type  chat / summarize，默认全部
+    """
+    period = request.query_params.get('period', 'day')
+    if period not in USAGE_REPORT_MAX_DAYS:
+        return Response({'error': 'period 只能是 hour 或 day'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        end = parse_date(request.query_params['end']) if 'end' in request.query_params else timezone.localdate()
+        start = (parse_date(request.query_params['start']) if 'start' in request.query_params
+                 else end - timedelta(days=1 if period == 'hour' else 30))
+    except ValueError:
+        start = end = None
+    if start is None or end is None:
+        return Response({'error': '日期格式应为 YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    if start > end or (end - start).days >= USAGE_REPORT_MAX_DAYS[period]:
+        return Response({'error': f'时间跨度应在 1 到 {USAGE_REPORT_MAX_DAYS[period]} 天之间'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    user_id = request.user.id
+    if request.user.is_staff:
+        try:
+            user_id = int(request.query_params['user_id']) if request.query_params.get('user_id') else None
+        except ValueError:
+            return Response({'error': 'user_id 必须是整数'}, status=status.HTTP_400_BAD_REQUEST)
+
+    def day_start(day):
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+    rows, totals = rollup_report(
+        period, day_start(start), day_start(end + timedelta(days=1)), user_id,
+        request.query_params.get('call_type') or None,
+    )
+    return Response({
+        'period': period,
+        'start': start,
+        'end': end,
+        'data_until': rolled_up_until(),
+        'rows': rows,
+        'totals': totals,
+    })
+
+
+@api_view(['get'])
+@permission_classes([IsAuthenticated])
+def session_list(request):
+    """
+    当前用户的会话列表 GET /api/ai/sessions/
+    按最近活跃倒序，游标分页（?cursor=&page_size=，with_count=true 时返回总数）
+    """
+    sessions = ChatSession.objects.filter(user=request.user).only(*ChatSessionSerializer.Meta.fields)
+    paginator = SessionCursorPagination()
+    page = paginator.paginate_queryset(sessions, request)
+    return Response({
+        'sessions': ChatSessionSerializer(page, many=True).data,
+        'count': paginator.count,
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+    })
+
+
+@api_view(['get'])
+@permission_classes([IsAuthenticated])
+def session_messages(request, session_id):
+    """
+    会话消息 GET /api/ai/sessions/{id}/messages/
+    从最新的消息往前翻页（?cursor=&page_size=），只能查看自己的会话
+    消息经写缓冲区批量写入，刚发送的消息最多延迟 AI_WRITE_BEHIND_INTERVAL 秒出现
+    """
+    if not ChatSession.objects.filter(id=session_id, user=request.user).exists():
+        return Response({'error': '会话不存在或无权限'}, status=status.HTTP_404_NOT_FOUND)
+
+    messages = ChatMessage.objects.filter(session_id=session_id)
+    paginator = MessageCursorPagination()
+    page = paginator.paginate_queryset(messages, request)
+    return Response({
+        'messages': ChatMessageSerializer(page, many=True).data,
+        'count': paginator.count,
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+    })
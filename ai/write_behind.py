@@ -0,0 +1,248 @@
+import atexit
+import logging
+import signal
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _max_queue():
+    return getattr(settings, 'AI_WRITE_BEHIND_MAX_QUEUE', 10000)
+
+
+def _matches(row, filters):
+    return all(getattr(row, key) == value for key, value in filters.items())
+
+
+class WriteBehindBuffer:
+    """
+    AI 调用日志、对话消息的写缓冲区
+
+    请求路径上只把待写入的模型实例放进内存队列，由后台线程按时间间隔
+    （AI_WRITE_BEHIND_INTERVAL）或队列长度（AI_WRITE_BEHIND_MAX_SIZE）
+    触发，用 bulk_create 批量写入，避免高峰期大量单行 INSERT。
+
+    - AI_WRITE_BEHIND_MODE = 'sync' 时不缓冲，add() 直接写库
+    - 写入失败时记录放回队首，下次重试；整批失败时逐条写入，只丢弃本身有问题的记录
+    - 队列长度上限为 AI_WRITE_BEHIND_MAX_QUEUE：数据库长时间不可用时丢弃新记录，
+      丢弃数量累计在 dropped 中并记录日志，内存占用不会无限增长
+    - 进程正常退出（atexit）或收到 SIGTERM 时先把队列写完
+    - created_at 等 auto_now_add 字段取写入时刻，与请求时刻最多相差一个刷新间隔
+    """
+
+    def __init__(self):
+        self._queues = defaultdict(list)   # 模型类 → 待写入的实例
+        self._lock = threading.Lock()
+        self._flush_lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._flusher = None
+        self._hooks_installed = False
+        self.dropped = 0   # 因队列已满丢弃的记录数
+
+    @property
+    def mode(self):
+        return getattr(settings, 'AI_WRITE_BEHIND_MODE', 'buffered')
+
+    def add(self, instance):
+        """
+        排队写入一个模型实例（未保存）
+        :return: instance；sync 模式下已写入数据库
+        """
+        if self.mode == 'sync':
+            instance.save()
+            return instance
+
+        with self._lock:
+            size = sum(len(rows) for rows in self._queues.values())
+            full = size >= _max_queue()
+            if full:
+                self.dropped += 1
+                dropped = self.dropped
+            else:
+                self._queues[type(instance)].append(instance)
+                size += 1
+
+        if full:
+            # 队列已满说明刷新持续失败，丢弃新记录；日志按数量抽样，避免故障期间刷屏
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.error('写缓冲区已满（%d 条），累计丢弃 %d 条记录', size, dropped)
+            return instance
+
+        if self._ensure_flusher():
+            if size >= getattr(settings, 'AI_WRITE_BEHIND_MAX_SIZE', 200):
+                # 达到长度阈值，唤醒后台线程立即写入
+                self._wakeup.set()
+        elif size >= getattr(settings, 'AI_WRITE_BEHIND_MAX_SIZE', 200):
+            # 没有后台线程时由调用方直接写入
+            self.flush()
+        return instance
+
+    async def aadd(self, instance):
+        """add 的异步版本：需要当场写库时（sync 模式或没有后台线程）放到线程中执行"""
+        if self.mode == 'sync' or not self._ensure_flusher():
+            return await sync_to_async(self.add)(instance)
+        return self.add(instance)
+
+    def pending(self, model, **filters):
+        """
+        队列中尚未写入的记录（按加入顺序）
+        与数据库查询配合使用时应放在 hold() 中，避免两次读取之间发生刷新
+        """
+        with self._lock:
+            rows = list(self._queues.get(model, []))
+        return [row for row in rows if _matches(row, filters)]
+
+    def size(self):
+        with self._lock:
+            return sum(len(rows) for rows in self._queues.values())
+
+    @contextmanager
+    def hold(self):
+        """暂停刷新：期间读取的数据库和队列是同一时刻的快照"""
+        with self._flush_lock:
+            yield
+
+    def flush(self, model=None, **filters):
+        """
+        把队列中的记录批量写入数据库
+        :param model, filters: 只写入该模型中字段匹配的记录（如某个会话的消息），其余留在队列中
+        :return: 写入的记录数
+        """
+        with self._flush_lock:
+            with self._lock:
+                if model is None:
+                    batches, self._queues = self._queues, defaultdict(list)
+                else:
+                    rows = self._queues.get(model, [])
+                    matched = [row for row in rows if _matches(row, filters)]
+                    self._queues[model] = [row for row in rows if not _matches(row, filters)]
+                    batches = {model: matched} if matched else {}
+            if not batches:
+                return 0
+
+            try:
+                with transaction.atomic():
+                    for model, rows in batches.items():
+                        model.objects.bulk_create(rows, batch_size=500)
+                return sum(len(rows) for rows in batches.values())
+            except Exception:
+                logger.exception('批量写入失败，改为逐条写入')
+                return self._write_one_by_one(batches)
+
+    def _write_one_by_one(self, batches):
+        """整批失败时逐条写入：数据库不可用则全部放回队列，个别记录有问题则丢弃该条"""
+        written = 0
+        failed = defaultdict(list)
+        for model, rows in batches.items():
+            for row in rows:
+                try:
+                    row.pk = None
+                    row._state.adding = True
+                    row.save(force_insert=True)
+                    written += 1
+                except Exception:
+                    failed[model].append(row)
+
+        if written == 0:
+            # 一条都写不进去，视为数据库故障，放回队首等待下次刷新
+            with self._lock:
+                for model, rows in failed.items():
+                    self._queues[model][:0] = rows
+                self._trim()
+            raise RuntimeError('写缓冲区刷新失败，记录已放回队列')
+
+        for model, rows in failed.items():
+            logger.error('丢弃 %d 条无法写入的 %s 记录', len(rows), model.__name__)
+        return written
+
+    def _trim(self):
+        """放回的记录使队列超过上限时，从最新的记录开始丢弃（调用方持有 _lock）"""
+        excess = sum(len(rows) for rows in self._queues.values()) - _max_queue()
+        for rows in self._queues.values():
+            if excess <= 0:
+                break
+            count = min(excess, len(rows))
+            del rows[len(rows) - count:]
+            excess -= count
+            self.dropped += count
+            logger.error('写缓冲区已满，丢弃 %d 条最新记录', count)
+
+    def _ensure_flusher(self):
+        """按需启动后台刷新线程；间隔为 0 时不启动，返回 False"""
+        if self._flusher is not None and self._flusher.is_alive():
+            return True
+        interval = getattr(settings, 'AI_WRITE_BEHIND_INTERVAL', 1)
+        if interval <= 0:
+            return False
+
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(
+                    target=self._run,
+                    args=(interval,),
+                    name='ai-write-behind-flusher',
+                    daemon=True,
+                )
+                self._flusher.start()
+        return True
+
+    def stop(self):
+        """停止后台刷新线程并写完队列"""
+        flusher = self._flusher
+        if flusher is not None and flusher.is_alive():
+            self._stopping.set()
+            self._wakeup.set()
+            flusher.join()
+        self._flusher = None
+        self._stopping.clear()
+        return self.flush()
+
+    def _run(self, interval):
+        while not self._stopping.is_set():
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('写缓冲区刷新失败')
+            finally:
+                close_old_connections()
+
+    def install_exit_hooks(self):
+        """
+        进程退出前写完队列（在 AppConfig.ready 中调用，需要在主线程）
+        gunicorn / uvicorn 的 worker 收到 SIGTERM 后正常退出，会执行 atexit；
+        没有服务器接管 SIGTERM 的进程（如直接运行的脚本）额外注册 SIGTERM 处理
+        """
+        if self._hooks_installed:
+            return
+        self._hooks_installed = True
+        atexit.register(self._flush_at_exit)
+        try:
+            if signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+                signal.signal(signal.SIGTERM, self._on_sigterm)
+        except ValueError:
+            # 不在主线程，只依赖 atexit
+            pass
+
+    def _on_sigterm(self, signum, frame):
+        # 信号处理函数在主线程执行，主线程此时可能正持有 _lock 或正在 flush，
+        # 在这里写库会死锁或重入未完成的写入。只抛出 SystemExit：主线程退出各个
+        # with 块释放锁后，由 atexit 注册的 _flush_at_exit 写完队列
+        raise SystemExit(128 + signum)
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('退出前写入缓冲记录失败，丢失 %d 条', self.size())
+
+
+# 进程级单例
+write_behind = WriteBehindBuffer()
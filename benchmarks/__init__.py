@@ -0,0 +1,8 @@
+"""
+性能基准
+
+不会被 pytest 或默认的 manage.py test 收集，需要单独运行，例如：
+    python manage.py test benchmarks.bench_post_bulk
+
+每个基准在测试数据库中运行，结果打印到标准输出
+"""
@@ -0,0 +1,52 @@
+import time
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from openai import OpenAI
+from ai.clients import close_clients
+from ai.services import AIService
+from .stub_openai import StubServer
+
+CALLS = 200
+
+
+class AIClientBenchmark(SimpleTestCase):
+    """每次调用新建 OpenAI 客户端 vs 进程级共享客户端（本地桩服务）"""
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.settings = override_settings(AI_BASE_URL=self.server.base_url, AI_API_KEY='bench')
+        self.settings.enable()
+        close_clients()
+
+    def tearDown(self):
+        close_clients()
+        self.settings.disable()
+        self.server.stop()
+
+    def run_case(self, name, make_service):
+        connections = self.server.connections
+        start = time.perf_counter()
+        for _ in range(CALLS):
+            make_service().generate_summary('这是一篇用于基准测试的文章', 50)
+        elapsed = (time.perf_counter() - start) / CALLS * 1000
+        opened = self.server.connections - connections
+        print(f'\n{name}: {elapsed:.2f} ms/次，新建连接 {opened} 条')
+        return elapsed
+
+    def test_fresh_vs_pooled(self):
+        def fresh():
+            # 改造前：每次请求构造新客户端，连接池随之丢弃
+            service = AIService(timeout=30)
+            service.client = OpenAI(
+                api_key=settings.AI_API_KEY,
+                base_url=settings.AI_BASE_URL,
+                timeout=30,
+                max_retries=0,
+            )
+            return service
+
+        fresh_ms = self.run_case(f'每次新建客户端 x{CALLS}', fresh)
+        pooled_ms = self.run_case(f'共享客户端 x{CALLS}', lambda: AIService(timeout=30))
+        print(f'每次调用节省: {fresh_ms - pooled_ms:.2f} ms（本机回环，不含 TLS 握手）')
+
+        self.assertEqual(self.server.requests, CALLS * 2)
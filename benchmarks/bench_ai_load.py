@@ -0,0 +1,246 @@
+"""
+AI 接口压测：AIService 和视图对接本地桩服务，不消耗 Token
+
+    python manage.py test benchmarks.bench_ai_load
+
+压测参数通过环境变量调整，例如模拟慢模型和 2% 的限流：
+    LOAD_REQUESTS=1000 LOAD_USERS=100 LOAD_WORKERS=16 LOAD_DELAY=0.5 LOAD_TPS=30 \\
+        LOAD_RATE_LIMIT_RATE=0.02 python manage.py test benchmarks.bench_ai_load
+
+报告：吞吐量、首字耗时（TTFT）和总耗时的 p50/p95、错误分布，以及工作线程饱和度：
+- 同步视图：LOAD_WORKERS 个线程模拟 WSGI 工作线程，统计线程占用率和请求排队时间
+- 异步视图：单个事件循环承载全部对话流，统计事件循环延迟
+
+SQLite 测试库不支持并发写（摘要缓存写入会报 table is locked 并计入错误），
+涉及数据库的结果以 MySQL 测试库为准
+"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth import get_user_model
+from django.test import AsyncRequestFactory, TransactionTestCase, override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+from ai.clients import close_clients
+from ai.metrics import percentile
+from ai.models import ChatSession
+from ai.services import AIService
+from ai.views import chat_stream, chat_stream_async, generate_summary
+from ai.write_behind import write_behind
+
+User = get_user_model()
+
+
+def env(name, default, cast=float):
+    return cast(os.getenv(name, default))
+
+
+REQUESTS = env('LOAD_REQUESTS', 200, int)        # 每个场景的请求总数
+USERS = env('LOAD_USERS', 50, int)               # 并发用户数
+WORKERS = env('LOAD_WORKERS', 8, int)            # 同步视图的工作线程数
+STUB = {
+    'delay': env('LOAD_DELAY', 0.05),             # 首包耗时
+    'tokens-per-second': env('LOAD_TPS', 200),    # 流式输出速度
+    'reply-tokens': env('LOAD_REPLY_TOKENS', 20, int),
+    'timeout-rate': env('LOAD_TIMEOUT_RATE', 0),
+    'rate-limit-rate': env('LOAD_RATE_LIMIT_RATE', 0),
+    'server-error-rate': env('LOAD_SERVER_ERROR_RATE', 0),
+    'hang': env('LOAD_HANG', 5),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def report(name, results, elapsed, extra=''):
+    """
+    打印一个场景的结果
+    :param results: [{'ok': bool, 'error': 类型, 'ttft': 秒或 None, 'total': 秒}]
+    """
+    ok = [r for r in results if r['ok']]
+    ttft = sorted(r['ttft'] for r in ok if r['ttft'] is not None)
+    total = sorted(r['total'] for r in ok)
+    errors = Counter(r['error'] for r in results if not r['ok'])
+    print(f'\n[{name}] {len(results)} 个请求，{elapsed:.2f}s，{len(ok) / elapsed:.1f} 成功/s')
+    if ttft:
+        print(f'  TTFT  p50 {ms(percentile(ttft, 50))} ms  p95 {ms(percentile(ttft, 95))} ms')
+    if total:
+        print(f'  总耗时 p50 {ms(percentile(total, 50))} ms  p95 {ms(percentile(total, 95))} ms')
+    print(f'  错误 {dict(errors) or "无"}')
+    if extra:
+        print(f'  {extra}')
+
+
+def error_name(e):
+    # AIService 把上游错误统一包装成 Exception，用消息前缀区分（限流 / 服务错误）
+    return str(e).split(':')[0][:20] if type(e) is Exception else type(e).__name__
+
+
+def parse_events(chunks):
+    """
+    逐块读取 SSE 响应
+    :return: (首个内容事件到达的时刻, 错误类型或 None)
+    """
+    first, error = None, None
+    for chunk in chunks:
+        for line in chunk.decode('utf-8').split('\n\n'):
+            if not line.startswith('data: '):
+                continue
+            event = json.loads(line[6:])
+            if event['type'] == 'content' and first is None:
+                first = time.perf_counter()
+            elif event['type'] == 'error':
+                error = event.get('error_type', 'error')
+    return first, error
+
+
+class AILoadBenchmark(TransactionTestCase):
+    """AI 接口压测（桩服务在独立进程中运行，不与被测代码争用 GIL）"""
+
+    def setUp(self):
+        port = free_port()
+        args = [sys.executable, '-m', 'benchmarks.stub_openai', '--port', str(port)]
+        for key, value in STUB.items():
+            args += [f'--{key}', str(value)]
+        self.stub = subprocess.Popen(args, stdout=subprocess.PIPE)
+        self.stub.stdout.readline()   # 等待启动完成
+        # 压测用户不受配额限制
+        self.settings = override_settings(AI_BASE_URL=f'http://127.0.0.1:{port}/v1', AI_API_KEY='bench', AI_QUOTAS={})
+        self.settings.enable()
+        close_clients()
+
+        self.user = User.objects.create_user(username='bench', password='benchpass123')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        # 预先建好会话，请求路径上只读数据库
+        self.sessions = ChatSession.objects.bulk_create(
+            [ChatSession(user=self.user, title=f'压测 {i}') for i in range(USERS)]
+        )
+
+    def tearDown(self):
+        write_behind.flush()
+        close_clients()
+        self.settings.disable()
+        self.stub.terminate()
+        self.stub.wait()
+
+    def run_pool(self, workers, job):
+        """
+        用线程池执行 REQUESTS 个请求，线程池即工作线程
+        :return: (results, 总耗时, 线程占用率, 排队时间列表)
+        """
+        def timed(i, submitted):
+            started = time.perf_counter()
+            try:
+                result = job(i, started)
+            except Exception as e:
+                # 视图未处理的异常（WSGI 下返回 500）
+                result = {'ok': False, 'error': error_name(e), 'ttft': None, 'total': time.perf_counter() - started}
+            result['wait'] = started - submitted
+            result['busy'] = time.perf_counter() - started
+            return result
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(timed, i, time.perf_counter()) for i in range(REQUESTS)]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+        saturation = sum(r['busy'] for r in results) / (workers * elapsed)
+        return results, elapsed, saturation, sorted(r['wait'] for r in results)
+
+    def test_service_summary(self):
+        """AIService.generate_summary：上游吞吐与错误"""
+        def job(i, started):
+            try:
+                AIService(timeout=STUB['hang'] / 2).generate_summary(f'第 {i} 篇压测文章的正文', 50)
+                return {'ok': True, 'error': None, 'ttft': None, 'total': time.perf_counter() - started}
+            except Exception as e:
+                return {'ok': False, 'error': error_name(e), 'ttft': None, 'total': time.perf_counter() - started}
+
+        results, elapsed, _, _ = self.run_pool(USERS, job)
+        report(f'AIService 摘要 x{USERS} 线程', results, elapsed)
+
+    def test_sync_views(self):
+        """同步视图：摘要接口 + 流式对话，WORKERS 个工作线程承载 USERS 个并发用户"""
+        factory = APIRequestFactory()
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+
+        def summarize(i, started):
+            request = factory.post('/api/ai/summarize/', {'content': f'第 {i} 篇压测文章的正文'}, format='json', **headers)
+            response = generate_summary(request)
+            response.render()
+            ok = response.status_code == 200
+            return {'ok': ok, 'error': None if ok else response.status_code, 'ttft': None,
+                    'total': time.perf_counter() - started}
+
+        def chat(i, started):
+            session = self.sessions[i % USERS]
+            request = factory.post('/api/ai/chat/', {'session_id': session.id, 'message': f'问题 {i}'},
+                                   format='json', **headers)
+            response = chat_stream(request)
+            # WSGI 下工作线程要一直占用到流结束
+            first, error = parse_events(response.streaming_content)
+            return {'ok': error is None, 'error': error, 'ttft': first and first - started,
+                    'total': time.perf_counter() - started}
+
+        for name, job in (('摘要接口', summarize), ('流式对话', chat)):
+            # 用户数多于工作线程时，请求在线程池中排队（相当于 WSGI 的 backlog）
+            results, elapsed, saturation, waits = self.run_pool(WORKERS, job)
+            report(f'同步{name} {WORKERS} 工作线程', results, elapsed,
+                   f'线程占用率 {saturation:.0%}，排队 p50 {ms(percentile(waits, 50))} ms '
+                   f'p95 {ms(percentile(waits, 95))} ms')
+
+    def test_async_chat_view(self):
+        """异步流式对话：单个事件循环，USERS 个并发用户"""
+        factory = AsyncRequestFactory()
+        headers = {'Authorization': f'Bearer {self.token}'}
+
+        async def chat(i, gate):
+            async with gate:
+                started = time.perf_counter()
+                session = self.sessions[i % USERS]
+                request = factory.post('/api/ai/chat/', {'session_id': session.id, 'message': f'问题 {i}'},
+                                       content_type='application/json', headers=headers)
+                response = await chat_stream_async(request)
+                first = error = None
+                async for chunk in response.streaming_content:
+                    chunk_first, chunk_error = parse_events([chunk])
+                    first, error = first or chunk_first, error or chunk_error
+                return {'ok': error is None, 'error': error, 'ttft': first and first - started,
+                        'total': time.perf_counter() - started}
+
+        async def lag_probe(stop, lags):
+            # 事件循环延迟：sleep(10ms) 实际醒来的滞后
+            while not stop.is_set():
+                before = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - before - 0.01)
+
+        async def run():
+            gate, stop, lags = asyncio.Semaphore(USERS), asyncio.Event(), []
+            probe = asyncio.create_task(lag_probe(stop, lags))
+            threads = threading.active_count()
+            start = time.perf_counter()
+            results = await asyncio.gather(*(chat(i, gate) for i in range(REQUESTS)))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await probe
+            return results, elapsed, sorted(lags), threading.active_count() - threads
+
+        results, elapsed, lags, extra_threads = asyncio.run(run())
+        report(f'异步流式对话 x{USERS} 并发', results, elapsed,
+               f'事件循环延迟 p50 {ms(percentile(lags, 50))} ms p95 {ms(percentile(lags, 95))} ms，'
+               f'新增线程 {extra_threads}')
@@ -0,0 +1,71 @@
+import asyncio
+import socket
+import subprocess
+import sys
+import threading
+import time
+from django.contrib.auth import get_user_model
+from django.test import AsyncRequestFactory, TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from ai.models import ChatMessage
+from ai.views import chat_stream_async
+from ai.write_behind import write_behind
+
+User = get_user_model()
+
+STREAMS = 300
+CHUNK_DELAY = 0.05   # 桩服务每个片段间隔，单个对话约 0.4 秒
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class AsyncChatBenchmark(TransactionTestCase):
+    """单进程内同时维持数百个异步对话流（桩服务在独立进程中运行）"""
+
+    def setUp(self):
+        port = free_port()
+        self.stub = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.stub_openai', '--port', str(port), '--chunk-delay', str(CHUNK_DELAY)],
+            stdout=subprocess.PIPE,
+        )
+        self.stub.stdout.readline()   # 等待启动完成
+        # 压测用户不受配额限制
+        self.settings = override_settings(AI_BASE_URL=f'http://127.0.0.1:{port}/v1', AI_API_KEY='bench', AI_QUOTAS={})
+        self.settings.enable()
+        self.user = User.objects.create_user(username='bench', password='benchpass123')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.stub.terminate()
+        self.stub.wait()
+
+    async def chat(self, factory, i):
+        request = factory.post(
+            '/api/ai/chat/', {'message': f'问题 {i}'},
+            content_type='application/json', headers={'Authorization': f'Bearer {self.token}'},
+        )
+        response = await chat_stream_async(request)
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def run_streams(self):
+        factory = AsyncRequestFactory()
+        threads = threading.active_count()
+        start = time.perf_counter()
+        bodies = await asyncio.gather(*(self.chat(factory, i) for i in range(STREAMS)))
+        elapsed = time.perf_counter() - start
+        return bodies, elapsed, threading.active_count() - threads
+
+    def test_concurrent_streams(self):
+        bodies, elapsed, extra_threads = asyncio.run(self.run_streams())
+        failed = sum(b'"has_error": true' in body for body in bodies)
+        print(f'\n{STREAMS} 个并发对话流: 总耗时 {elapsed:.2f}s，失败 {failed}，新增线程 {extra_threads}')
+        print(f'（同步视图下需要 {STREAMS} 个工作线程，每个被占用约 {CHUNK_DELAY * 8:.1f}s）')
+
+        self.assertEqual(failed, 0)
+        write_behind.flush()
+        self.assertEqual(ChatMessage.objects.filter(role='assistant').count(), STREAMS)
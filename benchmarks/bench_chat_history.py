@@ -0,0 +1,106 @@
+"""
+会话与消息历史查询压测：联合索引前后的执行计划和耗时
+
+    python manage.py test benchmarks.bench_chat_history
+
+数据量通过环境变量调整（默认 100 万条消息）：
+    HISTORY_MESSAGES=200000 HISTORY_SESSIONS=5000 python manage.py test benchmarks.bench_chat_history
+"""
+import os
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from ai.context import build_context
+from ai.models import ChatMessage, ChatSession
+from ai.views import session_list, session_messages
+
+User = get_user_model()
+
+MESSAGES = int(os.getenv('HISTORY_MESSAGES', '1000000'))
+SESSIONS = int(os.getenv('HISTORY_SESSIONS', '20000'))
+USERS = 100
+REPEAT = 200
+
+
+class ChatHistoryBenchmark(TransactionTestCase):
+    """MESSAGES 条消息、SESSIONS 个会话：会话列表、消息翻页和上下文读取"""
+
+    def setUp(self):
+        started = time.perf_counter()
+        self.users = User.objects.bulk_create([User(username=f'bench{i}') for i in range(USERS)])
+        now = timezone.now()
+        ChatSession.objects.bulk_create(
+            (ChatSession(user=self.users[i % USERS], title=f'会话{i}') for i in range(SESSIONS)), batch_size=5000
+        )
+        session_ids = list(ChatSession.objects.values_list('id', flat=True))
+        # 活跃时间打散，不与 id 顺序一致
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'UPDATE ai_chat_sessions SET updated_at = %s WHERE id = %s',
+                [(now - timedelta(seconds=(pk * 7919) % 86400), pk) for pk in session_ids],
+            )
+        # 消息交错写入各个会话（和真实对话一样，同一会话的消息在表中不连续）
+        batch = []
+        for i in range(MESSAGES):
+            batch.append(ChatMessage(session_id=session_ids[i % SESSIONS], role='user' if i % 2 else 'assistant',
+                                     content=f'第 {i} 条消息'))
+            if len(batch) == 10000:
+                ChatMessage.objects.bulk_create(batch)
+                batch = []
+        ChatMessage.objects.bulk_create(batch)
+        self.session = ChatSession.objects.get(pk=session_ids[SESSIONS // 2])
+        print(f'\n生成 {MESSAGES} 条消息 / {SESSIONS} 个会话：{time.perf_counter() - started:.1f}s')
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}' if connection.vendor == 'sqlite' else f'EXPLAIN {sql}', params)
+            return ' | '.join(str(row[-1]) for row in cursor.fetchall())
+
+    def timed(self, name, func):
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            func()
+        per_call = (time.perf_counter() - start) / REPEAT * 1000
+        print(f'  {name}: {per_call:.2f} ms')
+        return per_call
+
+    def run_case(self, label):
+        print(f'[{label}]')
+        factory = APIRequestFactory()
+        user = self.session.user
+        oldest = ChatMessage.objects.filter(session=self.session).order_by('id').values_list('id', flat=True)[5]
+
+        def sessions():
+            request = factory.get('/api/ai/sessions/')
+            force_authenticate(request, user=user)
+            session_list(request).render()
+
+        def messages():
+            request = factory.get(f'/api/ai/sessions/{self.session.id}/messages/')
+            force_authenticate(request, user=user)
+            session_messages(request, session_id=self.session.id).render()
+
+        results = {
+            'sessions': self.timed('会话列表首页', sessions),
+            'messages': self.timed('消息首页', messages),
+            'context': self.timed('构建上下文', lambda: build_context(self.session)),
+        }
+        print('  计划 会话列表:', self.plan(ChatSession.objects.filter(user=user).order_by('-updated_at', '-id')[:21]))
+        print('  计划 消息翻页:', self.plan(
+            ChatMessage.objects.filter(session=self.session, id__lt=oldest).order_by('-id')[:51]))
+        return results
+
+    def test_indexes(self):
+        after = self.run_case('联合索引')
+        with connection.schema_editor() as editor:
+            for model in (ChatMessage, ChatSession):
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+        before = self.run_case('只有外键索引')
+        for name in after:
+            print(f'{name}: {before[name]:.2f} ms → {after[name]:.2f} ms')
@@ -0,0 +1,77 @@
+import socket
+import subprocess
+import sys
+import time
+from django.test import TestCase, override_settings
+from ai import map_reduce
+from ai.clients import close_clients
+from ai.services import AIService
+
+PARAGRAPHS = 120
+DELAY = 0.3   # 桩服务的首包耗时，模拟模型处理一次请求的时间
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def article(edited=None):
+    paragraphs = [f'第{i}节' + '长文章的正文内容' * (10 + i % 20) + '。' for i in range(PARAGRAPHS)]
+    if edited is not None:
+        paragraphs[edited] = paragraphs[edited].replace('正文', '修改', 1)
+    return '\n\n'.join(paragraphs)
+
+
+class LongSummaryBenchmark(TestCase):
+    """约 2 万字的文章：分段摘要在不同并发数下的耗时，以及修改一节后重新摘要的调用数"""
+
+    def setUp(self):
+        port = free_port()
+        self.stub = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.stub_openai', '--port', str(port), '--delay', str(DELAY),
+             '--reply-tokens', '50'],
+            stdout=subprocess.PIPE,
+        )
+        self.stub.stdout.readline()   # 等待启动完成
+        self.settings = override_settings(AI_BASE_URL=f'http://127.0.0.1:{port}/v1', AI_API_KEY='bench')
+        self.settings.enable()
+        close_clients()
+
+    def tearDown(self):
+        close_clients()
+        self.settings.disable()
+        self.stub.terminate()
+        self.stub.wait()
+
+    def run_case(self, name, content):
+        calls = []
+        original = AIService._summarize
+
+        def counted(service, prompt, max_tokens):
+            calls.append(max_tokens)
+            return original(service, prompt, max_tokens)
+
+        AIService._summarize = counted
+        try:
+            start = time.perf_counter()
+            map_reduce.summarize(AIService(timeout=30), content, 200)
+            elapsed = time.perf_counter() - start
+        finally:
+            AIService._summarize = original
+        print(f'{name}: {elapsed:.2f}s，{len(calls)} 次模型调用')
+        return elapsed, len(calls)
+
+    def test_concurrency_and_cache(self):
+        content = article()
+        print(f'\n正文 {len(content)} 字，{len(map_reduce.split_content(content))} 段')
+        for concurrency in (1, 4, 8):
+            with override_settings(AI_SUMMARY_CONCURRENCY=concurrency):
+                # 每轮换一个模型名，分段缓存不命中
+                with override_settings(AI_MODEL=f'bench-{concurrency}'):
+                    self.run_case(f'并发 {concurrency}', content)
+
+        with override_settings(AI_MODEL='bench-4'):
+            _, calls = self.run_case('修改一节后重新摘要', article(edited=PARAGRAPHS // 2))
+        self.assertLessEqual(calls, 3)
@@ -0,0 +1,70 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from blog.models import Tag, Post
+
+User = get_user_model()
+
+TOTAL = 1000
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0, BLOG_BULK_MAX_ITEMS=TOTAL)
+class PostBulkBenchmark(TestCase):
+    """逐条创建 vs 批量创建 1000 篇文章"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='bench', password='benchpass123')
+        self.tags = [Tag.objects.create(name=f'标签{i}', slug=f'tag-{i}') for i in range(10)]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def items(self, prefix):
+        return [
+            {
+                'title': f'{prefix} 文章 {i}',
+                'content': f'第 {i} 篇导入文章的正文内容 benchmark content {i}',
+                'excerpt': '这是一篇批量导入文章的摘要',
+                'status': 'published',
+                'tags': [self.tags[i % 10].id, self.tags[(i + 3) % 10].id],
+            }
+            for i in range(TOTAL)
+        ]
+
+    def run_case(self, name, func):
+        # queries_log 有长度上限，用 execute_wrapper 计数
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        print(f'\n{name}: {elapsed:.2f}s, {queries} 条 SQL')
+        return elapsed
+
+    def test_single_vs_bulk(self):
+        def single():
+            for item in self.items('single'):
+                response = self.client.post('/api/blog/posts/', item, format='json')
+                assert response.status_code == 201, response.data
+
+        def bulk():
+            response = self.client.post('/api/blog/posts/bulk/', self.items('bulk'), format='json')
+            assert response.data['created'] == TOTAL, response.data
+
+        single_time = self.run_case(f'逐条创建 {TOTAL} 篇', single)
+        bulk_time = self.run_case(f'批量创建 {TOTAL} 篇', bulk)
+        print(f'加速比: {single_time / bulk_time:.1f}x')
+
+        self.assertEqual(Post.objects.count(), TOTAL * 2)
+        # 两种方式维护的标签文章数一致
+        for tag in Tag.objects.all():
+            self.assertEqual(tag.post_count, tag.post_set.filter(status='published').count())
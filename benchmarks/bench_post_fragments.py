@@ -0,0 +1,71 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from blog.fragments import FragmentListResponse, render_posts
+from blog.models import Tag, Post
+from blog.serializers import PostSerializer
+from blog.views import post_list_queryset
+
+User = get_user_model()
+
+PAGE_SIZE = 100
+ROUNDS = 50
+
+
+class PostFragmentBenchmark(TestCase):
+    """100 篇文章一页：每次重新序列化 vs 拼接缓存的 JSON 片段（只统计 CPU 时间）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='bench', password='benchpass123')
+        tags = [Tag.objects.create(name=f'标签{i}', slug=f'tag-{i}') for i in range(10)]
+        for i in range(PAGE_SIZE):
+            post = Post.objects.create(
+                title=f'性能测试文章 {i}',
+                content='正文' * 200,
+                excerpt='这是一篇用于性能测试的文章摘要',
+                author=user,
+                status='published',
+                view_count=i,
+            )
+            post.tags.add(tags[i % 10], tags[(i + 3) % 10])
+
+    def setUp(self):
+        cache.clear()
+        # 查询不计入对比，两种方式使用同一批已加载的对象
+        self.posts = list(post_list_queryset().filter(status='published').order_by('-created_at'))
+
+    def envelope(self):
+        return {'message': '获取文章列表成功', 'posts': None, 'count': PAGE_SIZE, 'next': None, 'previous': None}
+
+    def measure(self, func):
+        start = time.process_time()
+        for _ in range(ROUNDS):
+            body = func()
+        return (time.process_time() - start) / ROUNDS * 1000, body
+
+    def test_serialize_vs_splice(self):
+        renderer = JSONRenderer()
+
+        def serialize():
+            data = self.envelope()
+            data['posts'] = PostSerializer(self.posts, many=True).data
+            return renderer.render(data)
+
+        def splice():
+            response = FragmentListResponse(self.envelope(), 'posts', render_posts(self.posts))
+            response.accepted_renderer = renderer
+            response.accepted_media_type = renderer.media_type
+            response.renderer_context = {}
+            return response.rendered_content
+
+        render_posts(self.posts)  # 预热片段缓存
+        serialize_ms, expected = self.measure(serialize)
+        splice_ms, body = self.measure(splice)
+        print(f'\n序列化 {PAGE_SIZE} 篇: {serialize_ms:.2f} ms/页')
+        print(f'拼接片段 {PAGE_SIZE} 篇: {splice_ms:.2f} ms/页（含缓存读取）')
+        print(f'节省 CPU: {(1 - splice_ms / serialize_ms) * 100:.0f}%')
+
+        self.assertEqual(body, expected)
@@ -0,0 +1,98 @@
+"""
+相关文章全量重建压测：合成语料，统计各阶段耗时和邻居的主题准确率
+
+    python manage.py test benchmarks.bench_related
+
+文章数通过环境变量调整（默认 20000，目标是 10 万篇在几分钟内完成）：
+    RELATED_POSTS=100000 python manage.py test benchmarks.bench_related
+"""
+import os
+import random
+import time
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+from blog.models import Post, RelatedPost
+from blog.related import build_vectors, rebuild_related, to_matrix, top_k
+
+User = get_user_model()
+
+POSTS = int(os.getenv('RELATED_POSTS', '20000'))
+TOPICS = 200
+K = 10
+
+
+def corpus(total, seed=0):
+    """
+    合成语料：每篇文章属于一个主题，正文由该主题的专有词、
+    所有文章共用的常见词和少量其他主题的词混合而成
+    """
+    rng = random.Random(seed)
+    chars = [chr(c) for c in range(0x4e00, 0x4e00 + 3000)]
+    word = lambda: ''.join(rng.choice(chars) for _ in range(2))
+    common = [word() for _ in range(300)]
+    topics = [[word() for _ in range(40)] for _ in range(TOPICS)]
+    for i in range(total):
+        topic = i % TOPICS
+        noise = [w for _ in range(8) for w in rng.choices(topics[rng.randrange(TOPICS)], k=5)]
+        words = rng.choices(topics[topic], k=20) + rng.choices(common, k=120) + noise
+        rng.shuffle(words)
+        yield topic, ' '.join(words[:8]), ' '.join(words)
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
+class RelatedRebuildBenchmark(TransactionTestCase):
+    """全量重建 POSTS 篇文章的相关文章表"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='bench', password='benchpass123')
+        started = time.perf_counter()
+        self.topics = {}
+        posts = []
+        for topic, title, content in corpus(POSTS):
+            posts.append(Post(title=title, content=content, excerpt='合成文章', author=user, status='published'))
+            self.topics[len(posts)] = topic
+        # bulk_create 不触发信号，不做增量更新
+        Post.objects.bulk_create(posts, batch_size=2000)
+        ids = list(Post.objects.order_by('id').values_list('id', flat=True))
+        self.topics = {pk: self.topics[i + 1] for i, pk in enumerate(ids)}
+        print(f'\n生成 {POSTS} 篇文章：{time.perf_counter() - started:.1f}s')
+
+    def precision(self, ids, neighbours):
+        """邻居中与本文同主题的比例"""
+        hits = total = 0
+        for pk, related in zip(ids, neighbours):
+            hits += sum(self.topics[r] == self.topics[pk] for r in related)
+            total += len(related)
+        return hits / total if total else 0
+
+    def test_phases(self):
+        """各阶段耗时：分词 + TF-IDF、稀疏矩阵批量 top-k、写入"""
+        started = time.perf_counter()
+        ids, vectors, idfs = build_vectors()
+        vectorized = time.perf_counter()
+        matrix = to_matrix(vectors)
+        neighbours = []
+        for start, rows, scores in top_k(matrix, K):
+            neighbours.extend([ids[j] for j in row] for row in rows.tolist())
+        ranked = time.perf_counter()
+        print(f'TF-IDF {vectorized - started:.1f}s（词表 {len(idfs)}，非零元 {matrix.nnz}），'
+              f'top-{K} {ranked - vectorized:.1f}s，同主题比例 {self.precision(ids, neighbours):.1%}')
+
+        started = time.perf_counter()
+        total, written = rebuild_related(K)
+        print(f'完整重建（含写入 {written} 条）：{time.perf_counter() - started:.1f}s')
+        self.assertEqual(total, POSTS)
+        self.assertEqual(RelatedPost.objects.count(), written)
+
+    def test_max_terms(self):
+        """向量保留的词元数：矩阵规模、top-k 耗时和准确率的取舍"""
+        for max_terms in (16, 32, 64, 128):
+            with override_settings(BLOG_RELATED_MAX_TERMS=max_terms):
+                ids, vectors, _ = build_vectors()
+            matrix = to_matrix(vectors)
+            started = time.perf_counter()
+            neighbours = []
+            for start, rows, scores in top_k(matrix, K):
+                neighbours.extend([ids[j] for j in row] for row in rows.tolist())
+            print(f'max_terms={max_terms}: 非零元 {matrix.nnz}，top-{K} {time.perf_counter() - started:.1f}s，'
+                  f'同主题比例 {self.precision(ids, neighbours):.1%}')
@@ -0,0 +1,121 @@
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+from ai.clients import close_clients
+from ai.models import ChatSession
+from ai.views import chat_stream
+from ai.write_behind import write_behind
+
+User = get_user_model()
+
+STREAMS = 40
+REPLY_TOKENS = 400
+TOKENS_PER_SECOND = 400   # 单个回复约 1 秒，每个片段一个字
+ROUNDS = 3
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class SSECoalesceBenchmark(TransactionTestCase):
+    """
+    流式对话逐片段发送 vs 合并成帧：每个响应的帧数和 CPU 时间（桩服务在独立进程中运行）
+    并发流会同时更新会话，需要使用文件数据库运行（内存 SQLite 的共享缓存会报 table is locked）
+    """
+
+    def setUp(self):
+        port = free_port()
+        self.stub = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.stub_openai', '--port', str(port),
+             '--reply-tokens', str(REPLY_TOKENS), '--tokens-per-second', str(TOKENS_PER_SECOND)],
+            stdout=subprocess.PIPE,
+        )
+        self.stub.stdout.readline()   # 等待启动完成
+        # 压测用户不受配额限制
+        self.settings = override_settings(AI_BASE_URL=f'http://127.0.0.1:{port}/v1', AI_API_KEY='bench', AI_QUOTAS={})
+        self.settings.enable()
+        close_clients()
+        self.user = User.objects.create_user(username='bench', password='benchpass123')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    def tearDown(self):
+        write_behind.flush()
+        close_clients()
+        self.settings.disable()
+        self.stub.terminate()
+        self.stub.wait()
+
+    def run_case(self, name):
+        factory = APIRequestFactory()
+        frames = []
+
+        def stream(i):
+            request = factory.post('/api/ai/chat/', {'session_id': sessions[i].id, 'message': f'问题 {i}'},
+                                   format='json', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+            # 每次 yield 对应 WSGI 服务器的一次 socket 写出，另一端由线程读空（相当于客户端/代理）
+            server, client = socket.socketpair()
+            drain = threading.Thread(target=lambda: all(iter(lambda: client.recv(65536), b'')))
+            drain.start()
+            count = 0
+            for frame in chat_stream(request).streaming_content:
+                server.sendall(frame)
+                count += 1
+            server.close()
+            drain.join()
+            client.close()
+            frames.append(count)
+
+        # 预先建好会话，避免 SQLite 并发写
+        sessions = ChatSession.objects.bulk_create([ChatSession(user=self.user) for _ in range(STREAMS)])
+        cpu, start = cpu_seconds(), time.perf_counter()
+        threads = [threading.Thread(target=stream, args=(i,)) for i in range(STREAMS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed, cpu = time.perf_counter() - start, cpu_seconds() - cpu
+
+        per_stream = sum(frames) / len(frames)
+        print(f'\n{name}: {per_stream:.0f} 帧/响应，CPU {cpu / STREAMS * 1000:.1f} ms/流，总耗时 {elapsed:.2f}s')
+        return per_stream, cpu / STREAMS
+
+    @override_settings(AI_WRITE_BEHIND_INTERVAL=0)
+    def test_per_chunk_vs_coalesced(self):
+        # 每种方式交替运行 ROUNDS 轮，取 CPU 中位数，减少机器负载波动的影响
+        cases = {
+            '逐片段发送': {'AI_SSE_COALESCE_MS': 0, 'AI_SSE_HEARTBEAT': 0},
+            '合并 30ms + 心跳（读取线程）': {},
+            '合并 30ms，无心跳（当前线程）': {'AI_SSE_HEARTBEAT': 0},
+        }
+        results = {name: [] for name in cases}
+        for _ in range(ROUNDS):
+            for name, options in cases.items():
+                with override_settings(**options):
+                    results[name].append(self.run_case(f'{name} x{STREAMS}'))
+
+        frames = {name: statistics.median(r[0] for r in runs) for name, runs in results.items()}
+        cpu = {name: statistics.median(r[1] for r in runs) for name, runs in results.items()}
+        baseline = '逐片段发送'
+        print()
+        for name in cases:
+            print(f'{name}: {frames[name]:.0f} 帧/响应，CPU 中位数 {cpu[name] * 1000:.1f} ms/流'
+                  f'（相对逐片段 {cpu[name] / cpu[baseline] - 1:+.0%}）')
+        for name in cases:
+            if name != baseline:
+                self.assertLess(frames[name], frames[baseline] / 5)
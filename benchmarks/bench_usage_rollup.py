@@ -0,0 +1,87 @@
+"""
+AI 用量报表：直接聚合调用日志 vs 读取汇总表
+
+    python manage.py test benchmarks.bench_usage_rollup
+
+日志条数通过环境变量调整（默认 50 万条，分布在 90 天内）：
+    USAGE_LOGS=2000000 python manage.py test benchmarks.bench_usage_rollup
+"""
+import os
+import random
+import time
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay
+from django.test import TransactionTestCase
+from django.utils import timezone
+from ai.models import AIUsageLog
+from ai.rollups import roll_up, usage_report
+
+User = get_user_model()
+
+LOGS = int(os.getenv('USAGE_LOGS', '500000'))
+USERS = 100
+DAYS = 90
+REPEAT = 20
+
+
+class UsageRollupBenchmark(TransactionTestCase):
+    """LOGS 条日志：最近 30 天每用户每天的调用数和 token 数"""
+
+    def setUp(self):
+        rng = random.Random(0)
+        users = User.objects.bulk_create([User(username=f'bench{i}') for i in range(USERS)])
+        started = time.perf_counter()
+        batch = []
+        for i in range(LOGS):
+            batch.append(AIUsageLog(
+                user=users[rng.randrange(USERS)], call_type=rng.choice(('chat', 'summarize')), model='bench-model',
+                prompt_summary='压测', prompt_tokens=rng.randrange(500), completion_tokens=rng.randrange(500),
+                total_tokens=rng.randrange(1000), response_time_ms=rng.randrange(3000),
+            ))
+            if len(batch) == 10000:
+                AIUsageLog.objects.bulk_create(batch)
+                batch = []
+        AIUsageLog.objects.bulk_create(batch)
+        # 按 id 顺序把创建时间铺到 DAYS 天内
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT MIN(id) FROM ai_usage_logs')
+            first = cursor.fetchone()[0]
+            step = DAYS * 86400 / LOGS
+            cursor.executemany(
+                'UPDATE ai_usage_logs SET created_at = %s WHERE id = %s',
+                [(now - timedelta(seconds=(LOGS - i) * step + 120), first + i) for i in range(LOGS)],
+            )
+        self.start = now - timedelta(days=30)
+        self.end = now
+        print(f'\n生成 {LOGS} 条日志：{time.perf_counter() - started:.1f}s')
+
+    def timed(self, name, func):
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            result = func()
+        per_call = (time.perf_counter() - start) / REPEAT * 1000
+        print(f'{name}: {per_call:.1f} ms，{len(result)} 行')
+        return per_call
+
+    def test_raw_vs_rollup(self):
+        def raw():
+            return list(
+                AIUsageLog.objects.filter(created_at__gte=self.start, created_at__lt=self.end)
+                .annotate(day=TruncDay('created_at'))
+                .values('day', 'user_id')
+                .annotate(calls=Count('id'), total_tokens=Sum('total_tokens'))
+                .order_by('day', 'user_id')
+            )
+
+        before = self.timed('直接聚合日志', raw)
+
+        started = time.perf_counter()
+        total = roll_up()
+        print(f'首次汇总 {total} 条：{time.perf_counter() - started:.1f}s')
+
+        after = self.timed('读取汇总表', lambda: usage_report('day', self.start, self.end)[0])
+        print(f'报表查询 {before:.1f} ms → {after:.1f} ms')
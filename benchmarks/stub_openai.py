@@ -0,0 +1,255 @@
+"""
+本地 OpenAI 兼容桩服务（只实现 /chat/completions）
+
+基准测试、压测中代替真实模型接口，不消耗 Token，排除网络抖动：
+    with StubServer(delay=0.01) as server:
+        settings.AI_BASE_URL = server.base_url
+
+也可以单独启动，把 AI_BASE_URL 指向它后压测整个站点：
+    python -m benchmarks.stub_openai --port 8765 --delay 0.3 --tokens-per-second 40 \
+        --reply-tokens 120 --rate-limit-rate 0.02 --server-error-rate 0.01 --timeout-rate 0.005
+
+- delay：首包耗时；tokens_per_second：流式输出速度（覆盖 chunk_delay）
+- reply_tokens > 0 时按提示词生成固定长度的回复，相同提示词的回复总是相同
+- 错误注入：timeout_rate（挂起 hang 秒后断开）、rate_limit_rate（429）、server_error_rate（500/503），
+  由 seed 决定的随机序列抽取，同样的请求顺序得到同样的错误分布
+"""
+import argparse
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # 支持 keep-alive
+
+    def setup(self):
+        super().setup()
+        # 头部和正文分开写出，关闭 Nagle 避免与延迟确认叠加出 40ms 等待
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # 每个处理器实例对应一条 TCP 连接
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fault = server.pick_fault()
+            server.outcomes[fault or 'ok'] += 1
+
+        if fault == 'timeout':
+            # 不返回任何内容，等客户端超时
+            time.sleep(server.hang)
+            self.close_connection = True
+            return
+        if server.delay:
+            time.sleep(server.delay)
+        if fault == 'rate_limit':
+            self.send_json({'error': {'message': 'Rate limit exceeded', 'type': 'rate_limit_error'}},
+                           status=429, headers={'Retry-After': '1'})
+            return
+        if fault == 'server_error':
+            code = 500 if server.requests % 2 else 503
+            self.send_json({'error': {'message': 'Upstream error', 'type': 'server_error'}}, status=code)
+            return
+
+        pieces = server.reply_for(body)
+        if body.get('stream'):
+            self.send_stream(body, pieces)
+        else:
+            self.send_json({
+                'id': 'stub',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'stub'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ''.join(pieces)},
+                    'finish_reason': 'stop',
+                }],
+                'usage': usage(body, pieces),
+            })
+
+    def send_json(self, data, status=200, headers=None):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, body, pieces):
+        """按 SSE 逐个片段返回，分块传输编码"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write(data):
+            line = f'data: {data}\n\n'.encode('utf-8')
+            self.wfile.write(f'{len(line):x}\r\n'.encode() + line + b'\r\n')
+            self.wfile.flush()
+
+        for text in pieces:
+            write(json.dumps({
+                'id': 'stub',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'stub'),
+                'choices': [{'index': 0, 'delta': {'content': text}, 'finish_reason': None}],
+            }))
+            if self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+        if (body.get('stream_options') or {}).get('include_usage'):
+            write(json.dumps({
+                'id': 'stub',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'stub'),
+                'choices': [],
+                'usage': usage(body, pieces),
+            }))
+        write('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+
+# 生成固定回复用的词表
+VOCABULARY = '的一是在了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经'
+
+
+def usage(body, pieces):
+    """按字符数近似 token 用量"""
+    prompt_tokens = sum(len(str(m.get('content', ''))) for m in body.get('messages', []))
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': len(pieces),
+            'total_tokens': prompt_tokens + len(pieces)}
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024   # 并发基准会瞬间建立大量连接
+
+    def pick_fault(self):
+        """按配置的比例抽取本次请求的错误类型（调用方持有锁）"""
+        roll = self.random.random()
+        for fault, rate in (('timeout', self.timeout_rate), ('rate_limit', self.rate_limit_rate),
+                            ('server_error', self.server_error_rate)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def reply_for(self, body):
+        """回复片段列表（一个片段计一个 token）"""
+        if not self.reply_tokens:
+            return list(self.reply)
+        seed = hashlib.sha256(json.dumps(body.get('messages', []), sort_keys=True).encode('utf-8')).digest()
+        rng = random.Random(seed)
+        return [rng.choice(VOCABULARY) for _ in range(self.reply_tokens)]
+
+
+class StubServer:
+    """
+    在后台线程运行的桩服务
+    :param delay: 每个请求返回前的等待（秒），模拟模型首包耗时
+    :param chunk_delay: 流式返回时每个片段之间的等待（秒）
+    :param tokens_per_second: 流式输出速度，设置后覆盖 chunk_delay
+    :param reply_tokens: 大于 0 时按提示词生成该长度的固定回复，否则逐字返回 reply
+    :param timeout_rate / rate_limit_rate / server_error_rate: 错误注入比例（0~1）
+    :param hang: 模拟超时的请求挂起多久（秒），应大于客户端超时
+    :param seed: 错误注入的随机种子
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0, chunk_delay=0, reply='这是桩服务的回复',
+                 tokens_per_second=0, reply_tokens=0, timeout_rate=0, rate_limit_rate=0,
+                 server_error_rate=0, hang=120, seed=0):
+        self.httpd = _HTTPServer((host, port), StubHandler)
+        self.httpd.lock = threading.Lock()
+        self.httpd.connections = 0
+        self.httpd.requests = 0
+        self.httpd.outcomes = Counter()
+        self.httpd.delay = delay
+        self.httpd.chunk_delay = 1 / tokens_per_second if tokens_per_second else chunk_delay
+        self.httpd.reply = reply
+        self.httpd.reply_tokens = reply_tokens
+        self.httpd.timeout_rate = timeout_rate
+        self.httpd.rate_limit_rate = rate_limit_rate
+        self.httpd.server_error_rate = server_error_rate
+        self.httpd.hang = hang
+        self.httpd.random = random.Random(seed)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    @property
+    def connections(self):
+        return self.httpd.connections
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def outcomes(self):
+        """各类结果的请求数：ok / timeout / rate_limit / server_error"""
+        return dict(self.httpd.outcomes)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地 OpenAI 兼容桩服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0, help='首包耗时（秒）')
+    parser.add_argument('--chunk-delay', type=float, default=0, help='流式片段间隔（秒）')
+    parser.add_argument('--tokens-per-second', type=float, default=0, help='流式输出速度，覆盖 --chunk-delay')
+    parser.add_argument('--reply-tokens', type=int, default=0, help='按提示词生成的固定回复长度')
+    parser.add_argument('--timeout-rate', type=float, default=0, help='挂起不响应的请求比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0, help='返回 429 的请求比例')
+    parser.add_argument('--server-error-rate', type=float, default=0, help='返回 500/503 的请求比例')
+    parser.add_argument('--hang', type=float, default=120, help='超时请求挂起的秒数')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = StubServer(
+        args.host, args.port, args.delay, args.chunk_delay,
+        tokens_per_second=args.tokens_per_second, reply_tokens=args.reply_tokens,
+        timeout_rate=args.timeout_rate, rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.server_error_rate, hang=args.hang, seed=args.seed,
+    )
+    print(f'桩服务已启动：{server.base_url}', flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(f'请求数 {server.requests}：{server.outcomes}')
+        server.stop()
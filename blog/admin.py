@@ -5,8 +5,9 @@ from .models import Tag,Post
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     """标签后台管理"""
-    list_display = ['name','slug','created_at']
+    list_display = ['name','slug','post_count','created_at']
     search_fields = ['name','slug']
+    readonly_fields = ['post_count']
     ordering = ['-created_at']
     list_per_page = 50
 
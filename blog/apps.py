@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class BlogConfig(AppConfig):
     name = 'blog'
+
+    def ready(self):
+        # 注册信号：文章/标签变更时使列表缓存失效
+        from . import signals  # noqa: F401
+        # 注册系统检查：缓存需要在多个 worker 之间共享
+        from . import checks  # noqa: F401
@@ -0,0 +1,190 @@
+import uuid
+from collections import defaultdict
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import Tag, Post
+from .related import update_related_many
+from .search import index_posts
+from .serializers import PostBulkItemSerializer
+from .signals import invalidate_list_cache
+from . import tag_counts, tag_index
+
+
+def bulk_save_posts(user, items):
+    """
+    批量创建/更新文章
+    - 不带 id 的条目创建新文章，带 id 的条目部分更新（只能修改自己的文章）
+    - 每条单独校验，校验失败的条目记入 errors，不影响其他条目
+    - 文章用 bulk_create / bulk_update 写入，标签关系一次性批量写入
+    :return: (results, errors)
+        results: [{'index': 0, 'id': 1, 'action': 'created'}, ...]
+        errors:  [{'index': 1, 'error': {...}}, ...]
+    """
+    errors = []
+    to_create = []   # [(index, Post, tag_ids)]
+    to_update = []   # [(index, Post, tag_ids | None, changed_fields)]
+
+    # 一次性取出校验需要的标签和待更新文章，避免逐条查询
+    tag_ids = set(Tag.objects.values_list('id', flat=True))
+    update_ids = [item['id'] for item in items if isinstance(item, dict) and isinstance(item.get('id'), int)]
+    existing = Post.objects.in_bulk(update_ids)
+    context = {'tag_ids': tag_ids}
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'error': '数据格式错误'})
+            continue
+
+        pk = item.get('id')
+        instance = None
+        if pk is not None:
+            instance = existing.get(pk)
+            if instance is None:
+                errors.append({'index': index, 'error': '文章不存在'})
+                continue
+            if instance.author_id != user.pk:
+                errors.append({'index': index, 'error': '无权修改他人的文章'})
+                continue
+
+        serializer = PostBulkItemSerializer(instance, data=item, partial=instance is not None, context=context)
+        if not serializer.is_valid():
+            errors.append({'index': index, 'error': serializer.errors})
+            continue
+
+        data = dict(serializer.validated_data)
+        data.pop('id', None)
+        item_tags = data.pop('tags', None)
+        if instance is None:
+            to_create.append((index, Post(author=user, **data), item_tags or []))
+        else:
+            for attr, value in data.items():
+                setattr(instance, attr, value)
+            to_update.append((index, instance, item_tags, list(data)))
+
+    with transaction.atomic():
+        changes = _create(to_create) + _update(to_update)
+        _sync_side_effects(changes)
+
+    results = [
+        {'index': index, 'id': post.pk, 'action': action}
+        for index, post, action in sorted(
+            [(i, p, 'created') for i, p, _ in to_create]
+            + [(i, p, 'updated') for i, p, _, _ in to_update],
+            key=lambda row: row[0],
+        )
+    ]
+    return results, errors
+
+
+def _create(to_create):
+    """批量插入文章和标签关系，返回变更记录"""
+    if not to_create:
+        return []
+
+    posts = [post for _, post, _ in to_create]
+    if connection.features.can_return_rows_from_bulk_insert:
+        Post.objects.bulk_create(posts, batch_size=500)
+    else:
+        _create_with_markers(posts)
+
+    through = Post.tags.through
+    through.objects.bulk_create([
+        through(post_id=post.pk, tag_id=tag_id)
+        for _, post, item_tags in to_create
+        for tag_id in item_tags
+    ], batch_size=1000)
+
+    # (文章, 原先是否已发布, 原标签, 新标签)
+    return [(post, False, [], item_tags) for _, post, item_tags in to_create]
+
+
+def _create_with_markers(posts):
+    """
+    数据库不支持 bulk_create 返回主键（如 MySQL）时：插入前把每篇文章的标题换成唯一标记，
+    按标记查出主键后再改回标题。在 bulk_save_posts 的事务中执行，其他连接看不到临时标题，
+    同名文章或同一作者的并发插入也不会对应错
+    """
+    titles = {}
+    for post in posts:
+        marker = uuid.uuid4().hex
+        titles[marker] = post.title
+        post.title = marker
+    # title 没有索引：先按主键范围和作者缩小到本次插入的行，再匹配标记
+    before = Post.objects.aggregate(latest=Max('id'))['latest'] or 0
+    Post.objects.bulk_create(posts, batch_size=500)
+
+    pks = dict(
+        Post.objects.filter(pk__gt=before, author_id__in={post.author_id for post in posts}, title__in=titles)
+        .values_list('title', 'id')
+    )
+    for post in posts:
+        post.pk = pks[post.title]
+        post.title = titles[post.title]
+    Post.objects.bulk_update(posts, ['title'], batch_size=500)
+
+
+def _update(to_update):
+    """批量更新文章和标签关系，返回变更记录"""
+    if not to_update:
+        return []
+
+    posts = [post for _, post, _, _ in to_update]
+    old_status = dict(Post.objects.filter(pk__in=[p.pk for p in posts]).values_list('id', 'status'))
+    old_tags = defaultdict(list)
+    through = Post.tags.through
+    for post_id, tag_id in through.objects.filter(post_id__in=old_status).values_list('post_id', 'tag_id'):
+        old_tags[post_id].append(tag_id)
+
+    # bulk_update 不会触发 auto_now，手动更新修改时间
+    now = timezone.now()
+    fields = {'updated_at'}
+    for _, post, _, changed in to_update:
+        post.updated_at = now
+        fields.update(changed)
+    Post.objects.bulk_update(posts, sorted(fields), batch_size=500)
+
+    retagged = [(post, item_tags) for _, post, item_tags, _ in to_update if item_tags is not None]
+    if retagged:
+        through.objects.filter(post_id__in=[post.pk for post, _ in retagged]).delete()
+        through.objects.bulk_create([
+            through(post_id=post.pk, tag_id=tag_id)
+            for post, item_tags in retagged
+            for tag_id in item_tags
+        ], batch_size=1000)
+
+    return [
+        (
+            post,
+            old_status[post.pk] == 'published',
+            old_tags[post.pk],
+            old_tags[post.pk] if item_tags is None else item_tags,
+        )
+        for _, post, item_tags, _ in to_update
+    ]
+
+
+def _sync_side_effects(changes):
+    """
+    bulk_create / bulk_update 不触发信号，这里统一完成信号里的维护工作：
+    标签文章数、标签文章列表、全文检索索引、相关文章、列表缓存
+    """
+    if not changes:
+        return
+
+    deltas = defaultdict(int)
+    changed = set()   # 文章列表有变化的标签
+    for post, was_published, old_tags, new_tags in changes:
+        before = set(old_tags) if was_published else set()
+        after = set(new_tags) if post.status == 'published' else set()
+        for tag_id in before:
+            deltas[tag_id] -= 1
+        for tag_id in after:
+            deltas[tag_id] += 1
+        changed |= before ^ after
+
+    tag_counts.adjust_many(deltas)
+    tag_index.invalidate(changed)
+    index_posts([post for post, _, _, _ in changes])
+    update_related_many([post for post, _, _, _ in changes])
+    invalidate_list_cache()
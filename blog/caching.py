@@ -0,0 +1,156 @@
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from .fragments import FragmentListResponse, FragmentPayload
+from .models import Tag
+
+# 全局代数：Post / Tag 任何变更都会让代数 +1，旧代数下的缓存自然失效
+# 代数必须存放在所有 worker 共享的缓存中（settings.CACHES，见 blog.checks），
+# 进程内缓存下其他 worker 感知不到变更，会在 BLOG_RESPONSE_CACHE_TIMEOUT 内返回旧数据
+GENERATION_KEY = 'blog:generation'
+
+
+def get_generation():
+    """获取当前缓存代数"""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # 用时间戳初始化，缓存被清空后也不会与旧代数重复
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """代数 +1，使所有列表响应缓存失效（无需扫描删除）"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_generation()
+
+
+def normalize_query(request):
+    """规范化查询参数：按参数名、参数值排序，page=1 视同不传"""
+    items = []
+    for key in sorted(request.query_params):
+        for value in sorted(request.query_params.getlist(key)):
+            if key == 'page' and value == '1':
+                continue
+            items.append((key, value))
+    return urlencode(items)
+
+
+def response_cache_key(prefix, request):
+    # 分页链接是绝对地址，需要区分访问域名
+    raw = f'{request.get_host()}?{normalize_query(request)}'
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'blog:resp:{prefix}:{get_generation()}:{digest}'
+
+
+def cache_list_response(prefix):
+    """
+    公开列表接口的响应缓存装饰器（用于 APIView 的 get 方法）
+    - 缓存键 = 代数 + 规范化后的查询参数
+    - 只缓存 200 响应，响应头 X-Cache 标明是否命中
+    - 片段拼接的响应缓存信封和片段，命中后同样直接拼接输出
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = response_cache_key(prefix, request)
+            data = cache.get(key)
+            if data is not None:
+                if isinstance(data, FragmentPayload):
+                    response = FragmentListResponse.from_payload(data)
+                else:
+                    response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                timeout = getattr(settings, 'BLOG_RESPONSE_CACHE_TIMEOUT', 300)
+                if isinstance(response, FragmentListResponse):
+                    cache.set(key, response.payload, timeout)
+                else:
+                    cache.set(key, response.data, timeout)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def post_validators(pk, updated_at):
+    """文章详情的校验值：ETag 和 Last-Modified 都来自 updated_at"""
+    return quote_etag(f'post-{pk}-{updated_at.timestamp()}'), updated_at
+
+
+def tag_list_validators():
+    """
+    标签列表的校验值：一次聚合查询取 max(created_at) 和总数
+    标签没有 updated_at，ETag 再混入缓存代数，改名、删除也能感知
+    标签变更必然使代数 +1，因此结果可以按代数缓存
+    """
+    generation = get_generation()
+    key = f'blog:tag-validators:{generation}'
+    validators = cache.get(key)
+    if validators is None:
+        stats = Tag.objects.aggregate(latest=Max('created_at'), total=Count('id'))
+        raw = f'{stats["latest"]}:{stats["total"]}:{generation}'
+        etag = quote_etag('tags-' + hashlib.md5(raw.encode('utf-8')).hexdigest())
+        validators = (etag, stats['latest'])
+        cache.set(key, validators, getattr(settings, 'BLOG_RESPONSE_CACHE_TIMEOUT', 300))
+    return validators
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def is_conditional(request):
+    """请求是否携带了缓存校验头"""
+    return 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def not_modified_response(request, etag, last_modified):
+    """
+    处理 If-None-Match / If-Modified-Since
+    客户端缓存仍然有效时返回 304 响应，否则返回 None
+    """
+    validators = set_validators(HttpResponse(), etag, last_modified)
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp, response=validators
+    )
+    return None if response is validators else response
+
+
+def conditional_get(get_validators):
+    """
+    条件请求装饰器（用于 APIView 的 get 方法）
+    先用廉价查询算出校验值，命中时直接返回 304，不再执行视图
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            etag, last_modified = get_validators()
+            response = not_modified_response(request, etag, last_modified)
+            if response is not None:
+                return response
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
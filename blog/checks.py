@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Tags, Warning, register
+from common.caches import is_process_local
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    列表缓存代数存放在 default 缓存中：进程内缓存下，一个 worker 上的修改
+    只让本进程的代数 +1，其他 worker 会继续返回旧的列表和 ETag，直到缓存过期
+    """
+    if settings.DEBUG or not is_process_local(caches['default']):
+        return []
+    return [Warning(
+        'default 缓存是进程内缓存，多个 worker 之间不共享列表缓存代数，修改后其他 worker 可能返回旧数据',
+        hint='设置 REDIS_URL 使用 Redis，或只以单进程运行',
+        id='blog.W001',
+    )]
+
+
+@register(Tags.caches)
+def check_view_count_cache(app_configs, **kwargs):
+    """
+    浏览量增量存放在进程内缓存时，flush_view_counts 命令（独立进程）看不到任何 worker 的增量，
+    worker 在两次刷新之间退出时增量也会丢失
+    """
+    alias = getattr(settings, 'BLOG_VIEW_COUNT_CACHE', 'default')
+    if settings.DEBUG or not is_process_local(caches[alias]):
+        return []
+    return [Warning(
+        f'BLOG_VIEW_COUNT_CACHE（{alias}）是进程内缓存，flush_view_counts 命令无法写回各 worker 的浏览量',
+        hint='设置 REDIS_URL 使用 Redis，或把 BLOG_VIEW_COUNT_CACHE 指向共享缓存',
+        id='blog.W002',
+    )]
@@ -0,0 +1,115 @@
+import hashlib
+import json
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from .serializers import PostSerializer
+
+# 单篇文章序列化结果（JSON 字节串）的缓存
+KEY_PREFIX = 'blog:post-json'
+
+# 列表响应缓存里保存的内容：信封字段 + 各篇文章的 JSON 片段
+FragmentPayload = namedtuple('FragmentPayload', ['envelope', 'key', 'fragments'])
+
+_renderer = JSONRenderer()
+
+
+def _dumps(value):
+    # JSONRenderer 对 None 返回空串，这里统一输出 null
+    return b'null' if value is None else _renderer.render(value)
+
+
+def fragment_key(post, fields=None):
+    """
+    片段缓存键
+    标题、摘要、状态等字段的修改都会更新 updated_at；
+    浏览量、作者用户名、标签关联的变化不会，只要输出了这些字段就一并计入
+    """
+    names = fields or PostSerializer.Meta.fields
+    parts = [post.pk, post.updated_at.timestamp(), ','.join(names)]
+    if 'view_count' in names:
+        parts.append(post.view_count)
+    if 'author' in names:
+        parts.append(post.author.username if post.author else '')
+    if 'tags' in names:
+        parts.append(','.join(str(tag.pk) for tag in post.tags.all()))
+    raw = ':'.join(map(str, parts))
+    return f'{KEY_PREFIX}:{post.pk}:{hashlib.md5(raw.encode("utf-8")).hexdigest()}'
+
+
+def render_posts(posts, fields=None):
+    """
+    返回每篇文章的 JSON 片段
+    命中缓存的直接复用，未命中的统一序列化一次后写回缓存
+    """
+    keys = [fragment_key(post, fields) for post in posts]
+    cached = cache.get_many(keys)
+    missing = [(key, post) for key, post in zip(keys, posts) if key not in cached]
+    if missing:
+        data = PostSerializer([post for _, post in missing], many=True, fields=fields).data
+        rendered = {key: _dumps(item) for (key, _), item in zip(missing, data)}
+        cache.set_many(rendered, getattr(settings, 'BLOG_FRAGMENT_CACHE_TIMEOUT', 86400))
+        cached.update(rendered)
+    return [cached[key] for key in keys]
+
+
+class FragmentListResponse(Response):
+    """
+    由预渲染片段拼接的列表响应
+    JSON 渲染时把片段直接拼进信封，不再经过序列化器；
+    其他渲染器（如可浏览 API）或访问 response.data 时才解码成普通数据
+    """
+
+    def __init__(self, envelope, key, fragments, **kwargs):
+        self.payload = FragmentPayload(envelope, key, fragments)
+        super().__init__(None, **kwargs)
+
+    @classmethod
+    def from_payload(cls, payload):
+        return cls(*payload)
+
+    @property
+    def data(self):
+        if self._data is None and self.payload is not None:
+            envelope, key, fragments = self.payload
+            data = {}
+            for name, value in envelope.items():
+                data[name] = value
+                if name == key:
+                    data[name] = [json.loads(fragment) for fragment in fragments]
+            self._data = data
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        renderer = getattr(self, 'accepted_renderer', None)
+        if (
+            type(renderer) is not JSONRenderer
+            or renderer.get_indent(self.accepted_media_type, self.renderer_context)
+        ):
+            return super().rendered_content
+
+        self['Content-Type'] = self.content_type or renderer.media_type
+        envelope, key, fragments = self.payload
+        parts = []
+        for name, value in envelope.items():
+            if name == key:
+                value = b'[' + b','.join(fragments) + b']'
+            else:
+                value = _dumps(value)
+            parts.append(_dumps(name) + b':' + value)
+        return b'{' + b','.join(parts) + b'}'
+
+
+def fragment_list_response(envelope, posts, fields=None, key='posts'):
+    """
+    构造文章列表响应
+    :param envelope: 信封字段（按输出顺序），key 对应的值会被片段列表替换
+    """
+    return FragmentListResponse(envelope, key, render_posts(posts, fields))
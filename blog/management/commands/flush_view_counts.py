@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from common.caches import is_process_local
+from blog.models import Post
+from blog.view_counter import view_counter
+
+
+class Command(BaseCommand):
+    """
+    立即把缓冲区中的文章浏览量写入数据库
+    命令在独立进程中运行，只能写回共享缓存（BLOG_VIEW_COUNT_CACHE 指向 Redis 等）中的增量
+    用法：python manage.py flush_view_counts
+    """
+    help = '立即把缓冲区中的文章浏览量写入数据库'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='每批检查的文章数（默认 1000）'
+        )
+
+    def handle(self, *args, **options):
+        if is_process_local(view_counter.cache):
+            raise CommandError('BLOG_VIEW_COUNT_CACHE 是进程内缓存，本命令看不到各 worker 的浏览量增量，请配置共享缓存（REDIS_URL）')
+
+        chunk_size = options['chunk_size']
+        flushed = 0
+        batch = []
+
+        # 按 id 扫描全部文章，连同其他 worker 累积在共享缓存中的增量一起写回
+        ids = Post.objects.order_by('id').values_list('id', flat=True)
+        for pk in ids.iterator(chunk_size=chunk_size):
+            batch.append(pk)
+            if len(batch) >= chunk_size:
+                flushed += view_counter.flush(batch, blocking=True)
+                batch = []
+        if batch:
+            flushed += view_counter.flush(batch, blocking=True)
+
+        self.stdout.write(self.style.SUCCESS(f'已写入 {flushed} 篇文章的浏览量'))
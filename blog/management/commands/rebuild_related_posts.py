@@ -0,0 +1,43 @@
+import time
+from django.core.management.base import BaseCommand
+from blog.related import rebuild_related
+
+
+class Command(BaseCommand):
+    """
+    全量重建相关文章表（TF-IDF 词表、文章向量和每篇文章的相似文章）
+    用法：python manage.py rebuild_related_posts
+    """
+    help = '全量重建相关文章表'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=None,
+            help='每篇文章保留的相关文章数（默认 BLOG_RELATED_COUNT）'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='读取文章时每批的文章数（默认 500）'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=256,
+            help='计算相似度时每次矩阵乘法的行数（默认 256）'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total, written = rebuild_related(
+            k=options['count'],
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'已为 {total} 篇文章计算相关文章，写入 {written} 条记录，耗时 {elapsed:.1f} 秒'
+        ))
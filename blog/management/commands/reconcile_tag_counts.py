@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from blog.tag_counts import reconcile
+
+
+class Command(BaseCommand):
+    """
+    按文章-标签关系表重新统计标签的已发布文章数
+    用法：python manage.py reconcile_tag_counts
+    """
+    help = '校正标签的已发布文章数（post_count）'
+
+    def handle(self, *args, **options):
+        fixed = reconcile()
+        self.stdout.write(self.style.SUCCESS(f'已校正 {fixed} 个标签的文章数'))
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='blog_post_status_created_idx'),
+        ),
+    ]
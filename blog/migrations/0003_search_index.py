@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_post_status_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='blog.post', verbose_name='文章')),
+                ('length', models.PositiveIntegerField(default=0, verbose_name='词元数')),
+            ],
+            options={
+                'verbose_name': '检索文档',
+                'verbose_name_plural': '检索文档',
+                'db_table': 'blog_search_document',
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='词元')),
+                ('tf', models.PositiveIntegerField(default=0, verbose_name='词频')),
+                ('doc_length', models.PositiveIntegerField(default=0, verbose_name='文档长度')),
+                ('weight', models.FloatField(default=0, verbose_name='权重')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_postings', to='blog.post', verbose_name='文章')),
+            ],
+            options={
+                'verbose_name': '倒排索引',
+                'verbose_name_plural': '倒排索引',
+                'db_table': 'blog_search_posting',
+                'indexes': [models.Index(fields=['term', '-weight'], name='blog_search_term_weight_idx')],
+                'constraints': [models.UniqueConstraint(fields=('term', 'post'), name='blog_search_term_post_uniq')],
+            },
+        ),
+    ]
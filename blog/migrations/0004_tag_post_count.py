@@ -0,0 +1,40 @@
+# Generated by Django 6.0.1 on 2026-10-17 01:44
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_post_count(apps, schema_editor):
+    """按关系表统计已有标签的已发布文章数（与 blog.tag_counts.reconcile 相同）"""
+    Tag = apps.get_model('blog', 'Tag')
+    Post = apps.get_model('blog', 'Post')
+    actual = (
+        Post.tags.through.objects
+        .filter(post__status='published')
+        .values('tag_id')
+        .annotate(total=Count('post_id'))
+        .values_list('tag_id', 'total')
+    )
+    Tag.objects.bulk_update(
+        [Tag(pk=tag_id, post_count=total) for tag_id, total in actual], ['post_count'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='文章数'),
+        ),
+        migrations.RunPython(backfill_post_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-post_count', 'id'], name='blog_tag_post_count_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0.1 on 2026-10-17 02:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_tag_post_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedTerm',
+            fields=[
+                ('term', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='词元')),
+                ('idf', models.FloatField(verbose_name='逆文档频率')),
+            ],
+            options={
+                'verbose_name': '相关文章词表',
+                'verbose_name_plural': '相关文章词表',
+                'db_table': 'blog_related_term',
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedVector',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='related_vector', serialize=False, to='blog.post', verbose_name='文章')),
+                ('vector', models.JSONField(default=dict, verbose_name='词元权重')),
+            ],
+            options={
+                'verbose_name': '文章向量',
+                'verbose_name_plural': '文章向量',
+                'db_table': 'blog_related_vector',
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='相似度')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_entries', to='blog.post', verbose_name='文章')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.post', verbose_name='相关文章')),
+            ],
+            options={
+                'verbose_name': '相关文章',
+                'verbose_name_plural': '相关文章',
+                'db_table': 'blog_related_post',
+                'indexes': [models.Index(fields=['post', '-score'], name='blog_related_post_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('post', 'related'), name='blog_related_post_uniq')],
+            },
+        ),
+    ]
@@ -20,12 +20,24 @@ class Tag(models.Model):
         auto_now_add=True,
         verbose_name='创建时间'
     )
+
+    # 冗余字段：使用该标签的已发布文章数，由信号增量维护
+    # 可用 python manage.py reconcile_tag_counts 校正
+    post_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='文章数'
+    )
     class Meta:
         db_table = 'blog_tag'
         verbose_name = '标签'
         verbose_name_plural = '标签'
         ordering = ['-created_at']
 
+        indexes = [
+            # 标签云按热度排序分页
+            models.Index(fields=['-post_count', 'id'], name='blog_tag_post_count_idx'),
+        ]
+
     # 返回标签名
     def __str__(self):
         return self.name
@@ -98,7 +110,140 @@ class Post(models.Model):
         # ordering=['-created_at']：文章列表默认按创建时间倒序，最新的在前
         ordering = ['-created_at']
 
+        indexes = [
+            # 复合索引：支撑"已发布文章按 (created_at, id) 游标分页"的索引 seek
+            models.Index(
+                fields=['status', 'created_at', 'id'],
+                name='blog_post_status_created_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.title
 
-    
+
+class SearchDocument(models.Model):
+    """全文检索文档：每篇已发布文章一行，记录文档长度（BM25 需要）"""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        verbose_name='文章'
+    )
+    length = models.PositiveIntegerField(
+        default=0,
+        verbose_name='词元数'
+    )
+
+    class Meta:
+        db_table = 'blog_search_document'
+        verbose_name = '检索文档'
+        verbose_name_plural = '检索文档'
+
+
+class SearchPosting(models.Model):
+    """倒排索引：词元 → 文章，按 BM25 权重排序存储"""
+    term = models.CharField(
+        max_length=64,
+        verbose_name='词元'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_postings',
+        verbose_name='文章'
+    )
+    tf = models.PositiveIntegerField(
+        default=0,
+        verbose_name='词频'
+    )
+    # 冗余文档长度，重建时无需关联 SearchDocument 即可重算权重
+    doc_length = models.PositiveIntegerField(
+        default=0,
+        verbose_name='文档长度'
+    )
+    # BM25 中与 idf 无关的部分：tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+    weight = models.FloatField(
+        default=0,
+        verbose_name='权重'
+    )
+
+    class Meta:
+        db_table = 'blog_search_posting'
+        verbose_name = '倒排索引'
+        verbose_name_plural = '倒排索引'
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'post'], name='blog_search_term_post_uniq'),
+        ]
+        indexes = [
+            # 查询时按词元取权重最高的若干条，走索引有序扫描
+            models.Index(fields=['term', '-weight'], name='blog_search_term_weight_idx'),
+        ]
+
+
+class RelatedTerm(models.Model):
+    """相关文章词表：参与计算的词元及其 idf，全量重建时写入，增量更新时复用"""
+    term = models.CharField(
+        max_length=64,
+        primary_key=True,
+        verbose_name='词元'
+    )
+    idf = models.FloatField(
+        verbose_name='逆文档频率'
+    )
+
+    class Meta:
+        db_table = 'blog_related_term'
+        verbose_name = '相关文章词表'
+        verbose_name_plural = '相关文章词表'
+
+
+class RelatedVector(models.Model):
+    """文章的 TF-IDF 向量（已归一化，只保留权重最高的若干词元），增量计算相似度时使用"""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='related_vector',
+        verbose_name='文章'
+    )
+    vector = models.JSONField(
+        default=dict,
+        verbose_name='词元权重'
+    )
+
+    class Meta:
+        db_table = 'blog_related_vector'
+        verbose_name = '文章向量'
+        verbose_name_plural = '文章向量'
+
+
+class RelatedPost(models.Model):
+    """预计算的相关文章：每篇已发布文章保留 TF-IDF 余弦相似度最高的若干篇"""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='related_entries',
+        verbose_name='文章'
+    )
+    related = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='相关文章'
+    )
+    score = models.FloatField(
+        verbose_name='相似度'
+    )
+
+    class Meta:
+        db_table = 'blog_related_post'
+        verbose_name = '相关文章'
+        verbose_name_plural = '相关文章'
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'related'], name='blog_related_post_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['post', '-score'], name='blog_related_post_score_idx'),
+        ]
@@ -0,0 +1,10 @@
+from common.pagination import KeysetPagination
+
+
+class PostCursorPagination(KeysetPagination):
+    """
+    文章列表游标分页器（keyset 分页）
+
+    按 (created_at, id) 倒序做索引 seek，第 1 页和第 5000 页的代价相同
+    """
+    time_field = 'created_at'
@@ -0,0 +1,367 @@
+import heapq
+import math
+import numpy as np
+from collections import Counter, defaultdict
+from scipy import sparse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from .models import Post, RelatedPost, RelatedTerm, RelatedVector, SearchPosting
+from .search import document_terms
+
+# 批量查询时每次 IN 的最大参数个数（SQLite 有参数个数上限）
+QUERY_CHUNK = 500
+
+# top_k 每批相似度矩阵的最大元素数（行数 × 文章数），10 万篇文章时每批 40 行
+TOP_K_CELLS = 4_000_000
+
+
+def _count():
+    """每篇文章保留的相关文章数"""
+    return getattr(settings, 'BLOG_RELATED_COUNT', 10)
+
+
+def _max_terms():
+    """每篇文章只保留权重最高的若干词元，控制矩阵规模"""
+    return getattr(settings, 'BLOG_RELATED_MAX_TERMS', 64)
+
+
+def _max_df():
+    """出现在超过该比例文章中的词元区分度太低，不参与计算"""
+    return getattr(settings, 'BLOG_RELATED_MAX_DF', 0.2)
+
+
+def idf(df, total):
+    """平滑 idf：log((1 + N) / (1 + df)) + 1"""
+    return math.log((1 + total) / (1 + df)) + 1
+
+
+def vectorize(counts, idfs):
+    """
+    TF-IDF 向量（次线性词频 1 + log(tf)，L2 归一化）
+    :param counts: 词频 Counter
+    :param idfs: 词元 → idf，不在其中的词元忽略
+    :return: {词元: 权重}，只保留权重最高的 BLOG_RELATED_MAX_TERMS 个
+    """
+    weights = {term: (1 + math.log(tf)) * idfs[term] for term, tf in counts.items() if term in idfs}
+    if len(weights) > _max_terms():
+        weights = dict(heapq.nlargest(_max_terms(), weights.items(), key=lambda item: item[1]))
+    norm = math.sqrt(sum(w * w for w in weights.values()))
+    return {term: round(w / norm, 6) for term, w in weights.items()} if norm else {}
+
+
+def _published():
+    return Post.objects.filter(status='published').only('id', 'title', 'excerpt', 'content').order_by('id')
+
+
+def _load_idfs(terms):
+    idfs = {}
+    terms = list(terms)
+    for start in range(0, len(terms), QUERY_CHUNK):
+        idfs.update(RelatedTerm.objects.filter(term__in=terms[start:start + QUERY_CHUNK]).values_list('term', 'idf'))
+    return idfs
+
+
+def build_vectors(chunk_size=500):
+    """
+    两遍扫描已发布文章：第一遍统计文档频率，第二遍生成 TF-IDF 向量
+    （分词两次，避免在内存中保留全部文章的词频）
+    :return: (文章 id 列表, 向量列表, {词元: idf})
+    """
+    df = Counter()
+    total = 0
+    for post in _published().iterator(chunk_size=chunk_size):
+        df.update(document_terms(post).keys())
+        total += 1
+
+    # 只出现在一篇文章中的词元无法关联两篇文章；过于常见的词元区分度低
+    max_df = max(2, int(_max_df() * total))
+    idfs = {term: idf(n, total) for term, n in df.items() if 2 <= n <= max_df}
+    del df
+
+    ids, vectors = [], []
+    for post in _published().iterator(chunk_size=chunk_size):
+        ids.append(post.pk)
+        vectors.append(vectorize(document_terms(post), idfs))
+    return ids, vectors, idfs
+
+
+def to_matrix(vectors):
+    """向量列表 → CSR 稀疏矩阵（每行一篇文章，float32）"""
+    columns = {}
+    indptr, indices, data = [0], [], []
+    for vector in vectors:
+        indices.extend(columns.setdefault(term, len(columns)) for term in vector)
+        data.extend(vector.values())
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(vectors), len(columns)),
+    )
+
+
+def top_k(matrix, k, batch_size=256):
+    """
+    批量计算每行的 k 个最近邻（行已归一化，点积即余弦相似度）
+    每批与整个矩阵做一次稀疏矩阵乘法，结果保持稀疏，按行在非零元中取前 k；
+    每批行数 × 总行数不超过 TOP_K_CELLS，结果矩阵即使全部非零，内存也有上限
+    :yield: (起始行号, 邻居行号数组 [batch, k], 相似度数组 [batch, k])，相似度为 0 表示没有邻居
+    """
+    total = matrix.shape[0]
+    k = min(k, total - 1)
+    if k <= 0:
+        return
+    transposed = matrix.T.tocsr()
+    batch_size = max(1, min(batch_size, TOP_K_CELLS // total))
+    for start in range(0, total, batch_size):
+        stop = min(start + batch_size, total)
+        product = (matrix[start:stop] @ transposed).tocsr()
+        rows = np.repeat(np.arange(stop - start), np.diff(product.indptr))
+        columns, scores = product.indices, product.data
+        # 排除自身和相似度为 0 的元素
+        keep = (columns != rows + start) & (scores > 0)
+        rows, columns, scores = rows[keep], columns[keep], scores[keep]
+        # 按行、相似度从高到低排序，算出每个元素在行内的名次
+        order = np.lexsort((columns, -scores, rows))
+        rows, columns, scores = rows[order], columns[order], scores[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        top = rank < k
+
+        neighbours = np.zeros((stop - start, k), dtype=np.int64)
+        best = np.zeros((stop - start, k), dtype=np.float32)
+        neighbours[rows[top], rank[top]] = columns[top]
+        best[rows[top], rank[top]] = scores[top]
+        yield start, neighbours, best
+
+
+def rebuild_related(k=None, chunk_size=500, batch_size=256):
+    """
+    全量重建词表、文章向量和相关文章表
+    :return: (文章数, 写入的相关文章记录数)
+    """
+    k = k or _count()
+    ids, vectors, idfs = build_vectors(chunk_size)
+    matrix = to_matrix(vectors)
+
+    with transaction.atomic():
+        RelatedPost.objects.all().delete()
+        RelatedVector.objects.all().delete()
+        RelatedTerm.objects.all().delete()
+        RelatedTerm.objects.bulk_create(
+            (RelatedTerm(term=term, idf=value) for term, value in idfs.items()), batch_size=5000
+        )
+        RelatedVector.objects.bulk_create(
+            (RelatedVector(post_id=pk, vector=vector) for pk, vector in zip(ids, vectors)), batch_size=2000
+        )
+        written = 0
+        for start, neighbours, scores in top_k(matrix, k, batch_size):
+            rows = [
+                RelatedPost(post_id=ids[start + i], related_id=ids[j], score=float(score))
+                for i in range(len(neighbours))
+                for j, score in zip(neighbours[i].tolist(), scores[i].tolist())
+                if score > 0
+            ]
+            RelatedPost.objects.bulk_create(rows, batch_size=5000)
+            written += len(rows)
+    return len(ids), written
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), QUERY_CHUNK):
+        yield values[start:start + QUERY_CHUNK]
+
+
+def _dot(vector, other):
+    return sum(weight * other.get(term, 0) for term, weight in vector.items())
+
+
+def _load_vectors(post_ids):
+    vectors = {}
+    for chunk in _chunks(post_ids):
+        vectors.update(RelatedVector.objects.filter(post_id__in=chunk).values_list('post_id', 'vector'))
+    return vectors
+
+
+def _postings(terms, per_term):
+    """每个词元 BM25 权重最高的 per_term 条倒排记录，每 QUERY_CHUNK 个词元一次查询"""
+    postings = defaultdict(list)
+    for chunk in _chunks(terms):
+        rows = (
+            SearchPosting.objects.filter(term__in=chunk)
+            .annotate(rank=Window(RowNumber(), partition_by=F('term'), order_by=F('weight').desc()))
+            .filter(rank__lte=per_term)
+            .values_list('term', 'post_id', 'weight')
+        )
+        for term, post_id, weight in rows:
+            postings[term].append((post_id, weight))
+    return postings
+
+
+def _neighbours(vectors, k):
+    """
+    批量计算若干文章的相关文章，查询次数与文章数无关
+    候选来自全文检索的倒排索引：每篇取权重最高的 16 个词元，每个词元读取 BM25 词频权重最高的
+    BLOG_RELATED_POSTINGS_PER_TERM 条倒排记录，按 向量权重 × BM25 词频权重 累加打分，
+    取得分最高的 BLOG_RELATED_CANDIDATES 篇，再与候选文章已保存的向量计算余弦相似度
+    :param vectors: {文章 id: 向量}，这些文章互为候选时使用这里的向量
+    :return: {文章 id: [(文章 id, 相似度)]}，按相似度从高到低
+    """
+    per_term = getattr(settings, 'BLOG_RELATED_POSTINGS_PER_TERM', 200)
+    limit = getattr(settings, 'BLOG_RELATED_CANDIDATES', 100)
+    top_terms = {
+        pk: heapq.nlargest(16, vector.items(), key=lambda item: item[1]) for pk, vector in vectors.items()
+    }
+    # 多取一条：倒排记录里可能有文章自身
+    postings = _postings({term for terms in top_terms.values() for term, _ in terms}, per_term + 1)
+
+    candidates = {}
+    for pk, terms in top_terms.items():
+        scores = Counter()
+        for term, weight in terms:
+            for post_id, bm25 in postings.get(term, ()):
+                if post_id != pk:
+                    scores[post_id] += weight * bm25
+        candidates[pk] = [post_id for post_id, _ in scores.most_common(limit)]
+
+    others = _load_vectors({pk for ids in candidates.values() for pk in ids} - vectors.keys())
+    others.update(vectors)
+    result = {}
+    for pk, vector in vectors.items():
+        scored = [(other, _dot(vector, others.get(other, {}))) for other in candidates[pk]]
+        result[pk] = heapq.nlargest(
+            k, [item for item in scored if item[1] > 0], key=lambda item: (item[1], -item[0])
+        )
+    return result
+
+
+def related_for(post, vector, k=None):
+    """
+    单篇文章的相关文章（增量计算）
+    :return: [(文章 id, 相似度)]，按相似度从高到低
+    """
+    return _neighbours({post.pk: vector}, k or _count())[post.pk]
+
+
+def update_related(post):
+    """文章保存后增量更新，见 update_related_many"""
+    update_related_many([post])
+
+
+@transaction.atomic
+def update_related_many(posts):
+    """
+    文章保存后批量增量更新，所有查询按批合并，查询次数与文章数无关
+    - 重算这些文章的向量和相关文章列表；未发布的文章删除向量和列表
+    - 其他文章列表中指向它们的记录按新向量更新相似度，已下线或不再相似的记录移除
+    - 相似度足够高时把它们加入新邻居的列表（挤掉对方列表中最不相关的一篇）
+    - 因移除记录而变短的列表重新计算，不会随编辑越来越短
+    idf 沿用上次全量重建的词表，新出现的词元要等下次重建才参与计算
+    """
+    if not posts:
+        return
+    k = _count()
+    ids = {post.pk for post in posts}
+    terms = {post.pk: document_terms(post) for post in posts if post.status == 'published'}
+    idfs = _load_idfs({term for counts in terms.values() for term in counts})
+    vectors = {pk: vectorize(counts, idfs) for pk, counts in terms.items()}
+
+    RelatedPost.objects.filter(post_id__in=ids).delete()
+    RelatedVector.objects.filter(post_id__in=ids).delete()
+    RelatedVector.objects.bulk_create([RelatedVector(post_id=pk, vector=vector) for pk, vector in vectors.items()])
+    outgoing = _neighbours({pk: vector for pk, vector in vectors.items() if vector}, k)
+
+    # 受影响的其他文章列表：原先指向这些文章的，以及新邻居的
+    touched = set()
+    for chunk in _chunks(ids):
+        touched.update(RelatedPost.objects.filter(related_id__in=chunk).values_list('post_id', flat=True))
+    touched.update(pk for neighbours in outgoing.values() for pk, _ in neighbours)
+    touched -= ids
+
+    lists = defaultdict(dict)   # 文章 id → {相关文章 id: 相似度}
+    existing = {}               # (文章 id, 相关文章 id) → (记录 id, 相似度)
+    for chunk in _chunks(touched):
+        rows = RelatedPost.objects.filter(post_id__in=chunk).values_list('id', 'post_id', 'related_id', 'score')
+        for row_id, post_id, related_id, score in rows:
+            lists[post_id][related_id] = score
+            existing[(post_id, related_id)] = (row_id, score)
+
+    stored = _load_vectors(touched)
+    refill = set()
+    for post_id, entries in lists.items():
+        for related_id in entries.keys() & ids:
+            score = _dot(vectors.get(related_id, {}), stored.get(post_id, {}))
+            if score > 0:
+                entries[related_id] = score
+            else:
+                del entries[related_id]
+                refill.add(post_id)
+
+    for pk, neighbours in outgoing.items():
+        for other, score in neighbours:
+            entries = lists[other]
+            if other in ids or pk in entries:
+                continue
+            if len(entries) >= k:
+                weakest = min(entries, key=lambda related_id: (entries[related_id], -related_id))
+                if score <= entries[weakest]:
+                    continue
+                del entries[weakest]
+            entries[pk] = score
+
+    lists.update(
+        (pk, dict(neighbours))
+        for pk, neighbours in _neighbours({pk: stored[pk] for pk in refill if stored.get(pk)}, k).items()
+    )
+
+    to_delete, to_update, to_create = [], [], []
+    for post_id, entries in lists.items():
+        for related_id, score in entries.items():
+            row = existing.get((post_id, related_id))
+            if row is None:
+                to_create.append(RelatedPost(post_id=post_id, related_id=related_id, score=score))
+            elif row[1] != score:
+                to_update.append(RelatedPost(id=row[0], score=score))
+    for (post_id, related_id), (row_id, _) in existing.items():
+        if related_id not in lists[post_id]:
+            to_delete.append(row_id)
+    to_create.extend(
+        RelatedPost(post_id=pk, related_id=other, score=score)
+        for pk, neighbours in outgoing.items()
+        for other, score in neighbours
+    )
+
+    for chunk in _chunks(to_delete):
+        RelatedPost.objects.filter(id__in=chunk).delete()
+    RelatedPost.objects.bulk_update(to_update, ['score'], batch_size=1000)
+    RelatedPost.objects.bulk_create(to_create, batch_size=1000)
+
+
+@transaction.atomic
+def refill_related(post_ids):
+    """
+    按已保存的向量重新计算若干文章的相关文章列表，查询次数与文章数无关
+    文章删除时，其他文章列表中指向它的记录被级联删除，由删除信号对这些文章调用，列表不会变短
+    """
+    post_ids = set(post_ids)
+    if not post_ids:
+        return
+    stored = _load_vectors(post_ids)
+    neighbours = _neighbours({pk: vector for pk, vector in stored.items() if vector}, _count())
+    for chunk in _chunks(post_ids):
+        RelatedPost.objects.filter(post_id__in=chunk).delete()
+    RelatedPost.objects.bulk_create([
+        RelatedPost(post_id=pk, related_id=other, score=score)
+        for pk, items in neighbours.items()
+        for other, score in items
+    ], batch_size=1000)
+
+
+def related_post_ids(post_id, limit=None):
+    """预计算的相关文章 id，按相似度从高到低"""
+    return list(
+        RelatedPost.objects.filter(post_id=post_id)
+        .order_by('-score', 'related_id')
+        .values_list('related_id', flat=True)[:limit or _count()]
+    )
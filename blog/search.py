@@ -0,0 +1,227 @@
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, ExpressionWrapper, F, FloatField, Value
+from .models import Post, SearchDocument, SearchPosting
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+# 标题中的词元按此倍数计入词频
+TITLE_WEIGHT = 3
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 32
+
+STATS_CACHE_KEY = 'blog:search:stats'
+
+# 中日韩文字连续片段，或连续的字母数字
+TOKEN_RE = re.compile(
+    r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+|[a-z0-9]+'
+)
+
+
+def _is_cjk(run):
+    return not run[0].isascii()
+
+
+def tokenize(text):
+    """
+    分词（CJK 友好，不依赖词典）
+    - 英文、数字：按连续字母数字切分，转小写
+    - 中日韩文字：切成相邻两字的二元组（"全文检索" → 全文/文检/检索），
+      单个字的片段保留为单字
+    """
+    if not text:
+        return []
+    # NFKC 把全角字母数字转成半角
+    text = unicodedata.normalize('NFKC', text).lower()
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        run = match.group()
+        if _is_cjk(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run[:MAX_TERM_LENGTH])
+    return tokens
+
+
+def document_terms(post):
+    """统计文章的词频：标题加权，摘要、正文各计一次"""
+    counts = Counter(tokenize(post.excerpt))
+    counts.update(tokenize(post.content))
+    for term, tf in Counter(tokenize(post.title)).items():
+        counts[term] += tf * TITLE_WEIGHT
+    return counts
+
+
+def term_weight(tf, doc_length, avgdl):
+    """BM25 中与 idf 无关的词频部分"""
+    norm = 1 - B + B * doc_length / avgdl if avgdl else 1
+    return tf * (K1 + 1) / (tf + K1 * norm)
+
+
+def get_stats():
+    """索引统计：文档数 N 与平均文档长度 avgdl（短时间缓存）"""
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        stats = SearchDocument.objects.aggregate(total=Count('pk'), avgdl=Avg('length'))
+        stats = (stats['total'], stats['avgdl'] or 0)
+        cache.set(STATS_CACHE_KEY, stats, 60)
+    return stats
+
+
+def index_post(post):
+    """更新单篇文章的索引：已发布的文章写入，其他状态移出索引"""
+    index_posts([post])
+
+
+@transaction.atomic
+def index_posts(posts):
+    """批量更新索引：先整体删除旧记录，再批量写入已发布的文章"""
+    remove_posts([post.pk for post in posts])
+    published = [post for post in posts if post.status == 'published']
+    if not published:
+        return
+
+    _, avgdl = get_stats()
+    documents = []
+    postings = []
+    for post in published:
+        counts = document_terms(post)
+        length = sum(counts.values())
+        documents.append(SearchDocument(post_id=post.pk, length=length))
+        postings.extend(
+            SearchPosting(
+                term=term,
+                post_id=post.pk,
+                tf=tf,
+                doc_length=length,
+                weight=term_weight(tf, length, avgdl or length),
+            )
+            for term, tf in counts.items()
+        )
+    _write_batch(documents, postings)
+    cache.delete(STATS_CACHE_KEY)
+
+
+def remove_post(post_id):
+    remove_posts([post_id])
+
+
+def remove_posts(post_ids):
+    SearchPosting.objects.filter(post_id__in=post_ids).delete()
+    SearchDocument.objects.filter(post_id__in=post_ids).delete()
+    cache.delete(STATS_CACHE_KEY)
+
+
+def rebuild_index(chunk_size=500):
+    """
+    全量重建索引
+    按文章分批整篇替换索引，每批一个短事务：重建期间每篇文章读到的要么是旧记录、要么是新记录，
+    检索不会返回空结果；锁只覆盖当前批次，保存文章时同步更新索引不会长时间等待。
+    中途失败时已提交的批次保留、其余仍是旧索引，重新执行即可
+    最后清理已下线文章的残留记录，并按最终的 avgdl 分批重算全部权重
+    :return: 写入索引的文章数
+    """
+    total = 0
+    published = Post.objects.filter(status='published').order_by('id').values_list('id', flat=True)
+    last_id = 0
+    while True:
+        ids = list(published.filter(id__gt=last_id)[:chunk_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+        with transaction.atomic():
+            # 锁住本批文章：读取后被修改的文章等本批提交后再由保存信号更新索引，不会被旧内容覆盖
+            posts = list(
+                Post.objects.select_for_update()
+                .filter(pk__in=ids)
+                .only('id', 'status', 'title', 'excerpt', 'content')
+            )
+            index_posts(posts)
+        total += sum(post.status == 'published' for post in posts)
+
+    _remove_unpublished(chunk_size)
+    cache.delete(STATS_CACHE_KEY)
+    _reweight(chunk_size)
+    return total
+
+
+def _remove_unpublished(chunk_size):
+    """移除已不是发布状态的文章的索引（状态变化没有经过保存信号时会残留）"""
+    stale = list(
+        SearchDocument.objects.exclude(post__status='published').values_list('post_id', flat=True)
+    )
+    for start in range(0, len(stale), chunk_size):
+        with transaction.atomic():
+            post_ids = list(
+                Post.objects.select_for_update()
+                .filter(pk__in=stale[start:start + chunk_size])
+                .exclude(status='published')
+                .values_list('id', flat=True)
+            )
+            remove_posts(post_ids)
+
+
+def _reweight(chunk_size):
+    """按当前的 avgdl 重算权重，每次 UPDATE 只覆盖一段文章 id"""
+    _, avgdl = get_stats()
+    if not avgdl:
+        return
+    tf = F('tf')
+    norm = Value(1 - B) + Value(B) * F('doc_length') / Value(float(avgdl))
+    weight = ExpressionWrapper(tf * Value(K1 + 1) / (tf + Value(K1) * norm), output_field=FloatField())
+
+    documents = SearchDocument.objects.order_by('post_id').values_list('post_id', flat=True)
+    last_id = 0
+    while True:
+        ids = list(documents.filter(post_id__gt=last_id)[:chunk_size])
+        if not ids:
+            break
+        SearchPosting.objects.filter(post_id__gt=last_id, post_id__lte=ids[-1]).update(weight=weight)
+        last_id = ids[-1]
+
+
+def _write_batch(documents, postings):
+    with transaction.atomic():
+        SearchDocument.objects.bulk_create(documents, batch_size=1000)
+        SearchPosting.objects.bulk_create(postings, batch_size=2000)
+
+def search_post_ids(query):
+    """
+    BM25 检索，返回按相关度排序的文章 id 列表
+    每个词元只读取权重最高的 BLOG_SEARCH_MAX_POSTINGS 条倒排记录，
+    高频词的查询代价有上限
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+
+    total, _ = get_stats()
+    limit = getattr(settings, 'BLOG_SEARCH_MAX_POSTINGS', 2000)
+    scores = defaultdict(float)
+
+    for term in terms:
+        rows = list(
+            SearchPosting.objects.filter(term=term)
+            .order_by('-weight')
+            .values_list('post_id', 'weight')[:limit]
+        )
+        if not rows:
+            continue
+        # 截断时才需要单独统计文档频率
+        df = len(rows) if len(rows) < limit else SearchPosting.objects.filter(term=term).count()
+        # 统计缓存可能略旧，保证 N >= df，idf 不为负
+        total = max(total, df)
+        idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+        for post_id, weight in rows:
+            scores[post_id] += idf * weight
+
+    return sorted(scores, key=lambda pk: (-scores[pk], -pk))
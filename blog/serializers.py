@@ -1,13 +1,14 @@
 from rest_framework import serializers
+from common.serializers import SparseFieldsMixin
 from .models import Tag,Post
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """标签展示序列化器（只读）"""
     
     class Meta:
         model = Tag
-        fields = ['id', 'name', 'slug', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = ['id', 'name', 'slug', 'post_count', 'created_at']
+        read_only_fields = ['id', 'post_count', 'created_at']
 
 
 class TagCreateSerializer(serializers.ModelSerializer):
@@ -28,9 +29,19 @@ class TagCreateSerializer(serializers.ModelSerializer):
         return value
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """文章展示序列化器（只读）"""
     author = serializers.SerializerMethodField()  # 自定义字段，获取用户名
+
+    # ?fields= 下推到查询时，输出字段对应的列和关联
+    sparse_columns = {
+        'author': ['author__username'],
+        'tags': [],
+    }
+    sparse_relations = {
+        'author': ('select', 'author'),
+        'tags': ('prefetch', 'tags'),
+    }
     
     class Meta:
         model = Post
@@ -100,3 +111,26 @@ class PostCreateUpdateSerializer(serializers.ModelSerializer):
         if tags_data is not None:
             instance.tags.set(tags_data)
         return instance
+
+
+class PostBulkItemSerializer(PostCreateUpdateSerializer):
+    """
+    批量接口的单条文章校验
+    标签按视图预先取出的 id 集合校验，不再逐条查询数据库
+    """
+    id = serializers.IntegerField(required=False)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+
+    class Meta(PostCreateUpdateSerializer.Meta):
+        fields = ['id'] + PostCreateUpdateSerializer.Meta.fields
+
+    def validate_tags(self, value):
+        """验证标签存在，并去重"""
+        known = self.context['tag_ids']
+        missing = [pk for pk in value if pk not in known]
+        if missing:
+            raise serializers.ValidationError(f"标签不存在：{', '.join(map(str, missing))}")
+        return list(dict.fromkeys(value))
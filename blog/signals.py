@@ -0,0 +1,142 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from .caching import bump_generation
+from .models import Tag, Post, RelatedPost
+from .related import refill_related, update_related
+from .search import index_post
+from . import tag_counts, tag_index
+
+
+def invalidate_list_cache():
+    """
+    让列表响应缓存失效
+    立即 +1 保证本进程马上看到新数据；事务提交后再 +1，
+    丢弃提交前被其他请求用旧数据写入的缓存
+    """
+    bump_generation()
+    transaction.on_commit(bump_generation)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def on_post_or_tag_changed(sender, **kwargs):
+    invalidate_list_cache()
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def on_post_tags_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_list_cache()
+
+
+@receiver(post_save, sender=Post)
+def update_search_index(sender, instance, **kwargs):
+    # 已发布的文章写入倒排索引，其他状态移出；删除时由外键级联清理
+    index_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def update_related_posts(sender, instance, **kwargs):
+    # 依赖倒排索引找候选文章，需在 update_search_index 之后执行
+    update_related(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_related_referrers(sender, instance, **kwargs):
+    # 其他文章列表中指向本文的记录会被级联删除，记下这些文章，删除后重新计算它们的列表
+    instance._related_referrers = list(
+        RelatedPost.objects.filter(related_id=instance.pk).values_list('post_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def refill_related_referrers(sender, instance, **kwargs):
+    refill_related(getattr(instance, '_related_referrers', []))
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_status(sender, instance, **kwargs):
+    # 记录保存前的状态，用于判断发布 / 下线
+    if instance._state.adding:
+        instance._old_status = None
+    else:
+        instance._old_status = Post.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def sync_tags_on_save(sender, instance, created, **kwargs):
+    """文章状态变化时维护标签文章列表和标签文章数"""
+    # 新建文章还没有标签，标签关联由 m2m_changed 维护
+    if created:
+        return
+    tag_ids = list(instance.tags.values_list('id', flat=True))
+    was_published = getattr(instance, '_old_status', None) == 'published'
+    is_published = instance.status == 'published'
+
+    if was_published != is_published:
+        tag_index.invalidate(tag_ids)
+        tag_counts.adjust(tag_ids, 1 if is_published else -1)
+
+
+@receiver(pre_delete, sender=Post)
+def sync_tags_on_delete(sender, instance, **kwargs):
+    # 关系表的行会被级联删除，不会触发 m2m_changed，这里提前处理
+    tag_ids = list(instance.tags.values_list('id', flat=True))
+    tag_index.invalidate(tag_ids)
+    if instance.status == 'published':
+        tag_counts.adjust(tag_ids, -1)
+
+
+@receiver(post_delete, sender=Tag)
+def forget_deleted_tag(sender, instance, **kwargs):
+    tag_index.invalidate([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def sync_tags_on_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """维护标签 → 已发布文章列表，以及标签的已发布文章数"""
+    through = Post.tags.through
+    if not reverse:
+        # post.tags.add/remove/clear：instance 是文章，pk_set 是标签 id
+        published = instance.status == 'published'
+        if action == 'post_add' and published:
+            # add 的 pk_set 只包含真正新增的关联
+            tag_index.invalidate(pk_set)
+            tag_counts.adjust(pk_set, 1)
+        elif action == 'pre_remove':
+            # remove 的 pk_set 是请求删除的 id，可能包含本来就不存在的关联
+            instance._removed_tag_ids = list(
+                through.objects.filter(post_id=instance.pk, tag_id__in=pk_set)
+                .values_list('tag_id', flat=True)
+            )
+        elif action == 'post_remove':
+            tag_index.invalidate(pk_set)
+            if published:
+                tag_counts.adjust(getattr(instance, '_removed_tag_ids', []), -1)
+        elif action == 'pre_clear':
+            tag_ids = list(instance.tags.values_list('id', flat=True))
+            tag_index.invalidate(tag_ids)
+            if published:
+                tag_counts.adjust(tag_ids, -1)
+    else:
+        # tag.post_set.add/remove/clear：instance 是标签，pk_set 是文章 id
+        if action == 'post_add':
+            published = list(
+                Post.objects.filter(pk__in=pk_set, status='published').values_list('id', flat=True)
+            )
+            if published:
+                tag_index.invalidate([instance.pk])
+            tag_counts.adjust([instance.pk], len(published))
+        elif action == 'pre_remove':
+            instance._removed_post_count = through.objects.filter(
+                tag_id=instance.pk, post_id__in=pk_set, post__status='published'
+            ).count()
+        elif action == 'post_remove':
+            tag_index.invalidate([instance.pk])
+            tag_counts.adjust([instance.pk], -getattr(instance, '_removed_post_count', 0))
+        elif action == 'post_clear':
+            tag_index.invalidate([instance.pk])
+            Tag.objects.filter(pk=instance.pk).update(post_count=0)
@@ -0,0 +1,50 @@
+from collections import defaultdict
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from .models import Tag, Post
+
+
+def adjust(tag_ids, delta):
+    """给一组标签的已发布文章数加减 delta（不会减到负数）"""
+    if not tag_ids or not delta:
+        return
+    tags = Tag.objects.filter(pk__in=tag_ids)
+    if delta > 0:
+        tags.update(post_count=F('post_count') + delta)
+    else:
+        tags.update(post_count=Greatest(F('post_count') + delta, Value(0)))
+
+
+def adjust_many(deltas):
+    """
+    批量调整：{标签 id: 增量}
+    增量相同的标签合并成一条 UPDATE
+    """
+    by_delta = defaultdict(list)
+    for tag_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(tag_id)
+    for delta, tag_ids in by_delta.items():
+        adjust(tag_ids, delta)
+
+
+def reconcile(batch_size=500):
+    """
+    按关系表重新统计每个标签的已发布文章数，修正有偏差的标签
+    :return: 被修正的标签数
+    """
+    actual = dict(
+        Post.tags.through.objects
+        .filter(post__status='published')
+        .values('tag_id')
+        .annotate(total=Count('post_id'))
+        .values_list('tag_id', 'total')
+    )
+    changed = []
+    for tag in Tag.objects.only('id', 'post_count').iterator(chunk_size=batch_size):
+        expected = actual.get(tag.pk, 0)
+        if tag.post_count != expected:
+            tag.post_count = expected
+            changed.append(tag)
+    Tag.objects.bulk_update(changed, ['post_count'], batch_size=batch_size)
+    return len(changed)
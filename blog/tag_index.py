@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Tag, Post
+
+# 每个标签一份"已发布文章列表"，元素为 (created_at, id)，按 (created_at, id) 倒序，
+# 与文章列表接口的排序一致；列表存放在 default 缓存中，多个 worker 共享（见 blog.checks）
+# 列表是读时重建的缓存：变化时删除（见 invalidate），下次读取时用一次关系表查询重建
+KEY_PREFIX = 'blog:tag-posts'
+
+
+def _key(tag_id):
+    return f'{KEY_PREFIX}:{tag_id}'
+
+
+def _timeout():
+    return getattr(settings, 'BLOG_TAG_INDEX_TIMEOUT', 300)
+
+
+def _load(tag_id):
+    """从关系表重建某个标签的文章列表"""
+    entries = (
+        Post.tags.through.objects
+        .filter(tag_id=tag_id, post__status='published')
+        .order_by('-post__created_at', '-post_id')
+        .values_list('post__created_at', 'post_id')
+    )
+    return list(entries)
+
+
+def _get_entries(tag_ids):
+    """批量读取标签的文章列表，缓存缺失的标签从数据库重建"""
+    keys = {_key(tag_id): tag_id for tag_id in tag_ids}
+    cached = cache.get_many(list(keys))
+    result = {keys[key]: ids for key, ids in cached.items()}
+    missing = {}
+    for tag_id in tag_ids:
+        if tag_id not in result:
+            result[tag_id] = missing[_key(tag_id)] = _load(tag_id)
+    if missing:
+        cache.set_many(missing, _timeout())
+    return result
+
+
+def get_post_ids(tag_ids):
+    """:return: {标签 id: 按 (created_at, id) 倒序的文章 id 列表}"""
+    return {
+        tag_id: [post_id for _, post_id in entries]
+        for tag_id, entries in _get_entries(tag_ids).items()
+    }
+
+
+def invalidate(tag_ids):
+    """
+    标签的文章变化后删除其缓存列表，下次读取时从关系表重建
+    不在缓存中原地修改：读取-修改-写回不是原子操作，并发保存会互相覆盖
+    立即删除一次；事务提交后再删除一次，丢弃提交前被其他请求用旧数据重建的列表
+    """
+    keys = [_key(tag_id) for tag_id in tag_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def filter_post_ids(slugs, match_all=True):
+    """
+    按标签筛选已发布文章
+    :param slugs: 标签 slug 列表
+    :param match_all: True 为 AND（包含全部标签），False 为 OR（包含任一标签）
+    :return: 按 (created_at, id) 倒序的文章 id 列表
+    """
+    tag_ids = list(Tag.objects.filter(slug__in=slugs).values_list('id', flat=True))
+    if not tag_ids or (match_all and len(tag_ids) < len(set(slugs))):
+        # AND 模式下有不存在的标签，结果必为空
+        return []
+
+    lists = sorted(_get_entries(tag_ids).values(), key=len)
+    if match_all:
+        result = set(lists[0])
+        for ids in lists[1:]:
+            result.intersection_update(ids)
+            if not result:
+                break
+    else:
+        result = set()
+        for ids in lists:
+            result.update(ids)
+    return [post_id for _, post_id in sorted(result, reverse=True)]
@@ -1,9 +1,34 @@
 import json
-from django.test import TestCase
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+import numpy as np
+from scipy import sparse
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
-from .models import Tag, Post
+from .caching import bump_generation
+from .checks import check_shared_cache, check_view_count_cache
+from .models import Tag, Post, RelatedPost
+from .related import rebuild_related, related_post_ids, top_k, update_related_many, vectorize
+from .serializers import PostSerializer
+from .search import rebuild_index, search_post_ids, tokenize
+from .tag_index import get_post_ids
+from .view_counter import ViewCountBuffer, view_counter
 
 User = get_user_model()
 
@@ -69,11 +94,13 @@ class TagAPITest(APITestCase):
         self.assertIn('该标签已存在', response.data['error']['name'][0])
 
 
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
 class PostAPITest(APITestCase):
     """文章 API 测试"""
     
     def setUp(self):
         """每个测试前执行"""
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(
             username='testuser',
@@ -171,7 +198,10 @@ class PostAPITest(APITestCase):
         # 验证
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['post']['id'], self.post.id)
-        # 验证浏览量增加了
+        # 返回的浏览量包含尚未落库的增量
+        self.assertEqual(response.data['post']['view_count'], 11)
+        # 验证浏览量增加了（缓冲区写回后）
+        view_counter.flush()
         self.post.refresh_from_db()
         self.assertEqual(self.post.view_count, 11)  # 原来 10，访问后 +1
     
@@ -241,3 +271,891 @@ class PostAPITest(APITestCase):
         # 验证：返回 403
         self.assertEqual(response.status_code, 403)
         self.assertIn('无权修改他人的文章', response.data['message'])
+
+
+class PostCursorPaginationTest(APITestCase):
+    """文章列表游标分页测试"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.posts = [
+            Post.objects.create(
+                title=f'文章 {i}',
+                content='内容...',
+                excerpt='这是一篇测试文章的摘要',
+                author=self.user,
+                status='published'
+            )
+            for i in range(25)
+        ]
+        # 草稿不应出现在列表中
+        Post.objects.create(
+            title='草稿',
+            content='内容...',
+            excerpt='这是一篇草稿文章的摘要',
+            author=self.user,
+            status='draft'
+        )
+        # 让部分文章的创建时间相同，验证 id 能打破并列
+        same_time = self.posts[10].created_at
+        Post.objects.filter(pk__in=[p.pk for p in self.posts[8:13]]).update(created_at=same_time)
+
+    def test_walk_all_pages_forward_and_back(self):
+        """测试：游标翻页不重复、不遗漏，且可以向前翻回"""
+        response = self.client.get('/api/blog/posts/', {'cursor': '', 'page_size': 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['count'])
+        self.assertIsNone(response.data['previous'])
+
+        seen = []
+        pages = [response.data]
+        seen += [p['id'] for p in response.data['posts']]
+        while pages[-1]['next']:
+            response = self.client.get(pages[-1]['next'])
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            seen += [p['id'] for p in response.data['posts']]
+
+        expected = list(
+            Post.objects.filter(status='published')
+            .order_by('-created_at', '-id')
+            .values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        # 从最后一页向前翻，应回到第二页
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(
+            [p['id'] for p in response.data['posts']],
+            [p['id'] for p in pages[1]['posts']]
+        )
+
+    def test_count_only_when_requested(self):
+        """测试：with_count=true 时才返回总数"""
+        response = self.client.get('/api/blog/posts/', {'cursor': '', 'with_count': 'true'})
+        self.assertEqual(response.data['count'], 25)
+
+    def test_invalid_cursor(self):
+        """测试：无效游标返回 404"""
+        response = self.client.get('/api/blog/posts/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('无效的游标', response.data['message'])
+
+
+# 跨进程共享的缓存后端：文件缓存，不依赖外部服务
+VIEW_COUNT_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'views': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'blog-view-count-test'),
+    },
+}
+
+# 模拟一个 worker 进程：在共享缓存中累加浏览量后退出，不自行刷新
+VIEW_COUNT_WORKER = """
+import sys, django
+django.setup()
+from django.conf import settings
+settings.CACHES['views'] = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': sys.argv[1]}
+from blog.view_counter import ViewCountBuffer
+buffer = ViewCountBuffer('views')
+for pk in sys.argv[2:]:
+    buffer.incr(int(pk))
+"""
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0, BLOG_VIEW_COUNT_CACHE='views', CACHES=VIEW_COUNT_CACHES)
+class ViewCountBufferTest(TransactionTestCase):
+    """浏览量写合并缓冲区测试"""
+
+    def setUp(self):
+        cache.clear()
+        view_counter.cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.posts = [
+            Post.objects.create(
+                title=f'文章 {i}',
+                content='内容...',
+                excerpt='这是一篇测试文章的摘要',
+                author=self.user,
+                status='published',
+                view_count=5
+            )
+            for i in range(3)
+        ]
+
+    def test_detail_reads_do_not_write_database(self):
+        """测试：详情页访问只累加缓冲区，刷新后批量落库"""
+        post = self.posts[0]
+        for expected in (6, 7, 8):
+            response = self.client.get(f'/api/blog/posts/{post.id}/')
+            self.assertEqual(response.data['post']['view_count'], expected)
+
+        post.refresh_from_db()
+        self.assertEqual(post.view_count, 5)
+
+        call_command('flush_view_counts', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.view_count, 8)
+        self.assertEqual(view_counter.pending(post.id), 0)
+
+    def test_command_flushes_other_processes(self):
+        """测试：其他进程累加在共享缓存中的增量，由 flush_view_counts 命令写回"""
+        location = VIEW_COUNT_CACHES['views']['LOCATION']
+        env = dict(os.environ, BLOG_VIEW_COUNT_FLUSH_INTERVAL='0')
+        for worker in range(3):
+            pks = [str(self.posts[i % 3].id) for i in range(worker, worker + 10)]
+            subprocess.run([sys.executable, '-c', VIEW_COUNT_WORKER, location, *pks], env=env, check=True)
+
+        call_command('flush_view_counts', stdout=StringIO())
+        self.assertEqual(
+            sum(Post.objects.filter(pk__in=[p.id for p in self.posts]).values_list('view_count', flat=True)),
+            3 * 5 + 30
+        )
+
+    @override_settings(BLOG_VIEW_COUNT_CACHE='default')
+    def test_command_requires_shared_cache(self):
+        """测试：浏览量缓存是进程内缓存时命令报错，系统检查给出警告"""
+        with self.assertRaises(CommandError):
+            call_command('flush_view_counts', stdout=StringIO())
+        with override_settings(DEBUG=False):
+            self.assertEqual([w.id for w in check_view_count_cache(None)], ['blog.W002'])
+
+    @override_settings(BLOG_VIEW_COUNT_CACHE='default')
+    def test_no_increments_lost_across_buffers(self):
+        """测试：同一进程内多个缓冲区并发累加、交替刷新，增量不丢失（跨进程的原子性由 Redis 的 incr 保证）"""
+        workers = [ViewCountBuffer() for _ in range(4)]
+        per_worker = 200
+
+        def run(buffer):
+            for i in range(per_worker):
+                buffer.incr(self.posts[i % 3].id)
+                if i % 50 == 0:
+                    try:
+                        buffer.flush()
+                    except Exception:
+                        # 落库失败的增量会退回缓存，最后统一刷新
+                        pass
+
+        threads = [threading.Thread(target=run, args=(w,)) for w in workers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for w in workers:
+            w.flush(blocking=True)
+
+        total = sum(
+            Post.objects.filter(pk__in=[p.id for p in self.posts])
+            .values_list('view_count', flat=True)
+        )
+        self.assertEqual(total, 3 * 5 + len(workers) * per_worker)
+
+
+class ListResponseCacheTest(APITestCase):
+    """公开列表接口响应缓存测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.tag = Tag.objects.create(name='Python', slug='python')
+        self.post = Post.objects.create(
+            title='Django 入门',
+            content='内容...',
+            excerpt='Django 是 Python 的 Web 框架',
+            author=self.user,
+            status='published'
+        )
+
+    def test_repeat_requests_hit_cache(self):
+        """测试：相同查询（参数顺序不同）命中缓存"""
+        response = self.client.get('/api/blog/posts/?page_size=5&page=1')
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/blog/posts/?page_size=5')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(len(response.data['posts']), 1)
+
+    def test_edit_invalidates_cache(self):
+        """测试：文章修改、标签变更后不返回旧数据"""
+        self.client.get('/api/blog/posts/')
+
+        self.post.title = '新标题'
+        self.post.save()
+        response = self.client.get('/api/blog/posts/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['posts'][0]['title'], '新标题')
+
+        self.post.tags.add(self.tag)
+        response = self.client.get('/api/blog/posts/')
+        self.assertEqual(response.data['posts'][0]['tags'], [self.tag.id])
+
+    def test_tag_list_invalidated_on_create(self):
+        """测试：新建标签后标签列表缓存失效"""
+        self.client.get('/api/blog/tags/')
+        self.assertEqual(self.client.get('/api/blog/tags/')['X-Cache'], 'HIT')
+
+        Tag.objects.create(name='Django', slug='django')
+        response = self.client.get('/api/blog/tags/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['tags']), 2)
+
+    def test_warns_without_shared_cache(self):
+        """测试：非调试模式下 default 是进程内缓存时，系统检查给出警告"""
+        with override_settings(DEBUG=False):
+            self.assertEqual([w.id for w in check_shared_cache(None)], ['blog.W001'])
+            with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/blog-cache',
+            }}):
+                self.assertEqual(check_shared_cache(None), [])
+
+
+class PostFragmentCacheTest(APITestCase):
+    """文章 JSON 片段缓存测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.tag = Tag.objects.create(name='Python', slug='python')
+        for i in range(3):
+            post = Post.objects.create(
+                title=f'文章 {i}',
+                content='内容...',
+                excerpt='这是一篇测试文章的摘要',
+                author=self.user,
+                status='published'
+            )
+            post.tags.add(self.tag)
+
+    def test_spliced_body_matches_serializer(self):
+        """测试：拼接出的响应体与直接渲染完全一致"""
+        response = self.client.get('/api/blog/posts/')
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+        posts = Post.objects.select_related('author').prefetch_related('tags').order_by('-created_at')
+        self.assertEqual(response.json()['posts'], json.loads(JSONRenderer().render(PostSerializer(posts, many=True).data)))
+
+    def test_fragments_reused_across_queries(self):
+        """测试：不同的列表查询复用同一份文章片段，变更过的文章重新序列化"""
+        self.client.get('/api/blog/posts/')
+        keys = set(cache._cache)
+
+        # page_size 不同，响应缓存未命中，但文章片段全部命中
+        self.client.get('/api/blog/posts/?page_size=5')
+        new_keys = {key for key in set(cache._cache) - keys if 'post-json' in key}
+        self.assertEqual(new_keys, set())
+
+        Post.objects.filter(title='文章 0').update(view_count=7)
+        bump_generation()
+        response = self.client.get('/api/blog/posts/?fields=title,view_count')
+        self.assertEqual(response.json()['posts'][-1], {'title': '文章 0', 'view_count': 7})
+
+    def test_browsable_api_still_renders(self):
+        """测试：非 JSON 渲染器回退到普通渲染"""
+        response = self.client.get('/api/blog/posts/', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '文章 0')
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
+class ConditionalGetTest(APITestCase):
+    """条件请求（ETag / Last-Modified → 304）测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        Tag.objects.create(name='Python', slug='python')
+        self.post = Post.objects.create(
+            title='Django 入门',
+            content='内容...',
+            excerpt='Django 是 Python 的 Web 框架',
+            author=self.user,
+            status='published'
+        )
+
+    def test_post_detail_not_modified(self):
+        """测试：ETag 匹配时返回 304，且仍然计入浏览量"""
+        url = f'/api/blog/posts/{self.post.id}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        view_counter.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 3)
+
+    def test_post_detail_modified(self):
+        """测试：文章更新后 ETag 失效，返回 200"""
+        url = f'/api/blog/posts/{self.post.id}/'
+        etag = self.client.get(url)['ETag']
+
+        self.post.title = '新标题'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_conditional_nonexistent_post(self):
+        """测试：条件请求不存在的文章返回 404"""
+        response = self.client.get('/api/blog/posts/99999/', HTTP_IF_NONE_MATCH='"x"')
+        self.assertEqual(response.status_code, 404)
+
+    def test_tag_list_not_modified(self):
+        """测试：标签列表未变化时返回 304，新增标签后返回 200"""
+        etag = self.client.get('/api/blog/tags/')['ETag']
+        response = self.client.get('/api/blog/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Tag.objects.create(name='Django', slug='django')
+        response = self.client.get('/api/blog/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['tags']), 2)
+
+
+class PostSearchTest(APITestCase):
+    """文章全文搜索测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.django_post = Post.objects.create(
+            title='Django 入门教程',
+            content='Django 是一个高级 Python Web 框架，鼓励快速开发。',
+            excerpt='从零开始学习 Django 框架',
+            author=self.user,
+            status='published'
+        )
+        self.python_post = Post.objects.create(
+            title='Python 数据分析',
+            content='使用 Python 进行数据分析，顺带提一句 Django。',
+            excerpt='介绍常用的数据分析工具',
+            author=self.user,
+            status='published'
+        )
+        self.draft = Post.objects.create(
+            title='Django 草稿',
+            content='还没写完的 Django 文章',
+            excerpt='这是一篇草稿文章的摘要',
+            author=self.user,
+            status='draft'
+        )
+
+    def test_tokenize_cjk(self):
+        """测试：中文切成二元组，英文转小写，全角转半角"""
+        self.assertEqual(tokenize('全文检索'), ['全文', '文检', '检索'])
+        self.assertEqual(tokenize('Django入门 ＡＰＩ'), ['django', '入门', 'api'])
+
+    def test_search_ranks_by_relevance(self):
+        """测试：标题命中的文章排在前面，草稿不出现"""
+        response = self.client.get('/api/blog/search/', {'q': 'django'})
+        self.assertEqual(response.status_code, 200)
+        ids = [p['id'] for p in response.data['posts']]
+        self.assertEqual(ids, [self.django_post.id, self.python_post.id])
+        self.assertEqual(response.data['count'], 2)
+
+    def test_search_chinese(self):
+        """测试：中文关键词检索"""
+        response = self.client.get('/api/blog/search/', {'q': '数据分析'})
+        self.assertEqual([p['id'] for p in response.data['posts']], [self.python_post.id])
+
+    def test_index_follows_post_changes(self):
+        """测试：发布、下线、删除文章时索引同步更新"""
+        self.draft.status = 'published'
+        self.draft.save()
+        self.assertIn(self.draft.id, search_post_ids('草稿'))
+
+        self.django_post.status = 'archived'
+        self.django_post.save()
+        self.assertNotIn(self.django_post.id, search_post_ids('入门'))
+
+        self.python_post.delete()
+        self.assertEqual(search_post_ids('数据分析'), [])
+
+    def test_rebuild_index(self):
+        """测试：全量重建后结果一致"""
+        before = search_post_ids('django')
+        self.assertEqual(rebuild_index(), 2)
+        self.assertEqual(search_post_ids('django'), before)
+
+    def test_rebuild_failure_keeps_index(self):
+        """测试：重建中途失败时已完成的批次保留，其余文章仍是旧索引，重新执行后结果一致"""
+        before = search_post_ids('django')
+        with patch('blog.search.document_terms', side_effect=[{'django': 1}, RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                rebuild_index(chunk_size=1)
+        self.assertEqual(set(search_post_ids('django')), set(before))
+
+        self.assertEqual(rebuild_index(chunk_size=1), 2)
+        self.assertEqual(search_post_ids('django'), before)
+
+    def test_rebuild_removes_unpublished(self):
+        """测试：重建时清理未经过保存信号下线的文章"""
+        Post.objects.filter(pk=self.python_post.pk).update(status='archived')
+        self.assertEqual(rebuild_index(chunk_size=1), 1)
+        self.assertEqual(search_post_ids('数据分析'), [])
+        self.assertEqual(search_post_ids('django'), [self.django_post.id])
+
+    def test_empty_query(self):
+        """测试：空关键词返回 400"""
+        response = self.client.get('/api/blog/search/', {'q': ' '})
+        self.assertEqual(response.status_code, 400)
+
+
+class RelatedPostTest(APITestCase):
+    """相关文章测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.ml = self.create('机器学习入门', '监督学习与神经网络的基本概念')
+        self.ml2 = self.create('机器学习实战', '用神经网络做图像分类')
+        self.cook = self.create('家常菜谱', '红烧肉的做法和火候')
+        self.cook2 = self.create('川菜菜谱', '麻婆豆腐的火候讲究')
+        self.other = self.create('旅行日记', '在云南骑行的一周')
+
+    def create(self, title, content, status='published'):
+        return Post.objects.create(
+            title=title, content=content, excerpt='这是一篇测试文章的摘要',
+            author=self.user, status=status
+        )
+
+    def test_vectorize(self):
+        """测试：向量归一化，只保留 idf 表中的词元和权重最高的若干个"""
+        vector = vectorize({'a': 4, 'b': 1, 'c': 1}, {'a': 1.0, 'b': 2.0})
+        self.assertEqual(set(vector), {'a', 'b'})
+        self.assertAlmostEqual(sum(w * w for w in vector.values()), 1, places=4)
+        with override_settings(BLOG_RELATED_MAX_TERMS=1):
+            self.assertEqual(set(vectorize({'a': 4, 'b': 1}, {'a': 1.0, 'b': 2.0})), {'a'})
+
+    def test_rebuild(self):
+        """测试：全量重建后相似的文章互为相关文章，自身不在列表中"""
+        total, written = rebuild_related()
+        self.assertEqual(total, 5)
+        self.assertGreater(written, 0)
+        self.assertEqual(related_post_ids(self.ml.id)[0], self.ml2.id)
+        self.assertEqual(related_post_ids(self.cook2.id)[0], self.cook.id)
+        self.assertNotIn(self.ml.id, related_post_ids(self.ml.id))
+
+        response = self.client.get(f'/api/blog/posts/{self.ml.id}/related/', {'fields': 'id,title'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['posts'][0], {'id': self.ml2.id, 'title': '机器学习实战'})
+
+    @override_settings(BLOG_RELATED_COUNT=1, BLOG_RELATED_MAX_DF=0.5)
+    def test_delete_refills_lists(self):
+        """测试：删除文章后，列表中原先指向它的文章重新计算列表，不会变空"""
+        notes = self.create('机器学习笔记', '神经网络的训练技巧')
+        rebuild_related()
+        [top] = related_post_ids(self.ml.id)
+        remaining = ({self.ml2.id, notes.id} - {top}).pop()
+
+        Post.objects.get(pk=top).delete()
+        self.assertEqual(related_post_ids(self.ml.id), [remaining])
+
+    def test_incremental_update(self):
+        """测试：重建后新发布的文章增量加入，下线后从所有列表移除"""
+        rebuild_related()
+        post = self.create('机器学习笔记', '神经网络的训练技巧')
+        self.assertIn(related_post_ids(post.id)[0], (self.ml.id, self.ml2.id))
+        self.assertIn(post.id, related_post_ids(self.ml.id))
+
+        post.status = 'draft'
+        post.save()
+        self.assertEqual(related_post_ids(post.id), [])
+        self.assertFalse(RelatedPost.objects.filter(related_id=post.id).exists())
+
+    def test_edit_keeps_other_lists(self):
+        """测试：编辑文章只更新它在其他列表中的相似度，其他列表不会变短"""
+        rebuild_related()
+        sizes = {p.id: len(related_post_ids(p.id)) for p in Post.objects.all()}
+        self.ml.content = '监督学习与神经网络的基本概念和训练技巧'
+        self.ml.save()
+        self.assertEqual({p.id: len(related_post_ids(p.id)) for p in Post.objects.all()}, sizes)
+        self.assertEqual(related_post_ids(self.ml2.id)[0], self.ml.id)
+
+    def test_bulk_update_queries(self):
+        """测试：批量增量更新的查询次数与文章数无关"""
+        rebuild_related()
+        posts = list(Post.objects.order_by('id'))
+        counts = []
+        for batch in (posts[:2], posts):
+            with CaptureQueriesContext(connection) as ctx:
+                update_related_many(batch)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(related_post_ids(self.ml.id)[0], self.ml2.id)
+
+    def test_top_k_matches_dense(self):
+        """测试：稀疏 top-k 与稠密矩阵逐行排序的结果一致，每批行数受 TOP_K_CELLS 限制"""
+        rng = np.random.default_rng(0)
+        matrix = sparse.random(30, 50, density=0.2, format='csr', dtype=np.float32, random_state=rng)
+        dense = (matrix @ matrix.T).toarray()
+        np.fill_diagonal(dense, 0)
+        with patch('blog.related.TOP_K_CELLS', 60):
+            batches = list(top_k(matrix, 3))
+        self.assertEqual(len(batches), 15)
+        for start, neighbours, scores in batches:
+            for i in range(len(neighbours)):
+                expected = np.sort(dense[start + i])[::-1][:3]
+                np.testing.assert_allclose(scores[i], expected, rtol=1e-5)
+                np.testing.assert_allclose(dense[start + i][neighbours[i]][expected > 0], expected[expected > 0],
+                                           rtol=1e-5)
+
+    def test_keeps_count(self):
+        """测试：增量更新不超过每篇文章的相关文章数"""
+        with override_settings(BLOG_RELATED_COUNT=1):
+            rebuild_related()
+            self.create('机器学习笔记', '机器学习与神经网络的基本概念')
+            self.assertEqual(RelatedPost.objects.filter(post_id=self.ml.id).count(), 1)
+
+    def test_not_found(self):
+        """测试：文章不存在或未发布时返回 404"""
+        draft = self.create('草稿', '内容', status='draft')
+        self.assertEqual(self.client.get('/api/blog/posts/99999/related/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/blog/posts/{draft.id}/related/').status_code, 404)
+
+    def test_command(self):
+        """测试：重建命令"""
+        out = StringIO()
+        call_command('rebuild_related_posts', '--count', '2', stdout=out)
+        self.assertIn('5 篇文章', out.getvalue())
+        self.assertLessEqual(RelatedPost.objects.filter(post_id=self.ml.id).count(), 2)
+
+
+class PostTagFilterTest(APITestCase):
+    """按标签筛选文章测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.python = Tag.objects.create(name='Python', slug='python')
+        self.django = Tag.objects.create(name='Django', slug='django')
+        self.both = self.create_post('Django 入门', [self.python, self.django])
+        self.only_python = self.create_post('Python 基础', [self.python])
+        self.only_django = self.create_post('Django 部署', [self.django])
+
+    def create_post(self, title, tags, status='published'):
+        post = Post.objects.create(
+            title=title,
+            content='内容...',
+            excerpt='这是一篇测试文章的摘要',
+            author=self.user,
+            status=status
+        )
+        post.tags.set(tags)
+        return post
+
+    def get_ids(self, **params):
+        response = self.client.get('/api/blog/posts/', params)
+        self.assertEqual(response.status_code, 200)
+        return [p['id'] for p in response.data['posts']]
+
+    def test_and_or_semantics(self):
+        """测试：match=all 取交集，match=any 取并集"""
+        self.assertEqual(self.get_ids(tags='python,django'), [self.both.id])
+        self.assertEqual(
+            self.get_ids(tags='python,django', match='any'),
+            [self.only_django.id, self.only_python.id, self.both.id]
+        )
+        self.assertEqual(self.get_ids(tags='python,unknown'), [])
+
+    def test_same_order_as_post_list(self):
+        """测试：筛选结果与文章列表一样按 (created_at, id) 倒序，而不是按 id"""
+        now = timezone.now()
+        Post.objects.filter(pk=self.both.pk).update(created_at=now)
+        Post.objects.filter(pk__in=[self.only_python.pk, self.only_django.pk]).update(created_at=now - timedelta(days=1))
+        cache.clear()
+
+        expected = [self.both.id, self.only_django.id, self.only_python.id]
+        self.assertEqual(self.get_ids(), expected)
+        self.assertEqual(self.get_ids(tags='python,django', match='any'), expected)
+
+    def test_pagination_on_filtered_result(self):
+        """测试：筛选结果可以分页"""
+        response = self.client.get('/api/blog/posts/', {'tags': 'python', 'page_size': 1})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(len(response.data['posts']), 1)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_lists_invalidated_on_change(self):
+        """测试：标签增删、文章状态变化时删除缓存的列表，重新读取时从数据库重建"""
+        self.assertEqual(get_post_ids([self.python.id])[self.python.id], [self.only_python.id, self.both.id])
+
+        # 状态不变的保存不影响列表
+        self.both.title = '新标题'
+        self.both.save()
+        with self.assertNumQueries(0):
+            get_post_ids([self.python.id])
+
+        self.only_django.tags.add(self.python)
+        self.only_python.status = 'draft'
+        self.only_python.save()
+        self.both.tags.remove(self.python)
+        with self.assertNumQueries(1):
+            ids = get_post_ids([self.python.id])[self.python.id]
+        self.assertEqual(ids, [self.only_django.id])
+        with self.assertNumQueries(0):
+            get_post_ids([self.python.id])
+
+        self.only_django.delete()
+        self.assertEqual(self.get_ids(tags='python'), [])
+
+
+@override_settings(BLOG_VIEW_COUNT_FLUSH_INTERVAL=0)
+class SparseFieldsTest(APITestCase):
+    """稀疏字段集（?fields=）测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.tag = Tag.objects.create(name='Python', slug='python')
+        self.post = Post.objects.create(
+            title='Django 入门',
+            content='很长的正文' * 100,
+            excerpt='Django 是 Python 的 Web 框架',
+            author=self.user,
+            status='published'
+        )
+        self.post.tags.add(self.tag)
+
+    def test_list_fields_trim_output_and_query(self):
+        """测试：只返回指定字段，且不查询正文、不预取标签"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/blog/posts/', {'fields': 'id,title,author,bogus'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['posts'][0]), {'id', 'title', 'author'})
+        self.assertEqual(response.data['posts'][0]['author'], 'testuser')
+
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('"content"', sql)
+        self.assertNotIn('"excerpt"', sql)
+        self.assertNotIn('blog_post_tags', sql)
+
+    def test_list_never_loads_content(self):
+        """测试：不传 fields 时输出全部字段，但也不查询正文"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/blog/posts/')
+        self.assertIn('tags', response.data['posts'][0])
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('"content"', sql)
+
+    def test_detail_fields(self):
+        """测试：详情接口支持 fields，浏览量照常累加"""
+        response = self.client.get(f'/api/blog/posts/{self.post.id}/', {'fields': 'id,view_count'})
+        self.assertEqual(response.data['post'], {'id': self.post.id, 'view_count': 1})
+
+    def test_tag_list_fields(self):
+        """测试：标签列表支持 fields"""
+        response = self.client.get('/api/blog/tags/', {'fields': 'name'})
+        self.assertEqual(response.data['tags'], [{'name': 'Python'}])
+
+
+class TagPostCountTest(APITestCase):
+    """标签已发布文章数与标签云测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.python = Tag.objects.create(name='Python', slug='python')
+        self.django = Tag.objects.create(name='Django', slug='django')
+        self.empty = Tag.objects.create(name='Go', slug='go')
+
+    def create_post(self, tags, status='published'):
+        post = Post.objects.create(
+            title='标题',
+            content='内容...',
+            excerpt='这是一篇测试文章的摘要',
+            author=self.user,
+            status=status
+        )
+        post.tags.set(tags)
+        return post
+
+    def counts(self):
+        return dict(Tag.objects.values_list('slug', 'post_count'))
+
+    def test_counts_follow_tags_and_status(self):
+        """测试：标签增删、发布/下线、删除时计数同步更新"""
+        first = self.create_post([self.python, self.django])
+        second = self.create_post([self.python])
+        draft = self.create_post([self.python], status='draft')
+        self.assertEqual(self.counts(), {'python': 2, 'django': 1, 'go': 0})
+
+        # 删除不存在的关联不影响计数
+        second.tags.remove(self.django)
+        first.tags.remove(self.django)
+        draft.status = 'published'
+        draft.save()
+        self.assertEqual(self.counts(), {'python': 3, 'django': 0, 'go': 0})
+
+        second.status = 'archived'
+        second.save()
+        first.delete()
+        self.django.post_set.add(draft)
+        self.assertEqual(self.counts(), {'python': 1, 'django': 1, 'go': 0})
+
+        self.python.post_set.clear()
+        self.assertEqual(self.counts(), {'python': 0, 'django': 1, 'go': 0})
+
+    def test_reconcile(self):
+        """测试：校正命令修正偏差"""
+        self.create_post([self.python])
+        Tag.objects.update(post_count=7)
+        call_command('reconcile_tag_counts', stdout=StringIO())
+        self.assertEqual(self.counts(), {'python': 1, 'django': 0, 'go': 0})
+
+    def test_tag_cloud(self):
+        """测试：标签云按热度分页，默认不返回空标签"""
+        self.create_post([self.python, self.django])
+        self.create_post([self.python])
+
+        response = self.client.get('/api/blog/tags/cloud/', {'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['tags'][0]['slug'], 'python')
+        self.assertEqual(response.data['tags'][0]['post_count'], 2)
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get('/api/blog/tags/cloud/', {'ordering': 'name', 'min_count': 0})
+        self.assertEqual([t['slug'] for t in response.data['tags']], ['django', 'go', 'python'])
+
+        response = self.client.get('/api/blog/tags/cloud/', {'ordering': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PostBulkAPITest(APITestCase):
+    """批量创建/更新文章测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.python = Tag.objects.create(name='Python', slug='python')
+        self.django = Tag.objects.create(name='Django', slug='django')
+        self.client.force_authenticate(user=self.user)
+
+    def item(self, title, **extra):
+        data = {
+            'title': title,
+            'content': f'{title} 的正文',
+            'excerpt': '这是一篇批量导入文章的摘要',
+            'status': 'published',
+        }
+        data.update(extra)
+        return data
+
+    def test_bulk_create_with_per_item_errors(self):
+        """测试：批量创建，失败条目单独报告，不影响其他条目"""
+        items = [
+            self.item('第一篇', tags=[self.python.id, self.django.id]),
+            self.item('', tags=[self.python.id]),
+            self.item('第三篇', tags=[99999]),
+            self.item('第四篇 Django', tags=[self.django.id], status='draft'),
+        ]
+        response = self.client.post('/api/blog/posts/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([e['index'] for e in response.data['errors']], [1, 2])
+        self.assertIn('title', response.data['errors'][0]['error'])
+
+        first = Post.objects.get(pk=response.data['results'][0]['id'])
+        self.assertEqual(first.author, self.user)
+        self.assertEqual(set(first.tags.values_list('id', flat=True)), {self.python.id, self.django.id})
+
+        # 信号之外的维护工作同样完成
+        self.assertEqual(dict(Tag.objects.values_list('slug', 'post_count')), {'python': 1, 'django': 1})
+        self.assertEqual(search_post_ids('第一篇'), [first.id])
+        self.assertEqual(
+            [p['id'] for p in self.client.get('/api/blog/posts/', {'tags': 'django'}).data['posts']],
+            [first.id]
+        )
+
+    def test_bulk_update(self):
+        """测试：带 id 的条目更新自己的文章，不能修改他人的文章"""
+        own = Post.objects.create(
+            title='旧标题', content='内容', excerpt='这是一篇测试文章的摘要',
+            author=self.user, status='draft'
+        )
+        others = Post.objects.create(
+            title='别人的', content='内容', excerpt='这是一篇测试文章的摘要',
+            author=self.other_user, status='draft'
+        )
+        items = [
+            {'id': own.id, 'title': '新标题', 'status': 'published', 'tags': [self.python.id]},
+            {'id': others.id, 'title': '恶意修改'},
+            {'id': 99999, 'title': '不存在'},
+        ]
+        response = self.client.post('/api/blog/posts/bulk/', {'posts': items}, format='json')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([e['error'] for e in response.data['errors']], ['无权修改他人的文章', '文章不存在'])
+
+        own.refresh_from_db()
+        self.assertEqual(own.title, '新标题')
+        self.assertGreater(own.updated_at, own.created_at)
+        self.assertEqual(Tag.objects.get(pk=self.python.id).post_count, 1)
+
+    def test_bulk_create_without_returning_ids(self):
+        """测试：数据库不能返回主键时（如 MySQL），同名文章也能对应到各自的主键"""
+        items = [
+            self.item('同名', content='第一篇正文', tags=[self.python.id]),
+            self.item('同名', content='第二篇正文', tags=[self.django.id]),
+        ]
+        with patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/blog/posts/bulk/', items, format='json')
+        self.assertEqual(response.data['created'], 2)
+        # 回查主键只扫描本次插入的主键范围（title 没有索引）
+        [lookup] = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and '"title" IN' in q['sql']]
+        self.assertIn('"id" >', lookup)
+
+        first, second = (Post.objects.get(pk=row['id']) for row in response.data['results'])
+        self.assertEqual((first.title, first.content), ('同名', '第一篇正文'))
+        self.assertEqual((second.title, second.content), ('同名', '第二篇正文'))
+        self.assertEqual(list(first.tags.values_list('id', flat=True)), [self.python.id])
+        self.assertEqual(list(second.tags.values_list('id', flat=True)), [self.django.id])
+
+    def test_bulk_requires_auth(self):
+        """测试：未登录不能批量提交"""
+        self.client.force_authenticate(user=None)
+        response = self.client.post('/api/blog/posts/bulk/', [self.item('标题')], format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+class TagPostCountMigrationTest(TransactionTestCase):
+    """post_count 字段迁移测试"""
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_backfills_existing_tags(self):
+        """测试：添加字段时按已有的已发布文章回填标签文章数"""
+        before = [('blog', '0003_search_index')]
+        apps = self.migrate(before)
+        user = apps.get_model('auth', 'User').objects.create(username='testuser')
+        OldTag, OldPost = apps.get_model('blog', 'Tag'), apps.get_model('blog', 'Post')
+        python = OldTag.objects.create(name='Python', slug='python')
+        django = OldTag.objects.create(name='Django', slug='django')
+        OldTag.objects.create(name='Go', slug='go')
+        for status in ('published', 'published', 'draft'):
+            post = OldPost.objects.create(title='文章', content='正文', excerpt='摘要', author=user, status=status)
+            post.tags.add(python, *([django] if status == 'draft' else []))
+
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        self.assertEqual(dict(Tag.objects.values_list('slug', 'post_count')), {'python': 2, 'django': 0, 'go': 0})
+
@@ -1,13 +1,27 @@
 from django.urls import path
-from .views import TagListAPIView, PostListView, PostDetailView
+from .views import (
+    TagListAPIView,
+    TagCloudView,
+    PostListView,
+    PostBulkView,
+    PostDetailView,
+    PostSearchView,
+    PostRelatedView,
+)
 
 app_name = 'blog'
 
 urlpatterns = [
     # 标签相关路由
     path('tags/', TagListAPIView.as_view(), name='tag-list'),
+    path('tags/cloud/', TagCloudView.as_view(), name='tag-cloud'),
     
     # 文章相关路由
     path('posts/', PostListView.as_view(), name='post-list'),
+    path('posts/bulk/', PostBulkView.as_view(), name='post-bulk'),
     path('posts/<int:pk>/', PostDetailView.as_view(), name='post-detail'),
+    path('posts/<int:pk>/related/', PostRelatedView.as_view(), name='post-related'),
+
+    # 全文搜索
+    path('search/', PostSearchView.as_view(), name='post-search'),
 ]
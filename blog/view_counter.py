@@ -0,0 +1,187 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCountBuffer:
+    """
+    文章浏览量写合并缓冲区
+
+    详情页每次访问只在缓存里做一次原子 incr，由后台线程按间隔把
+    累积的增量合并成批量 UPDATE 写回数据库，避免热门文章的行锁竞争。
+
+    - 计数存放在 BLOG_VIEW_COUNT_CACHE 指定的缓存中；多进程部署时
+      配置为共享缓存（Redis/Memcached），所有 worker 共用同一份增量
+    - 刷新时先用 decr 扣减"已认领"的增量再落库，刷新期间的新访问
+      不会丢失；落库失败时把增量加回缓存
+    - 跨进程的刷新通过缓存锁互斥，同一时刻只有一个刷新者
+    """
+    key_prefix = 'blog:views'
+    lock_timeout = 60
+
+    def __init__(self, cache_alias=None):
+        self.cache_alias = cache_alias
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._atexit_registered = False
+
+    @property
+    def cache(self):
+        alias = self.cache_alias or getattr(settings, 'BLOG_VIEW_COUNT_CACHE', 'default')
+        return caches[alias]
+
+    def _key(self, pk):
+        return f'{self.key_prefix}:{pk}'
+
+    def incr(self, pk, delta=1):
+        """
+        记录浏览量增量
+        :return: 该文章当前尚未落库的增量
+        """
+        cache = self.cache
+        key = self._key(pk)
+        cache.add(key, 0, timeout=None)
+        try:
+            value = cache.incr(key, delta)
+        except ValueError:
+            # 键在 add 和 incr 之间被淘汰，重新写入
+            if cache.add(key, delta, timeout=None):
+                value = delta
+            else:
+                value = cache.incr(key, delta)
+
+        with self._lock:
+            self._dirty.add(pk)
+        self._ensure_flusher()
+        return value
+
+    def pending(self, pk):
+        """获取文章尚未落库的浏览量增量"""
+        return self.cache.get(self._key(pk)) or 0
+
+    def flush(self, pks=None, blocking=False):
+        """
+        把缓冲的增量批量写入数据库
+        :param pks: 要刷新的文章 id；默认为本进程记录过的文章
+        :param blocking: 其他进程正在刷新时是否等待
+        :return: 本次写入的文章数
+        """
+        with self._lock:
+            if pks is None:
+                pks, self._dirty = self._dirty, set()
+            else:
+                pks = set(pks)
+                self._dirty -= pks
+        if not pks:
+            return 0
+
+        cache = self.cache
+        if not self._acquire(cache, blocking):
+            # 其他进程正在刷新，留到下一轮
+            with self._lock:
+                self._dirty |= pks
+            return 0
+
+        try:
+            claimed = self._claim(cache, pks)
+            if claimed:
+                self._apply(cache, claimed)
+            return len(claimed)
+        finally:
+            cache.delete(f'{self.key_prefix}:flush-lock')
+
+    def _acquire(self, cache, blocking):
+        lock_key = f'{self.key_prefix}:flush-lock'
+        deadline = time.monotonic() + self.lock_timeout
+        while not cache.add(lock_key, 1, timeout=self.lock_timeout):
+            if not blocking or time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _claim(self, cache, pks):
+        """从缓存中认领增量：读取后按读到的值 decr，期间的新增量保留在缓存里"""
+        keys = {self._key(pk): pk for pk in pks}
+        claimed = {}
+        for key, value in cache.get_many(list(keys)).items():
+            if not value or value <= 0:
+                continue
+            try:
+                cache.decr(key, value)
+            except ValueError:
+                continue
+            claimed[keys[key]] = value
+        return claimed
+
+    def _apply(self, cache, claimed):
+        # 增量相同的文章合并成一条 UPDATE
+        by_delta = defaultdict(list)
+        for pk, delta in claimed.items():
+            by_delta[delta].append(pk)
+
+        try:
+            with transaction.atomic():
+                for delta, ids in by_delta.items():
+                    Post.objects.filter(pk__in=ids).update(view_count=F('view_count') + delta)
+        except Exception:
+            # 落库失败：把认领的增量还给缓存，下次再写
+            for pk, delta in claimed.items():
+                key = self._key(pk)
+                if not cache.add(key, delta, timeout=None):
+                    cache.incr(key, delta)
+            with self._lock:
+                self._dirty |= set(claimed)
+            raise
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        interval = getattr(settings, 'BLOG_VIEW_COUNT_FLUSH_INTERVAL', 5)
+        if interval <= 0:
+            # 不启动后台线程，由调用方或管理命令手动刷新
+            return
+
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(
+                target=self._run,
+                args=(interval,),
+                name='blog-view-count-flusher',
+                daemon=True,
+            )
+            self._flusher.start()
+            if not self._atexit_registered:
+                # 进程退出前把剩余增量写回
+                atexit.register(self._flush_at_exit)
+                self._atexit_registered = True
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('浏览量批量写入失败')
+            finally:
+                close_old_connections()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush(blocking=True)
+        except Exception:
+            logger.exception('退出前写入浏览量失败')
+
+
+# 进程级单例
+view_counter = ViewCountBuffer()
@@ -2,10 +2,27 @@ from rest_framework import status, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, NotFound
+from django.conf import settings
 from django.http import Http404
-from django.db.models import F
+from common.serializers import parse_fields
 from .models import Tag, Post
+from .bulk import bulk_save_posts
+from .caching import (
+    cache_list_response,
+    conditional_get,
+    is_conditional,
+    not_modified_response,
+    post_validators,
+    set_validators,
+    tag_list_validators,
+)
+from .fragments import fragment_list_response
+from .pagination import PostCursorPagination
+from .related import related_post_ids
+from .search import search_post_ids
+from .tag_index import filter_post_ids
+from .view_counter import view_counter
 from .serializers import (
     TagSerializer, 
     TagCreateSerializer, 
@@ -20,19 +37,50 @@ class PostPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+
+class TagPagination(PageNumberPagination):
+    """标签云分页器"""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+def post_list_queryset(fields=None):
+    """
+    文章列表查询
+    序列化器不输出 content，默认不取正文；传了 ?fields= 时只取需要的列
+    updated_at 是 JSON 片段缓存的版本号，始终需要
+    """
+    posts = Post.objects.select_related('author').prefetch_related('tags').defer('content')
+    return PostSerializer.project_queryset(posts, fields, always=('created_at', 'updated_at'))
+
+
+def posts_in_order(post_ids, fields=None):
+    """按给定 id 顺序取出已发布文章（用于先对 id 列表分页的场景）"""
+    posts = post_list_queryset(fields).filter(pk__in=post_ids, status='published')
+    posts = {post.pk: post for post in posts}
+    return [posts[pk] for pk in post_ids if pk in posts]
+
+
 class TagListAPIView(APIView):
     """标签列表视图 - 获取所有标签 / 创建新标签"""
 
     permission_classes = []  # 覆盖全局权限，手动处理认证
+
+    @conditional_get(tag_list_validators)
+    @cache_list_response('tags')
     def get(self,request):
         """
         GET /api/blog/tags/
         获取所有标签列表（公开访问）
+        支持 ?fields=id,name 只返回部分字段
         """
         try:
+            fields = parse_fields(request, TagSerializer)
             tags = Tag.objects.all().order_by('-created_at')
+            tags = TagSerializer.project_queryset(tags, fields)
             # many=True：序列化多个对象（QuerySet）
-            serializer = TagSerializer(tags, many=True)
+            serializer = TagSerializer(tags, many=True, fields=fields)
             return Response({
                 'message': '获取标签列表成功',
                 'tags':serializer.data, 
@@ -71,34 +119,135 @@ class TagListAPIView(APIView):
         },status=status.HTTP_201_CREATED)
     
 
+class TagCloudView(APIView):
+    """标签云视图 - 按热度分页获取标签"""
+
+    permission_classes = []  # 公开访问
+
+    # 允许的排序方式；并列时按 id 保证分页稳定
+    ORDERINGS = {
+        '-post_count': ('-post_count', 'id'),
+        'post_count': ('post_count', 'id'),
+        'name': ('name',),
+        '-name': ('-name',),
+        '-created_at': ('-created_at', '-id'),
+        'created_at': ('created_at', 'id'),
+    }
+
+    @cache_list_response('tag-cloud')
+    def get(self, request):
+        """
+        GET /api/blog/tags/cloud/?ordering=-post_count&min_count=1
+        分页获取标签及其已发布文章数（公开访问）
+        默认按文章数从多到少排序，只返回至少有 1 篇已发布文章的标签
+        """
+        ordering = request.query_params.get('ordering', '-post_count')
+        if ordering not in self.ORDERINGS:
+            return Response({
+                'message': f"排序方式必须是以下之一：{', '.join(self.ORDERINGS)}"
+            },status=status.HTTP_400_BAD_REQUEST)
+        try:
+            min_count = int(request.query_params.get('min_count', 1))
+        except ValueError:
+            return Response({
+                'message': 'min_count 必须是整数'
+            },status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            fields = parse_fields(request, TagSerializer)
+            tags = Tag.objects.filter(post_count__gte=min_count).order_by(*self.ORDERINGS[ordering])
+            tags = TagSerializer.project_queryset(tags, fields)
+
+            paginator = TagPagination()
+            result_page = paginator.paginate_queryset(tags, request)
+            serializer = TagSerializer(result_page, many=True, fields=fields)
+            return Response({
+                'message': '获取标签列表成功',
+                'tags': serializer.data,
+                'count': paginator.page.paginator.count,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link()
+            })
+        except NotFound as e:
+            return Response({
+                'message': str(e.detail)
+            },status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response({
+                'message': '获取标签列表失败',
+                'error': str(e)
+            },status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class PostListView(APIView):
     """文章列表视图 - 获取文章列表 / 创建新文章"""
 
     permission_classes = []  # 覆盖全局权限，手动处理认证
+
+    @cache_list_response('posts')
     def get(self, request):
         """
         GET /api/blog/posts/
         分页获取已发布文章列表（公开访问）
+
+        传 cursor 参数（首页可为空：?cursor=）时切换为游标分页，
+        不统计总数（除非 with_count=true），深分页与首页代价相同
+
+        按标签筛选：?tags=python,django&match=all|any
+        all（默认）要求包含全部标签，any 包含任一标签即可；
+        筛选走预计算的标签文章列表，使用页码分页
+
+        稀疏字段：?fields=id,title,author 只返回并只查询需要的字段
         """
 
         try:
-            # 只返回已发布的文章
-            posts = Post.objects.filter(status='published').order_by('-created_at')
+            fields = parse_fields(request, PostSerializer)
+            tags = [slug.strip() for slug in request.query_params.get('tags', '').split(',') if slug.strip()]
+            if tags:
+                match_all = request.query_params.get('match', 'all') != 'any'
+                post_ids = filter_post_ids(tags, match_all=match_all)
+
+                paginator = PostPagination()
+                page_ids = paginator.paginate_queryset(post_ids, request)
+                return fragment_list_response({
+                    'message': '获取文章列表成功',
+                    'posts': None,
+                    'count': paginator.page.paginator.count,
+                    'next': paginator.get_next_link(),
+                    'previous': paginator.get_previous_link()
+                }, posts_in_order(page_ids, fields), fields)
 
-            posts = posts.select_related('author').prefetch_related("tags")
+            # 只返回已发布的文章
+            posts = post_list_queryset(fields).filter(status='published').order_by('-created_at', '-id')
+
+            if PostCursorPagination.cursor_query_param in request.query_params:
+                paginator = PostCursorPagination()
+                result_page = paginator.paginate_queryset(posts, request)
+                return fragment_list_response({
+                    'message': '获取文章列表成功',
+                    'posts': None,
+                    'count': paginator.count,
+                    'next': paginator.get_next_link(),
+                    'previous': paginator.get_previous_link()
+                }, result_page, fields)
 
             paginator = PostPagination()
             result_page = paginator.paginate_queryset(posts, request)
-            serializer = PostSerializer(result_page, many=True)
 
             # 构造符合测试期望的响应格式
-            return Response({
+            # 文章用缓存的 JSON 片段拼接，只有新增或变更过的文章才重新序列化
+            return fragment_list_response({
                 'message': '获取文章列表成功',
-                'posts': serializer.data,
+                'posts': None,
                 'count': paginator.page.paginator.count,
                 'next': paginator.get_next_link(),
                 'previous': paginator.get_previous_link()
-            })
+            }, result_page, fields)
+        except NotFound as e:
+            # 页码或游标无效
+            return Response({
+                'message': str(e.detail)
+            },status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({
                 'message': '获取文章列表失败',
@@ -131,6 +280,56 @@ class PostListView(APIView):
         },status=status.HTTP_201_CREATED)
     
 
+class PostBulkView(APIView):
+    """批量文章视图 - 一次请求批量创建/更新文章（编辑导入工具使用）"""
+
+    permission_classes = []  # 覆盖全局权限，手动处理认证
+
+    def post(self, request):
+        """
+        POST /api/blog/posts/bulk/
+        批量创建/更新文章（需要认证）
+
+        请求体：文章数组，或 {"posts": [...]}
+        - 不带 id：创建文章，作者为当前用户
+        - 带 id：部分更新自己的文章
+        单条校验失败不影响其他条目，失败原因按下标在 errors 中返回
+        """
+
+        if not request.user.is_authenticated:
+            return Response({
+                'message': '请先登录'
+            },status=status.HTTP_401_UNAUTHORIZED)
+
+        items = request.data.get('posts') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({
+                'message': '请提交文章列表'
+            },status=status.HTTP_400_BAD_REQUEST)
+
+        max_items = getattr(settings, 'BLOG_BULK_MAX_ITEMS', 1000)
+        if len(items) > max_items:
+            return Response({
+                'message': f'单次最多提交 {max_items} 篇文章'
+            },status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results, errors = bulk_save_posts(request.user, items)
+        except Exception as e:
+            return Response({
+                'message': '批量保存失败',
+                'error': str(e)
+            },status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({
+            'message': '批量保存完成' if results else '批量保存失败',
+            'created': sum(1 for row in results if row['action'] == 'created'),
+            'updated': sum(1 for row in results if row['action'] == 'updated'),
+            'results': results,
+            'errors': errors
+        },status=status.HTTP_200_OK if results else status.HTTP_400_BAD_REQUEST)
+
+
 class PostDetailView(APIView):
     """文章详情视图 - 获取/更新/删除文章"""
 
@@ -138,9 +337,16 @@ class PostDetailView(APIView):
     permission_classes = []  # 覆盖全局权限，手动处理认证
 
 
-    def get_object(self, pk):
+    def get_object(self, pk, fields=None):
+        """
+        获取文章；传入 fields 时只查询这些输出字段需要的列（只读场景）
+        """
+        queryset = Post.objects.select_related('author').prefetch_related('tags')
+        if fields is not None:
+            # 浏览量和校验值始终需要
+            queryset = PostSerializer.project_queryset(queryset, fields, always=('view_count', 'updated_at'))
         try:
-            return Post.objects.select_related('author').prefetch_related('tags').get(pk=pk)
+            return queryset.get(pk=pk)
         except Post.DoesNotExist:
             raise Http404('文章不存在')
 
@@ -154,21 +360,37 @@ class PostDetailView(APIView):
         """
         GET /api/blog/posts/{id}/
         获取文章详情（公开访问，自动增加浏览量）
+        支持 If-None-Match / If-Modified-Since，文章未修改时返回 304
+        支持 ?fields= 只返回部分字段
         """
 
         try:
-            post = self.get_object(pk)
-
-            # 使用 F() 表达式更新浏览量，避免竞态条件
-            # 使用 F()：在数据库层面完成增量，原子操作，避免并发请求覆盖
-            Post.objects.filter(pk=pk).update(view_count=F('view_count') + 1)
-            post.refresh_from_db()
-
-            serializer = PostSerializer(post)
-            return Response({
+            fields = parse_fields(request, PostSerializer)
+            if is_conditional(request):
+                # 条件请求：先用一条只取 updated_at 的查询判断是否需要返回正文
+                updated_at = Post.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+                if updated_at is None:
+                    raise Http404('文章不存在')
+                etag, last_modified = post_validators(pk, updated_at)
+                not_modified = not_modified_response(request, etag, last_modified)
+                if not_modified is not None:
+                    # 304 同样计一次浏览
+                    view_counter.incr(pk)
+                    return not_modified
+
+            # 只读取序列化器会输出的列（不取正文）
+            post = self.get_object(pk, fields or PostSerializer.Meta.fields)
+
+            # 浏览量先累加到缓冲区，由后台线程合并成批量 UPDATE 落库
+            # 返回值 = 已落库的浏览量 + 尚未落库的增量
+            post.view_count += view_counter.incr(post.pk)
+
+            serializer = PostSerializer(post, fields=fields)
+            response = Response({
                 'message': '获取文章详情成功',
                 'post': serializer.data
             },status=status.HTTP_200_OK)
+            return set_validators(response, *post_validators(post.pk, post.updated_at))
         
         except Http404 as e:
             return Response({
@@ -292,3 +514,75 @@ class PostDetailView(APIView):
                 'error':str(e)
             },status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+class PostSearchView(APIView):
+    """文章搜索视图 - 基于倒排索引的 BM25 全文检索"""
+
+    permission_classes = []  # 公开访问
+
+    def get(self, request):
+        """
+        GET /api/blog/search/?q=关键词
+        按相关度分页返回已发布文章（公开访问）
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({
+                'message': '搜索关键词不能为空'
+            },status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            fields = parse_fields(request, PostSerializer)
+            ranked_ids = search_post_ids(query)
+
+            # 先对 id 列表分页，只查询当前页的文章
+            paginator = PostPagination()
+            page_ids = paginator.paginate_queryset(ranked_ids, request)
+
+            return fragment_list_response({
+                'message': '搜索成功',
+                'posts': None,
+                'count': paginator.page.paginator.count,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link()
+            }, posts_in_order(page_ids, fields), fields)
+        except NotFound as e:
+            return Response({
+                'message': str(e.detail)
+            },status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response({
+                'message': '搜索失败',
+                'error': str(e)
+            },status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class PostRelatedView(APIView):
+    """相关文章视图 - 读取预计算的 TF-IDF 相似文章"""
+
+    permission_classes = []  # 公开访问
+
+    def get(self, request, pk):
+        """
+        GET /api/blog/posts/{id}/related/
+        按相似度返回相关的已发布文章（公开访问）
+        支持 ?fields= 只返回部分字段
+        """
+        try:
+            fields = parse_fields(request, PostSerializer)
+            if not Post.objects.filter(pk=pk, status='published').exists():
+                raise NotFound('文章不存在')
+
+            return fragment_list_response({
+                'message': '获取相关文章成功',
+                'posts': None,
+            }, posts_in_order(related_post_ids(pk), fields), fields)
+        except NotFound as e:
+            return Response({
+                'message': str(e.detail)
+            },status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            return Response({
+                'message': '获取相关文章失败',
+                'error': str(e)
+            },status=status.HTTP_500_INTERNAL_SERVER_ERROR)
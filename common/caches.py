@@ -0,0 +1,7 @@
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_process_local(cache):
+    """缓存是否只在当前进程内可见（进程内缓存、DummyCache），多个 worker 之间不共享"""
+    return isinstance(cache, (LocMemCache, DummyCache))
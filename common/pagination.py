@@ -0,0 +1,129 @@
+import base64
+import binascii
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    游标分页器（keyset 分页）基类
+
+    按 (time_field, id) 倒序做索引 seek，time_field 为 None 时只按 id：
+    - 不使用 OFFSET，第 1 页和第 5000 页的代价相同
+    - 默认不执行 COUNT(*)，传 with_count=true 时才统计总数
+    - next / previous 返回不透明的游标字符串
+    子类声明 time_field，并为 (过滤条件..., time_field, id) 建立联合索引
+    """
+    cursor_query_param = 'cursor'
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'with_count'
+    invalid_cursor_message = '无效的游标'
+
+    # 排序的时间字段，id 用来打破时间相同的并列
+    time_field = 'created_at'
+
+    @property
+    def ordering(self):
+        if self.time_field is None:
+            return ('-id',)
+        return (f'-{self.time_field}', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        # 只有显式要求时才统计总数（COUNT 需要扫描全部匹配行）
+        self.count = queryset.count() if self.wants_count(request) else None
+
+        if position is None:
+            queryset = queryset.order_by(*self.ordering)
+        elif reverse:
+            # 向前翻页：取比游标"更新"的记录，正序取出后再翻转
+            queryset = queryset.filter(self.seek(position, 'gt')).order_by(*(f[1:] for f in self.ordering))
+        else:
+            # 向后翻页：取比游标"更旧"的记录
+            queryset = queryset.filter(self.seek(position, 'lt')).order_by(*self.ordering)
+
+        # 多取一条用来判断是否还有下一页，避免额外的 COUNT
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_previous = has_more
+            self.has_next = position is not None
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = results
+        return results
+
+    def seek(self, position, op):
+        """游标之后（lt）或之前（gt）的记录条件"""
+        value, pk = position
+        if self.time_field is None:
+            return Q(**{f'id__{op}': pk})
+        return Q(**{f'{self.time_field}__{op}': value}) | Q(**{self.time_field: value, f'id__{op}': pk})
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size > 0:
+                return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def wants_count(self, request):
+        value = request.query_params.get(self.count_query_param, '')
+        return value.lower() in ('1', 'true', 'yes')
+
+    def decode_cursor(self, request):
+        """解析游标，返回 ((时间, id), reverse)；首页游标为空"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8')
+            data = json.loads(raw)
+            value = None if self.time_field is None else parse_datetime(data['t'])
+            pk = int(data['i'])
+            reverse = bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if self.time_field is not None and value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (value, pk), reverse
+
+    def encode_cursor(self, obj, reverse):
+        data = {'i': obj.pk}
+        if self.time_field is not None:
+            data['t'] = getattr(obj, self.time_field).isoformat()
+        if reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(data, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
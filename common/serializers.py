@@ -0,0 +1,58 @@
+# 各应用共用的序列化器工具
+
+def parse_fields(request, serializer_class):
+    """
+    解析 ?fields=id,title,author
+    只保留序列化器中存在的字段，未传或全部无效时返回 None（输出全部字段）
+    """
+    raw = request.query_params.get('fields', '')
+    allowed = serializer_class.Meta.fields
+    fields = [name for name in dict.fromkeys(part.strip() for part in raw.split(',')) if name in allowed]
+    return fields or None
+
+
+class SparseFieldsMixin:
+    """
+    稀疏字段集混入类：构造序列化器时传入 fields=[...]，只输出指定字段
+
+    子类可以声明：
+    - sparse_columns：输出字段 → 需要查询的模型列（未声明的字段按同名列处理）
+    - sparse_relations：输出字段 → ('select' | 'prefetch', 关系名)
+    配合 project_queryset 把字段裁剪下推到查询
+    """
+    sparse_columns = {}
+    sparse_relations = {}
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def project_queryset(cls, queryset, fields, always=()):
+        """
+        按输出字段裁剪查询：.only() 只取需要的列，
+        并去掉用不到的 select_related / prefetch_related
+        :param always: 视图自身需要的列（如游标分页用的 created_at）
+        """
+        if fields is None:
+            return queryset
+
+        columns = {queryset.model._meta.pk.name, *always}
+        select_related, prefetch_related = [], []
+        for name in fields:
+            columns.update(cls.sparse_columns.get(name, [name]))
+            kind, relation = cls.sparse_relations.get(name, (None, None))
+            if kind == 'select':
+                select_related.append(relation)
+            elif kind == 'prefetch':
+                prefetch_related.append(relation)
+
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset.only(*columns)
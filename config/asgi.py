@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
+
+通过 ASGI 部署时，AI 流式对话使用异步视图（一个进程可同时维持大量对话流）：
+    uvicorn config.asgi:application --workers 2
 """
 
 import os
@@ -12,5 +15,27 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# 需在加载 settings 之前设置
+os.environ.setdefault('AI_ASYNC_CHAT', '1')
+
+django_application = get_asgi_application()
+
+from ai.clients import aclose_clients  # noqa: E402  需在 Django 初始化之后导入
+
 
-application = get_asgi_application()
+async def application(scope, receive, send):
+    """
+    Django 不处理 ASGI lifespan 事件，这里接管：
+    进程退出前在事件循环中关闭异步 AI 客户端的连接池
+    """
+    if scope['type'] != 'lifespan':
+        await django_application(scope, receive, send)
+        return
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await aclose_clients()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -138,6 +138,24 @@ DATABASES = {
 }
 
 
+# 缓存：列表缓存代数、标签文章列表、浏览量增量、AI 配额计数都存放在缓存中，
+# 多进程部署（多个 gunicorn/uvicorn worker）时必须共享，配置 REDIS_URL 使用 Redis
+# 未配置时退回进程内缓存，只适合单进程开发（manage.py check 会给出警告）
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -183,3 +201,79 @@ MEDIA_ROOT = BASE_DIR / 'media'  # 上传文件的存储路径
 AI_API_KEY = os.getenv('AI_API_KEY', 'DASHSCOPE_API_KEY')
 AI_BASE_URL = os.getenv('AI_BASE_URL', 'https://dashscope.aliyuncs.com/compatible-mode/v1')
 AI_MODEL = os.getenv('AI_MODEL', 'qwen-turbo')
+# AI 客户端连接池：每个进程按 (地址, 密钥, 超时) 共用一个客户端
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv('AI_HTTP_MAX_CONNECTIONS', '100'))   # 最大连接数
+AI_HTTP_MAX_KEEPALIVE = int(os.getenv('AI_HTTP_MAX_KEEPALIVE', '20'))        # 最多保持的空闲连接数
+AI_HTTP_KEEPALIVE_EXPIRY = int(os.getenv('AI_HTTP_KEEPALIVE_EXPIRY', '60'))  # 空闲连接保持时间（秒）
+# 流式对话是否使用异步视图（config/asgi.py 中默认开启，WSGI 下保持关闭）
+AI_ASYNC_CHAT = os.getenv('AI_ASYNC_CHAT', '0') == '1'
+# 异步客户端的最大连接数：每个进行中的对话流占用一条连接
+AI_ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('AI_ASYNC_HTTP_MAX_CONNECTIONS', '1000'))
+# 流式对话的 SSE 帧合并：片段在窗口（毫秒）内或累计到指定字节数后合并成一帧发送，窗口为 0 表示不合并
+AI_SSE_COALESCE_MS = int(os.getenv('AI_SSE_COALESCE_MS', '30'))
+AI_SSE_COALESCE_BYTES = int(os.getenv('AI_SSE_COALESCE_BYTES', '1024'))
+# 上游长时间无输出时发送心跳注释的间隔（秒），防止代理断开空闲连接，0 表示不发送；
+# 同步视图发送心跳需要为每个流启动一个读取线程，代理没有空闲超时时设为 0 可省去这部分开销
+AI_SSE_HEARTBEAT = int(os.getenv('AI_SSE_HEARTBEAT', '15'))
+# 对话上下文：历史消息（含滚动摘要）的 token 预算，超出部分并入会话摘要
+AI_CHAT_CONTEXT_TOKENS = int(os.getenv('AI_CHAT_CONTEXT_TOKENS', '3000'))
+# 会话滚动摘要的最大字数
+AI_CHAT_SUMMARY_LENGTH = int(os.getenv('AI_CHAT_SUMMARY_LENGTH', '300'))
+# 文章摘要缓存：过期时间（秒）和最多保留的条目数（超出时淘汰最久未用的）
+AI_SUMMARY_CACHE_TTL = int(os.getenv('AI_SUMMARY_CACHE_TTL', str(7 * 24 * 3600)))
+AI_SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv('AI_SUMMARY_CACHE_MAX_ENTRIES', '10000'))
+# 平均每多少次写入淘汰一次摘要缓存（1 表示每次写入都淘汰）；也可定时执行 prune_summary_cache
+AI_SUMMARY_CACHE_PRUNE_EVERY = int(os.getenv('AI_SUMMARY_CACHE_PRUNE_EVERY', '100'))
+# 长文章分段摘要：超过该字数时按段落切分，各段并发概括后再合并
+AI_SUMMARY_CHUNK_SIZE = int(os.getenv('AI_SUMMARY_CHUNK_SIZE', '3000'))
+AI_SUMMARY_CHUNK_LENGTH = int(os.getenv('AI_SUMMARY_CHUNK_LENGTH', '300'))    # 每段概括的最大字数
+AI_SUMMARY_CONCURRENCY = int(os.getenv('AI_SUMMARY_CONCURRENCY', '4'))        # 进程内同时概括的分段数（所有文章合计）
+# 相同摘要请求的并发合并：锁过期时间（秒），需大于一次生成（含重试）的最长耗时；跨进程合并需要共享缓存（如 Redis）
+AI_SINGLEFLIGHT_TIMEOUT = int(os.getenv('AI_SINGLEFLIGHT_TIMEOUT', '120'))
+# 用户配额：按组配置每分钟请求数和每日 token 数，取 default 与用户所属各组中最宽松的值，0 表示不限
+# 管理员额外属于 staff；计数存放在 AI_QUOTA_CACHE 指定的缓存中，多进程部署时必须指向共享缓存（Redis，见 REDIS_URL）
+AI_QUOTAS = {
+    'default': {
+        'requests_per_minute': int(os.getenv('AI_QUOTA_REQUESTS_PER_MINUTE', '20')),
+        'tokens_per_day': int(os.getenv('AI_QUOTA_TOKENS_PER_DAY', '200000')),
+    },
+    'staff': {'requests_per_minute': 0, 'tokens_per_day': 0},
+}
+AI_QUOTA_CACHE = os.getenv('AI_QUOTA_CACHE', 'default')
+# 用量汇总：只汇总创建超过该秒数的调用日志，需大于写缓冲的刷新间隔和最长事务时间
+AI_USAGE_ROLLUP_LAG = int(os.getenv('AI_USAGE_ROLLUP_LAG', '60'))
+# AI 调用日志、对话消息的写缓冲：buffered 先排队再批量写入，sync 每条直接写库
+AI_WRITE_BEHIND_MODE = os.getenv('AI_WRITE_BEHIND_MODE', 'buffered')
+AI_WRITE_BEHIND_INTERVAL = int(os.getenv('AI_WRITE_BEHIND_INTERVAL', '1'))    # 后台刷新间隔（秒），0 表示不启动后台刷新
+AI_WRITE_BEHIND_MAX_SIZE = int(os.getenv('AI_WRITE_BEHIND_MAX_SIZE', '200'))  # 排队记录达到该数量时立即刷新
+AI_WRITE_BEHIND_MAX_QUEUE = int(os.getenv('AI_WRITE_BEHIND_MAX_QUEUE', '10000'))  # 队列长度上限，数据库不可用时超出的记录被丢弃
+# 延迟统计每个模型参与百分位计算的最多行数，超出时按 id 抽样
+AI_LATENCY_STATS_SAMPLES = int(os.getenv('AI_LATENCY_STATS_SAMPLES', '20000'))
+
+
+# 博客配置
+# 文章浏览量缓冲：计数先累加在缓存中，由后台线程按间隔（秒）批量写回数据库，0 表示不启动后台刷新
+BLOG_VIEW_COUNT_FLUSH_INTERVAL = int(os.getenv('BLOG_VIEW_COUNT_FLUSH_INTERVAL', '5'))
+# 存放浏览量增量的缓存，必须是各 worker 共享的缓存（配置 REDIS_URL 后 default 即为 Redis），
+# 进程内缓存下 flush_view_counts 命令无法使用，worker 退出前未刷新的增量会丢失
+BLOG_VIEW_COUNT_CACHE = os.getenv('BLOG_VIEW_COUNT_CACHE', 'default')
+# 公开列表接口（文章列表、标签列表）响应缓存的过期时间（秒）
+BLOG_RESPONSE_CACHE_TIMEOUT = int(os.getenv('BLOG_RESPONSE_CACHE_TIMEOUT', '300'))
+# 全文搜索：每个词元最多读取的倒排记录数（按 BM25 权重取前 N 条），控制高频词的查询代价
+BLOG_SEARCH_MAX_POSTINGS = int(os.getenv('BLOG_SEARCH_MAX_POSTINGS', '2000'))
+# 标签 → 已发布文章 id 列表的缓存时间（秒），标签的文章变化时删除，过期或删除后从数据库重建
+BLOG_TAG_INDEX_TIMEOUT = int(os.getenv('BLOG_TAG_INDEX_TIMEOUT', '300'))
+# 批量文章接口单次最多提交的文章数
+BLOG_BULK_MAX_ITEMS = int(os.getenv('BLOG_BULK_MAX_ITEMS', '1000'))
+# 文章列表中单篇文章 JSON 片段的缓存时间（秒），文章变更后缓存键随之变化
+BLOG_FRAGMENT_CACHE_TIMEOUT = int(os.getenv('BLOG_FRAGMENT_CACHE_TIMEOUT', '86400'))
+# 相关文章：每篇文章保留的相关文章数
+BLOG_RELATED_COUNT = int(os.getenv('BLOG_RELATED_COUNT', '10'))
+# 相关文章：每篇文章的 TF-IDF 向量只保留权重最高的 N 个词元
+BLOG_RELATED_MAX_TERMS = int(os.getenv('BLOG_RELATED_MAX_TERMS', '64'))
+# 相关文章：出现在超过该比例文章中的词元不参与计算
+BLOG_RELATED_MAX_DF = float(os.getenv('BLOG_RELATED_MAX_DF', '0.2'))
+# 相关文章：文章保存后增量更新时，从倒排索引取出的候选文章数
+BLOG_RELATED_CANDIDATES = int(os.getenv('BLOG_RELATED_CANDIDATES', '100'))
+# 相关文章：增量更新时每个词元最多读取的倒排记录数（按 BM25 权重取前 N 条），控制高频词的查询代价
+BLOG_RELATED_POSTINGS_PER_TERM = int(os.getenv('BLOG_RELATED_POSTINGS_PER_TERM', '200'))
@@ -1,13 +1,20 @@
 from rest_framework import serializers
+from common.serializers import SparseFieldsMixin
 from .models import Profile
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """个人资料序列化器 - 用于展示"""
 
     # 添加用户信息字段（只读）
     username = serializers.SerializerMethodField()
     email = serializers.SerializerMethodField()
 
+    # username / email 来自关联的用户，不需要查询资料表的列
+    sparse_columns = {
+        'username': [],
+        'email': [],
+    }
+
     class Meta:
         model = Profile
         fields = [
@@ -1,3 +1,35 @@
 from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from .models import Profile
+
+User = get_user_model()
 
 # Create your tests here.
+
+
+class ProfileSparseFieldsTest(TestCase):
+    """个人资料 ?fields= 测试"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        Profile.objects.create(user=self.user, nickname='小明', bio='简介' * 100)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_fields_trim_output(self):
+        """测试：只返回指定字段，用户名来自已认证用户"""
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/profiles/', {'fields': 'nickname,username'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['profile'], {'username': 'testuser', 'nickname': '小明'})
+
+    def test_without_fields(self):
+        """测试：不传 fields 返回全部字段"""
+        response = self.client.get('/api/profiles/')
+        self.assertIn('bio', response.data['profile'])
+        self.assertEqual(response.data['profile']['email'], 'test@example.com')
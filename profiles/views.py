@@ -4,6 +4,7 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from .models import Profile
 from .serializers import ProfileSerializer, ProfileUpdateSerializer
+from common.serializers import parse_fields
 
 # Create your views here.
 
@@ -12,10 +13,17 @@ class ProfileDetailView(APIView):
     permission_classes = [IsAuthenticated]  # 需要登录
 
     def get(self, request):
-        """获取个人资料"""
+        """
+        获取个人资料
+        支持 ?fields=nickname,avatar 只返回并只查询需要的字段
+        """
+        fields = parse_fields(request, ProfileSerializer)
+        profiles = ProfileSerializer.project_queryset(Profile.objects.all(), fields, always=('user',))
         # 确保用户有 Profile 对象
-        profile,created = Profile.objects.get_or_create(user=request.user)
-        serializer = ProfileSerializer(profile)
+        profile,created = profiles.get_or_create(user=request.user)
+        # 资料属于当前登录用户，直接复用已认证的用户对象，省去一次用户查询
+        profile.user = request.user
+        serializer = ProfileSerializer(profile, fields=fields)
         return Response({
             'message': '获取个人资料成功',
             'profile':serializer.data